@@ -0,0 +1,418 @@
+"""
+Cold tier for health_snapshots: old days as compressed columnar files.
+
+SnapshotMaintenance moves each raw daily partition here once it is
+`archive_after_days` old (and rolled up), then drops the partition, so the
+hot database only holds recent JSONB. The archive is a directory tree on
+local disk, partitioned by day and vehicle:
+
+    {root}/2024-05-01/VH001.col
+    {root}/2024-05-01/VH002.col
+    ...
+
+A .col file holds one vehicle's rows for one day, ordered by (created_at, id),
+as typed columns:
+
+    id                  int64
+    created_at          datetime64[us] (local time, as stored in the DB)
+    anomaly_score       float64
+    has_sensor_snapshot uint8 (sensor_snapshot was not NULL)
+    sub.<name>          float64 per subsystem, NaN where absent
+    sensor.<key>        float64 per numeric sensor, NaN where absent
+    extra               JSON lines of non-numeric sensor values (only if any)
+
+Rows are cut into row groups of ROW_GROUP_ROWS, and each column of each
+group is stored byte-shuffled and zlib-compressed. A JSON footer records the
+columns, their dtypes, and every group's time range and block offsets:
+
+    [blocks ...][footer JSON][footer length: u32][MAGIC]
+
+Readers memory-map the file and decompress only the blocks of the columns
+and row groups they ask for, so a history page touches one block of a few
+columns and training reads just the sensor columns it uses.
+
+A day is written to a temporary directory and renamed into place once every
+file is fsynced, so a day directory is either complete or absent. Masters
+sharing a database must share the archive directory too (history reads it);
+sharded masters default to one directory per shard.
+"""
+
+import datetime as dt
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import zlib
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+MAGIC = b"AURACOL1"
+TAIL = struct.Struct("<I")
+ROW_GROUP_ROWS = 8192
+SUFFIX = ".col"
+
+SUB_PREFIX = "sub."
+SENSOR_PREFIX = "sensor."
+
+HISTORY_COLUMNS = ("id", "created_at", "anomaly_score", SUB_PREFIX)
+
+
+def _jsonb_key(name: str):
+    # Postgres orders jsonb object keys by length, then bytes; match it so archived rows look the same
+    raw = name.encode()
+    return len(raw), raw
+
+
+def _shuffle(arr: np.ndarray) -> bytes:
+    """Bytes grouped by position within each value; floats compress much better this way."""
+    return arr.view(np.uint8).reshape(-1, arr.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(data: bytes, dtype: np.dtype) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+
+def _to_float(value) -> float | None:
+    """Numeric sensor values as float; None for anything else (kept in "extra")."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def _columns(rows: list[tuple]) -> dict[str, np.ndarray]:
+    """Typed columns for (id, created_at, anomaly_score, subsystems, sensor_snapshot) rows."""
+    n = len(rows)
+    cols = {
+        "id": np.fromiter((r[0] for r in rows), dtype="<i8", count=n),
+        "created_at": np.array([r[1] for r in rows], dtype="<M8[us]"),
+        "anomaly_score": np.fromiter((r[2] for r in rows), dtype="<f8", count=n),
+        "has_sensor_snapshot": np.fromiter((r[4] is not None for r in rows), dtype="u1", count=n),
+    }
+    subs: dict[str, np.ndarray] = {}
+    sensors: dict[str, np.ndarray] = {}
+    extra: list[dict] = [{} for _ in range(n)]
+    for i, (_, _, _, subsystems, snapshot) in enumerate(rows):
+        for name, value in (subsystems or {}).items():
+            if name not in subs:
+                subs[name] = np.full(n, np.nan)
+            subs[name][i] = value
+        for key, value in (snapshot or {}).items():
+            num = _to_float(value)
+            if num is None:
+                extra[i][key] = value
+                continue
+            if key not in sensors:
+                sensors[key] = np.full(n, np.nan)
+            sensors[key][i] = num
+    for name in sorted(subs, key=_jsonb_key):
+        cols[SUB_PREFIX + name] = subs[name]
+    for key in sorted(sensors):
+        cols[SENSOR_PREFIX + key] = sensors[key]
+    if any(extra):
+        cols["extra"] = extra
+    return cols
+
+
+def write_file(path: str, vehicle_id: str, day: dt.date, rows: list[tuple], fsync: bool = True) -> int:
+    """
+    Write one vehicle-day of rows, ordered by (created_at, id); returns bytes
+    written. Rows are (id, created_at, anomaly_score, subsystems, sensor_snapshot).
+    """
+    cols = _columns(rows)
+    groups = []
+    with open(path, "wb") as f:
+        for lo in range(0, len(rows), ROW_GROUP_ROWS):
+            hi = min(lo + ROW_GROUP_ROWS, len(rows))
+            blocks = {}
+            for name, col in cols.items():
+                if name == "extra":
+                    data = b"\n".join(json.dumps(e, separators=(",", ":")).encode() for e in col[lo:hi])
+                else:
+                    data = _shuffle(col[lo:hi])
+                block = zlib.compress(data, 6)
+                blocks[name] = [f.tell(), len(block)]
+                f.write(block)
+            created = cols["created_at"]
+            groups.append({
+                "rows": hi - lo,
+                "min_ts": int(created[lo].astype("<i8")),
+                "max_ts": int(created[hi - 1].astype("<i8")),
+                "blocks": blocks,
+            })
+        footer = json.dumps({
+            "vehicle_id": vehicle_id,
+            "day": day.isoformat(),
+            "rows": len(rows),
+            "codec": "zlib+shuffle",
+            "columns": {name: ("json" if name == "extra" else col.dtype.str) for name, col in cols.items()},
+            "row_groups": groups,
+        }).encode()
+        f.write(footer)
+        f.write(TAIL.pack(len(footer)))
+        f.write(MAGIC)
+        size = f.tell()
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return size
+
+
+class ColdFile:
+    """A memory-mapped .col file; use as a context manager or close() it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        if len(mm) < len(MAGIC) + TAIL.size or mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a cold archive file")
+        (footer_len,) = TAIL.unpack_from(mm, len(mm) - len(MAGIC) - TAIL.size)
+        footer_end = len(mm) - len(MAGIC) - TAIL.size
+        meta = json.loads(mm[footer_end - footer_len:footer_end])
+        self.vehicle_id: str = meta["vehicle_id"]
+        self.day = dt.date.fromisoformat(meta["day"])
+        self.rows: int = meta["rows"]
+        self.dtypes: dict[str, str] = meta["columns"]
+        self._groups: list[dict] = meta["row_groups"]
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.dtypes)
+
+    def subsystems(self) -> list[str]:
+        return [c[len(SUB_PREFIX):] for c in self.dtypes if c.startswith(SUB_PREFIX)]
+
+    def sensors(self) -> list[str]:
+        return [c[len(SENSOR_PREFIX):] for c in self.dtypes if c.startswith(SENSOR_PREFIX)]
+
+    def _block(self, group: dict, name: str):
+        offset, length = group["blocks"][name]
+        data = zlib.decompress(memoryview(self._mmap)[offset:offset + length])
+        if self.dtypes[name] == "json":
+            return [json.loads(line) for line in data.split(b"\n")]
+        return _unshuffle(data, np.dtype(self.dtypes[name]))
+
+    def _empty(self, name: str):
+        return [] if self.dtypes[name] == "json" else np.empty(0, dtype=self.dtypes[name])
+
+    def read(
+        self,
+        columns=None,
+        start: dt.datetime | None = None,
+        end: dt.datetime | None = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        `columns` (default: all) for rows with start <= created_at < end. A
+        name ending in "." selects every column with that prefix ("sub.");
+        other columns the file does not have come back as NaN. Only row
+        groups that overlap the range are decompressed.
+        """
+        if columns is None:
+            columns = self.columns
+        else:
+            columns = [
+                c for name in columns
+                for c in ([c for c in self.dtypes if c.startswith(name)] if name.endswith(".") else [name])
+            ]
+        lo = np.datetime64(start, "us").astype("<i8") if start is not None else None
+        hi = np.datetime64(end, "us").astype("<i8") if end is not None else None
+        groups = [
+            g for g in self._groups
+            if (lo is None or g["max_ts"] >= lo) and (hi is None or g["min_ts"] < hi)
+        ]
+        if lo is not None or hi is not None:
+            created = np.concatenate([self._block(g, "created_at") for g in groups]) if groups else np.empty(0, "<M8[us]")
+            ts = created.astype("<i8")
+            mask = np.ones(len(ts), dtype=bool)
+            if lo is not None:
+                mask &= ts >= lo
+            if hi is not None:
+                mask &= ts < hi
+        else:
+            mask = None
+
+        out = {}
+        for name in columns:
+            if name == "created_at" and mask is not None:
+                col = created
+            elif name not in self.dtypes:
+                col = np.full(sum(g["rows"] for g in groups), np.nan)
+            elif not groups:
+                col = self._empty(name)
+            elif self.dtypes[name] == "json":
+                col = [e for g in groups for e in self._block(g, name)]
+            else:
+                col = np.concatenate([self._block(g, name) for g in groups])
+            if mask is not None:
+                col = [e for e, keep in zip(col, mask) if keep] if isinstance(col, list) else col[mask]
+            out[name] = col
+        return out
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColdArchive:
+    def __init__(self, root: str, fsync: bool = True):
+        self.root = root
+        self.fsync = fsync
+
+    def _day_dir(self, day: dt.date) -> str:
+        return os.path.join(self.root, day.isoformat())
+
+    def _path(self, day: dt.date, vehicle_id: str) -> str:
+        # Vehicle ids become file names; quote anything that is not filename-safe
+        return os.path.join(self._day_dir(day), quote(vehicle_id, safe="") + SUFFIX)
+
+    def has_day(self, day: dt.date) -> bool:
+        return os.path.isdir(self._day_dir(day))
+
+    def days(self) -> list[dt.date]:
+        """Archived days, oldest first."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        out = []
+        for name in names:
+            try:
+                out.append(dt.date.fromisoformat(name))
+            except ValueError:
+                continue  # temporary directories of an unfinished write
+        return sorted(out)
+
+    def vehicles(self, day: dt.date) -> list[str]:
+        try:
+            names = os.listdir(self._day_dir(day))
+        except FileNotFoundError:
+            return []
+        return sorted(unquote(n[:-len(SUFFIX)]) for n in names if n.endswith(SUFFIX))
+
+    def open(self, day: dt.date, vehicle_id: str) -> ColdFile | None:
+        try:
+            return ColdFile(self._path(day, vehicle_id))
+        except FileNotFoundError:
+            return None
+
+    def _days_in(self, start: dt.datetime | None, end: dt.datetime | None) -> list[dt.date]:
+        if start is None or end is None:
+            return [
+                d for d in self.days()
+                if (start is None or d >= start.date()) and (end is None or dt.datetime.combine(d, dt.time()) < end)
+            ]
+        # Bounded ranges check just their own days instead of listing the archive
+        days, day = [], start.date()
+        while dt.datetime.combine(day, dt.time()) < end:
+            if self.has_day(day):
+                days.append(day)
+            day += dt.timedelta(days=1)
+        return days
+
+    def scan(
+        self,
+        start: dt.datetime | None = None,
+        end: dt.datetime | None = None,
+        vehicle_id: str | None = None,
+        columns=None,
+        newest_first: bool = False,
+    ):
+        """
+        Yield (day, vehicle_id, columns) for every archived file overlapping
+        [start, end), by day then vehicle; see ColdFile.read for `columns`.
+        """
+        days = self._days_in(start, end)
+        for day in reversed(days) if newest_first else days:
+            vehicles = [vehicle_id] if vehicle_id is not None else self.vehicles(day)
+            for vid in vehicles:
+                f = self.open(day, vid)
+                if f is None:
+                    continue
+                with f:
+                    yield day, vid, f.read(columns, start, end)
+
+    def write_day(self, day: dt.date, vehicle_rows) -> dict:
+        """
+        Archive one day from (vehicle_id, rows) pairs (see write_file) and
+        publish it atomically. Returns {"vehicles", "rows", "bytes"}.
+        """
+        final = self._day_dir(day)
+        tmp = os.path.join(self.root, f".{day.isoformat()}.tmp")
+        os.makedirs(self.root, exist_ok=True)
+        shutil.rmtree(tmp, ignore_errors=True)  # left over from an interrupted write
+        os.makedirs(tmp)
+        written = {"vehicles": 0, "rows": 0, "bytes": 0}
+        for vehicle_id, rows in vehicle_rows:
+            if not rows:
+                continue
+            path = os.path.join(tmp, quote(vehicle_id, safe="") + SUFFIX)
+            written["bytes"] += write_file(path, vehicle_id, day, rows, fsync=self.fsync)
+            written["vehicles"] += 1
+            written["rows"] += len(rows)
+        if self.fsync:
+            _fsync_dir(tmp)
+        os.rename(tmp, final)
+        if self.fsync:
+            _fsync_dir(self.root)
+        return written
+
+    def page(self, vehicle_id: str, start, end, before: tuple[dt.datetime, int] | None, limit: int) -> list[tuple]:
+        """
+        Up to `limit` rows older than `before` (created_at, id) within
+        [start, end), newest first, shaped like history's PAGE_SQL rows:
+        (id, anomaly_score, subsystems, created_at).
+        """
+        if before is not None:
+            # Rows at exactly the cursor's timestamp with a smaller id are older too
+            end = min(end, before[0] + dt.timedelta(microseconds=1)) if end is not None else before[0] + dt.timedelta(microseconds=1)
+        out: list[tuple] = []
+        for _, _, cols in self.scan(start, end, vehicle_id, HISTORY_COLUMNS, newest_first=True):
+            rows = rows_from_columns(cols)
+            if before is not None:
+                rows = [r for r in rows if (r[3], r[0]) < before]
+            out.extend(reversed(rows[-(limit - len(out)):]))
+            if len(out) >= limit:
+                break
+        return out
+
+    def series(self, vehicle_id: str, start, end) -> list[tuple]:
+        """Rows in [start, end), oldest first, as (id, anomaly_score, subsystems, created_at)."""
+        out: list[tuple] = []
+        for _, _, cols in self.scan(start, end, vehicle_id, HISTORY_COLUMNS):
+            out.extend(rows_from_columns(cols))
+        return out
+
+
+def rows_from_columns(cols: dict) -> list[tuple]:
+    """(id, anomaly_score, subsystems, created_at) rows from ColdFile.read() output."""
+    subs = [(name[len(SUB_PREFIX):], col.tolist()) for name, col in cols.items() if name.startswith(SUB_PREFIX)]
+    ids = cols["id"].tolist()
+    scores = cols["anomaly_score"].tolist()
+    created = cols["created_at"].astype(object)
+    return [
+        (
+            ids[i],
+            scores[i],
+            {name: values[i] for name, values in subs if not math.isnan(values[i])},
+            created[i],
+        )
+        for i in range(len(ids))
+    ]
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,47 @@
+"""
+Column-wise feature extraction for the data-agent scorers.
+
+Builds the ML feature matrix from a list of sensor dicts or from a binary
+wire-format matrix in one pass. Rule inputs are extracted by the compiled
+RuleSet (rule_engine.py).
+"""
+
+import numpy as np
+
+
+def build_feature_matrix(sensor_dicts: list[dict], feature_keys: list[str], return_mask: bool = False):
+    """
+    Build the (n, len(feature_keys)) float32 matrix used by the ML model.
+    With return_mask=True also return a boolean matrix of which sensors were sent.
+    """
+    X = np.zeros((len(sensor_dicts), len(feature_keys)), dtype=np.float32)
+    present = np.zeros(X.shape, dtype=bool)
+    for i, sensors in enumerate(sensor_dicts):
+        for j, key in enumerate(feature_keys):
+            val = sensors.get(key)
+            if val is not None:
+                X[i, j] = float(val)
+                present[i, j] = True
+    if return_mask:
+        return X, present
+    return X
+
+
+def select_columns(values: np.ndarray, fields: list[str], keys: list[str]) -> np.ndarray:
+    """Pick `keys` out of a wire-format matrix as float64; absent columns are NaN."""
+    index = {field: i for i, field in enumerate(fields)}
+    out = np.full((values.shape[0], len(keys)), np.nan)
+    for j, key in enumerate(keys):
+        if key in index:
+            out[:, j] = values[:, index[key]]
+    return out
+
+
+def feature_matrix_from_matrix(values: np.ndarray, fields: list[str], feature_keys: list[str]) -> np.ndarray:
+    """ML feature matrix from a wire-format matrix; missing (NaN) features become 0.0."""
+    index = {field: i for i, field in enumerate(fields)}
+    X = np.zeros((values.shape[0], len(feature_keys)), dtype=np.float32)
+    for j, key in enumerate(feature_keys):
+        if key in index:
+            X[:, j] = np.nan_to_num(values[:, index[key]], nan=0.0)
+    return X
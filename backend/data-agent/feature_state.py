@@ -0,0 +1,235 @@
+"""
+Per-vehicle rolling-window feature state.
+
+Each vehicle gets a slot in a set of preallocated NumPy arrays (grown by
+doubling as new vehicles appear):
+
+    ring    (capacity, window, n_features) float32  last `window` readings
+    wmax    (capacity, n_features) float32           max over the ring
+    ewma    (capacity, n_features) float64           exponentially weighted mean
+    last    (capacity, n_features) float64           previous value of each feature
+    roc     (capacity, n_features) float64           rate of change per second
+    last_ts (capacity, n_features) float64           when `last` was taken
+
+An update writes one ring row, blends the EWMA and computes the rate of change
+against the previous value: constant work per reading, no history queries.
+The rate of change uses each reading's own timestamp (epoch seconds, from the
+payload; arrival time when it has none), so readings a gateway buffered and
+sent together are still spaced correctly. The windowed max is kept
+incrementally; the ring is only rescanned when the value it evicts was the max
+and the new one is lower. Missing sensors are NaN; they leave the EWMA, the
+previous value and the windowed max untouched.
+
+A batch is applied in "rounds": round k updates the k-th reading of every
+vehicle in the batch at once, so vehicles are vectorized while repeated
+readings of the same vehicle are still applied in order.
+
+Slots are recycled: a vehicle not updated for `idle_ttl_s` seconds is dropped,
+and past `max_vehicles` the least recently updated vehicle makes room for a
+new one (unless every tracked vehicle is in the current batch). A dropped
+vehicle that comes back starts a fresh window. 0 disables either limit.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RollingFeatureState:
+    def __init__(
+        self,
+        feature_keys: list[str],
+        window: int = 30,
+        alpha: float = 0.2,
+        initial_capacity: int = 1024,
+        max_vehicles: int = 0,
+        idle_ttl_s: float = 0,
+    ):
+        self.feature_keys = list(feature_keys)
+        self.window = window
+        self.alpha = alpha
+        self.max_vehicles = max_vehicles
+        self.idle_ttl_s = idle_ttl_s
+        n_features = len(self.feature_keys)
+
+        # vehicle_id -> slot, least recently updated first
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        self._free: list[int] = []
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        # Counters for the status endpoint
+        self.evicted = 0
+        # When each slot was last updated (arrival time, not reading time)
+        self.seen = np.zeros(initial_capacity)
+        self.ring = np.full((initial_capacity, window, n_features), np.nan, dtype=np.float32)
+        self.wmax = np.full((initial_capacity, n_features), np.nan, dtype=np.float32)
+        self.pos = np.zeros(initial_capacity, dtype=np.int32)
+        self.count = np.zeros(initial_capacity, dtype=np.int64)
+        self.ewma = np.full((initial_capacity, n_features), np.nan)
+        self.last = np.full((initial_capacity, n_features), np.nan)
+        self.roc = np.full((initial_capacity, n_features), np.nan)
+        self.last_ts = np.full((initial_capacity, n_features), np.nan)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _grow(self, needed: int):
+        capacity = self.pos.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+
+        def grown(arr, fill):
+            out = np.full((new_capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            out[:capacity] = arr
+            return out
+
+        self.ring = grown(self.ring, np.nan)
+        self.wmax = grown(self.wmax, np.nan)
+        self.pos = grown(self.pos, 0)
+        self.count = grown(self.count, 0)
+        self.ewma = grown(self.ewma, np.nan)
+        self.last = grown(self.last, np.nan)
+        self.roc = grown(self.roc, np.nan)
+        self.last_ts = grown(self.last_ts, np.nan)
+        self.seen = grown(self.seen, 0.0)
+
+    def _evict(self, vid: str):
+        slot = self._slots.pop(vid)
+        self.ring[slot] = np.nan
+        self.wmax[slot] = np.nan
+        self.pos[slot] = 0
+        self.count[slot] = 0
+        self.ewma[slot] = np.nan
+        self.last[slot] = np.nan
+        self.roc[slot] = np.nan
+        self.last_ts[slot] = np.nan
+        self._free.append(slot)
+        self.evicted += 1
+
+    def _slot_ids(self, vehicle_ids: list[str], now: float) -> np.ndarray:
+        if self.idle_ttl_s > 0:
+            while self._slots:
+                vid, slot = next(iter(self._slots.items()))
+                if self.seen[slot] > now - self.idle_ttl_s:
+                    break
+                self._evict(vid)
+
+        slots = np.empty(len(vehicle_ids), dtype=np.int64)
+        touched: set[int] = set()
+        for i, vid in enumerate(vehicle_ids):
+            slot = self._slots.get(vid)
+            if slot is None:
+                if self.max_vehicles > 0 and len(self._slots) >= self.max_vehicles:
+                    oldest = next(iter(self._slots))
+                    if self._slots[oldest] not in touched:
+                        self._evict(oldest)
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    slot = self._next_slot
+                    self._next_slot += 1
+                    self._grow(self._next_slot)
+                self._slots[vid] = slot
+            else:
+                self._slots.move_to_end(vid)
+            touched.add(slot)
+            slots[i] = slot
+        self.seen[slots] = now
+        return slots
+
+    def update_batch(
+        self,
+        vehicle_ids: list[str],
+        values: np.ndarray,
+        timestamps: np.ndarray | None = None,
+        now: float | None = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Apply readings (n, n_features; NaN = missing), taken at `timestamps`
+        (n,) epoch seconds (NaN or None = `now`), and return the derived
+        features after each reading: {"ewma", "rate_of_change", "window_max"},
+        each (n, n_features), plus "count" (n,) readings seen so far.
+        """
+        now = time.time() if now is None else now
+        n = len(vehicle_ids)
+        values = np.asarray(values, dtype=np.float64)
+        ts = np.full(n, now) if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+        ts = np.where(np.isnan(ts), now, ts)
+        out_ewma = np.empty_like(values)
+        out_roc = np.empty_like(values)
+        out_max = np.empty_like(values)
+        out_count = np.empty(n, dtype=np.int64)
+
+        with self._lock:
+            slots = self._slot_ids(vehicle_ids, now)
+
+            # Occurrence number of each row's vehicle within this batch
+            order = np.argsort(slots, kind="stable")
+            sorted_slots = slots[order]
+            starts = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+            occurrence = np.empty(n, dtype=np.int64)
+            occurrence[order] = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+            for k in range(int(occurrence.max()) + 1 if n else 0):
+                rows = np.flatnonzero(occurrence == k)
+                s = slots[rows]
+                x = values[rows]
+                t = ts[rows][:, None]
+                present = ~np.isnan(x)
+
+                # Windowed max: fold in the new value unless it evicts the current max
+                x32 = x.astype(np.float32)
+                evicted = self.ring[s, self.pos[s]]
+                current = self.wmax[s]
+                self.ring[s, self.pos[s]] = x32
+                window_max = np.fmax(current, x32)
+                stale = ((evicted == current) & ~(x32 >= current)).any(axis=1)
+                if stale.any():
+                    window_max[stale] = np.fmax.reduce(self.ring[s[stale]], axis=1)
+                self.wmax[s] = window_max
+                self.pos[s] = (self.pos[s] + 1) % self.window
+                self.count[s] += 1
+
+                prev = self.ewma[s]
+                blended = np.where(np.isnan(prev), x, self.alpha * x + (1.0 - self.alpha) * prev)
+                self.ewma[s] = np.where(present, blended, prev)
+
+                # Per feature, against its own previous value; out-of-order readings give NaN
+                dt = t - self.last_ts[s]
+                roc = (x - self.last[s]) / np.where(dt > 0, dt, np.nan)
+                self.roc[s] = roc
+                self.last[s] = np.where(present, x, self.last[s])
+                self.last_ts[s] = np.where(present, t, self.last_ts[s])
+
+                out_ewma[rows] = self.ewma[s]
+                out_roc[rows] = roc
+                out_max[rows] = window_max
+                out_count[rows] = self.count[s]
+
+        return {"ewma": out_ewma, "rate_of_change": out_roc, "window_max": out_max, "count": out_count}
+
+    def snapshot(self, vehicle_id: str) -> dict | None:
+        """Current derived features for one vehicle, keyed by feature name."""
+        with self._lock:
+            slot = self._slots.get(vehicle_id)
+            if slot is None:
+                return None
+            window_max = self.wmax[slot].copy()
+            ewma = self.ewma[slot].copy()
+            roc = self.roc[slot].copy()
+            count = int(self.count[slot])
+
+        def as_dict(arr):
+            return {k: (None if v != v else round(v, 4)) for k, v in zip(self.feature_keys, arr.tolist())}
+
+        return {
+            "vehicle_id": vehicle_id,
+            "readings_seen": count,
+            "window": self.window,
+            "ewma": as_dict(ewma),
+            "rate_of_change": as_dict(roc),
+            "window_max": as_dict(window_max),
+        }
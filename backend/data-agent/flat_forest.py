@@ -0,0 +1,266 @@
+"""
+Flattened Isolation Forest scorer.
+
+`compile_forest` turns a fitted sklearn IsolationForest into a handful of flat
+NumPy arrays (one entry per node across all trees), and `FlatForest` scores a
+whole batch against every tree at once with plain NumPy. Leaves point to
+themselves, so walking `max_depth` steps lands every (row, tree) pair on its
+leaf without per-node branching. The arithmetic follows sklearn's
+`_compute_score_samples` step for step, so `decision_function` matches exactly.
+
+Compiling needs the pickled model (and therefore sklearn); serving only needs
+NumPy and the saved .npz:
+
+    python flat_forest.py ../models/isoforest.pkl ../models/isoforest.npz
+"""
+
+import os
+import shutil
+import sys
+
+import numpy as np
+
+# Rows scored per chunk; bounds the (rows x trees) index matrices
+CHUNK_ROWS = 1024
+
+ARRAY_NAMES = [
+    "feature",
+    "threshold",
+    "left",
+    "right",
+    "children",
+    "path_length",
+    "missing_left",
+    "roots",
+    "max_depth",
+    "n_features",
+    "denominator",
+    "offset",
+]
+
+
+def average_path_length(n_samples) -> np.ndarray:
+    """Average path length of an unsuccessful BST search (same as sklearn's helper)."""
+    n = np.asarray(n_samples, dtype=np.float64).reshape(-1)
+    apl = np.zeros(n.shape)
+    mask_1 = n <= 1
+    mask_2 = n == 2
+    not_mask = ~np.logical_or(mask_1, mask_2)
+    apl[mask_1] = 0.0
+    apl[mask_2] = 1.0
+    apl[not_mask] = 2.0 * (np.log(n[not_mask] - 1.0) + np.euler_gamma) - 2.0 * (n[not_mask] - 1.0) / n[not_mask]
+    return apl
+
+
+def _node_depths(children_left: np.ndarray, children_right: np.ndarray) -> np.ndarray:
+    """Depth of every node with the root at depth 1 (sklearn's compute_node_depths)."""
+    depths = np.zeros(children_left.shape[0], dtype=np.int64)
+    depths[0] = 1
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        for child in (children_left[node], children_right[node]):
+            if child != -1:
+                depths[child] = depths[node] + 1
+                stack.append(child)
+    return depths
+
+
+def compile_forest(model) -> dict:
+    """Flatten a fitted IsolationForest into a dict of NumPy arrays."""
+    n_features = int(model.n_features_in_)
+    subsample_features = model._max_features != n_features
+
+    feature, threshold, left, right, path_length, missing_left, roots = [], [], [], [], [], [], []
+    base = 0
+    max_depth = 0
+    for est, est_features in zip(model.estimators_, model.estimators_features_):
+        tree = est.tree_
+        n_nodes = tree.node_count
+        children_left = np.asarray(tree.children_left)
+        children_right = np.asarray(tree.children_right)
+        is_leaf = children_left == -1
+        own = np.arange(n_nodes)
+
+        tree_feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+        if subsample_features:
+            tree_feature = np.asarray(est_features)[tree_feature].astype(np.int32)
+
+        depths = _node_depths(children_left, children_right)
+        max_depth = max(max_depth, int(depths.max()) - 1)
+        leaf_path = depths + average_path_length(tree.n_node_samples) - 1.0
+
+        feature.append(tree_feature)
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+        left.append(np.where(is_leaf, own, children_left) + base)
+        right.append(np.where(is_leaf, own, children_right) + base)
+        path_length.append(np.where(is_leaf, leaf_path, 0.0))
+        mgl = getattr(tree, "missing_go_to_left", None)
+        missing_left.append(np.zeros(n_nodes, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+        roots.append(base)
+        base += n_nodes
+
+    return {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "path_length": np.concatenate(path_length),
+        "missing_left": np.concatenate(missing_left),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": np.int64(max_depth),
+        "n_features": np.int64(n_features),
+        "denominator": np.float64(len(model.estimators_) * average_path_length([model._max_samples])[0]),
+        "offset": np.float64(model.offset_),
+    }
+
+
+class FlatForest:
+    """NumPy-only scorer over compiled forest arrays."""
+
+    def __init__(self, arrays):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.path_length = arrays["path_length"]
+        self.missing_left = arrays["missing_left"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        self.n_features_in_ = int(arrays["n_features"])
+        self.denominator = float(arrays["denominator"])
+        self.offset_ = float(arrays["offset"])
+        self.n_trees = self.roots.shape[0]
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        if "children" in arrays:
+            self.children = arrays["children"]
+        else:
+            self.children = np.stack([self.left, self.right], axis=1).reshape(-1)
+
+    @classmethod
+    def from_model(cls, model) -> "FlatForest":
+        return cls(compile_forest(model))
+
+    @classmethod
+    def load(cls, path: str) -> "FlatForest":
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def _arrays(self) -> dict:
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "children": self.children,
+            "path_length": self.path_length,
+            "missing_left": self.missing_left,
+            "roots": self.roots,
+            "max_depth": np.int64(self.max_depth),
+            "n_features": np.int64(self.n_features_in_),
+            "denominator": np.float64(self.denominator),
+            "offset": np.float64(self.offset_),
+        }
+
+    def save(self, path: str):
+        """Write to a temp file and rename it into place, so readers never load a partial .npz."""
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            np.savez(f, **self._arrays())
+        os.replace(tmp, path)
+
+    def save_dir(self, path: str):
+        """One .npy per array, so the node arrays can be memory-mapped."""
+        os.makedirs(path, exist_ok=True)
+        for name, arr in self._arrays().items():
+            np.save(os.path.join(path, name + ".npy"), arr)
+
+    @classmethod
+    def load_dir(cls, path: str, mmap_mode: str | None = "r") -> "FlatForest":
+        """
+        Load a save_dir() directory. With mmap_mode="r" the node arrays are
+        read-only views of the files, so every process that maps the same
+        directory shares one copy of the trees through the page cache.
+        """
+        return cls({name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES})
+
+    def _depths(self, X: np.ndarray) -> np.ndarray:
+        n, n_features = X.shape
+        flat_X = X.reshape(-1)
+        row_offsets = (np.arange(n, dtype=np.int64) * n_features)[:, None]
+        has_nan = bool(np.isnan(flat_X).any())
+        idx = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = flat_X[row_offsets + self.feature[idx]]
+            go_right = ~(x <= self.threshold[idx])
+            if has_nan:
+                go_right = np.where(np.isnan(x), ~self.missing_left[idx], go_right)
+            idx = self.children[2 * idx + go_right]
+        # Accumulate tree by tree like sklearn so the float sum is identical
+        return np.cumsum(self.path_length[idx], axis=1)[:, -1]
+
+    def score_samples(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, model expects {self.n_features_in_}")
+        if X.shape[0] == 0:
+            return np.zeros(0)
+
+        depths = np.concatenate([self._depths(X[i:i + CHUNK_ROWS]) for i in range(0, X.shape[0], CHUNK_ROWS)])
+        if self.denominator == 0:
+            return -np.full(depths.shape, 0.5)
+        return -(2 ** (-(depths / self.denominator)))
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+
+
+def ensure_mmap_dir(npz_path: str, keep: int = 2) -> str:
+    """
+    Export a compiled .npz to a directory of .npy files and return its path:
+    `{name}.mmap/{mtime_ns of the .npz}`, so a recompiled .npz gets a new
+    directory and an export is never modified once published. It is written
+    to a temp dir and renamed into place, so readers never see a partial one.
+    Only the newest `keep` exports are kept; a process that already mapped an
+    older one keeps its mapping.
+    """
+    root = os.path.splitext(npz_path)[0] + ".mmap"
+    version = str(os.stat(npz_path).st_mtime_ns)
+    mmap_dir = os.path.join(root, version)
+    if os.path.isdir(mmap_dir):
+        return mmap_dir
+
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = os.path.join(root, f".{version}.tmp{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    FlatForest.load(npz_path).save_dir(tmp_dir)
+    try:
+        os.rename(tmp_dir, mmap_dir)
+    except OSError:
+        # Another process published the same version first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(mmap_dir):
+            raise
+    versions = sorted((int(name) for name in os.listdir(root) if name.isdigit()), reverse=True)
+    for old in versions[keep:]:
+        shutil.rmtree(os.path.join(root, str(old)), ignore_errors=True)
+    return mmap_dir
+
+
+def compile_pickle(pkl_path: str, npz_path: str) -> FlatForest:
+    """Load a pickled IsolationForest (requires sklearn) and save its flat form."""
+    import joblib
+
+    forest = FlatForest.from_model(joblib.load(pkl_path))
+    forest.save(npz_path)
+    return forest
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python flat_forest.py <isoforest.pkl> <isoforest.npz>")
+        sys.exit(1)
+    compiled = compile_pickle(sys.argv[1], sys.argv[2])
+    print(f"Compiled {compiled.n_trees} trees ({compiled.feature.shape[0]} nodes) to {sys.argv[2]}")
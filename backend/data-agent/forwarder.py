@@ -0,0 +1,293 @@
+"""
+Background forwarding of health payloads to the Master Agent.
+
+`/analyze` used to POST every reading to the master and wait for its DB
+commit. Handlers now drop payloads into a bounded in-memory outbox and return
+immediately; `senders` worker threads drain it in batches and send them to
+`/store_health_batch` over a keep-alive connection pool (one connection per
+sender), retrying with exponential backoff when the master is slow or
+restarting.
+
+The outbox is split into one queue per sender and a vehicle's payloads
+always go to the same queue, so several batches are in flight at once while
+each vehicle's readings still reach the master in order.
+
+A batch that keeps failing with a 5xx or a connection error goes back to the
+front of its queue after `max_attempts`, and the sender pauses before trying
+again, so while the process runs nothing is dropped for a master outage; the
+outbox fills up instead and `offer` returns False so the caller can push back
+on the sender (HTTP 503). Two cases do lose payloads, and are counted in
+"failed": batches the master rejects with a 4xx (they would never succeed),
+and whatever is still queued when the process stops and the final flush times
+out. Use INGEST_LOG when readings must survive a data-agent restart.
+
+Scoring advances the per-vehicle rolling state, so handlers `reserve` outbox
+room before scoring: a batch is turned away before it touches the state, and
+the client's retry is not counted twice.
+
+With INGEST_LOG set, the data-agent uses LogForwarder instead: payloads go
+to a durable ingest log that the master consumes at its own pace.
+"""
+
+import threading
+import time
+import zlib
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ingest_log import IngestLogError
+
+
+class HealthForwarder:
+    def __init__(
+        self,
+        url: str,
+        max_outbox: int = 50_000,
+        max_batch: int = 500,
+        linger_ms: float = 50.0,
+        max_attempts: int = 6,
+        backoff_base_s: float = 0.2,
+        backoff_max_s: float = 5.0,
+        timeout_s: float = 5.0,
+        senders: int = 4,
+    ):
+        self.url = url
+        self.max_outbox = max_outbox
+        self.max_batch = max_batch
+        self.linger_s = linger_ms / 1000.0
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.timeout_s = timeout_s
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=senders)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._queues: list[deque] = [deque() for _ in range(senders)]
+        self._queued = 0
+        # Room held by reserve() for payloads still being scored
+        self._reserved = 0
+        self._lock = threading.Lock()
+        # One per sender, so an offer wakes only the sender whose queue it filled
+        self._wakeup = [threading.Condition(self._lock) for _ in range(senders)]
+        self._stopped = False
+        self._stop_event = threading.Event()
+
+        # Counters for the status endpoint
+        self.sent = 0
+        self.batches_sent = 0
+        self.retries = 0
+        self.requeued = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+
+        self._threads = [
+            threading.Thread(target=self._run, args=(i,), name=f"health-forwarder-{i}", daemon=True)
+            for i in range(senders)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def offer(self, payload: dict) -> bool:
+        return self.offer_many([payload])
+
+    def reserve(self, count: int) -> bool:
+        """
+        Hold outbox room for `count` payloads that are about to be produced.
+        False if there is none; otherwise hand the payloads to
+        offer_many(reserved=True), or give the room back with release().
+        """
+        with self._lock:
+            if self._queued + self._reserved + count > self.max_outbox:
+                self.rejected += count
+                return False
+            self._reserved += count
+            return True
+
+    def release(self, count: int):
+        with self._lock:
+            self._reserved -= count
+
+    def offer_many(self, payloads: list[dict], reserved: bool = False) -> bool:
+        """
+        Queue payloads for delivery; all-or-nothing. False if the outbox lacks
+        room (never when their room was reserved).
+        """
+        n = len(self._queues)
+        with self._lock:
+            if reserved:
+                self._reserved -= len(payloads)
+            elif self._queued + self._reserved + len(payloads) > self.max_outbox:
+                self.rejected += len(payloads)
+                return False
+            was_empty = [not q for q in self._queues]
+            for p in payloads:
+                self._queues[zlib.crc32(p["vehicle_id"].encode()) % n].append(p)
+            self._queued += len(payloads)
+            # Wake an idle sender to start lingering, or a lingering one once its batch is full
+            for i, q in enumerate(self._queues):
+                if q and (was_empty[i] or len(q) >= self.max_batch):
+                    self._wakeup[i].notify()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "outbox": self._queued,
+            "max_outbox": self.max_outbox,
+            "senders": len(self._threads),
+            "sent": self.sent,
+            "batches_sent": self.batches_sent,
+            "retries": self.retries,
+            "requeued": self.requeued,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+    def stop(self, flush_timeout_s: float = 5.0):
+        """Stop accepting work and try to flush what is queued."""
+        with self._lock:
+            self._stopped = True
+            for wakeup in self._wakeup:
+                wakeup.notify()
+        self._stop_event.set()
+        deadline = time.monotonic() + flush_timeout_s
+        for t in self._threads:
+            t.join(timeout=max(0.0, deadline - time.monotonic()))
+        if self._queued:
+            print(f"Stopping with {self._queued} health records not forwarded")
+            self.failed += self._queued
+        self.session.close()
+
+    def _take_batch(self, i: int) -> list[dict]:
+        queue = self._queues[i]
+        wakeup = self._wakeup[i]
+        with self._lock:
+            while not queue and not self._stopped:
+                wakeup.wait()
+            if not queue:
+                return []
+            # Linger so a trickle of readings still goes out in batches
+            deadline = time.monotonic() + self.linger_s
+            while len(queue) < self.max_batch and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wakeup.wait(timeout=remaining)
+            n = min(self.max_batch, len(queue))
+            self._queued -= n
+            return [queue.popleft() for _ in range(n)]
+
+    def _send(self, batch: list[dict]) -> bool:
+        """Deliver one batch; False if it should be retried later."""
+        delay = self.backoff_base_s
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                resp = self.session.post(self.url, json={"records": batch}, timeout=self.timeout_s)
+                if resp.status_code < 500:
+                    if resp.status_code >= 400:
+                        # Client errors will not succeed on retry
+                        print(f"Master rejected {len(batch)} health records: HTTP {resp.status_code}")
+                        self.failed += len(batch)
+                        self.last_error = f"HTTP {resp.status_code}"
+                    else:
+                        self.sent += len(batch)
+                        self.batches_sent += 1
+                    return True
+                self.last_error = f"HTTP {resp.status_code}"
+            except requests.RequestException as e:
+                self.last_error = str(e)
+
+            if attempt == self.max_attempts or self._stopped:
+                break
+            self.retries += 1
+            time.sleep(delay)
+            delay = min(self.backoff_max_s, delay * 2)
+        return False
+
+    def _run(self, i: int):
+        while True:
+            batch = self._take_batch(i)
+            if not batch:
+                return
+            if self._send(batch):
+                continue
+            # Keep the batch at the head of its queue (order is preserved) and pause
+            with self._lock:
+                self._queues[i].extendleft(reversed(batch))
+                self._queued += len(batch)
+                self.requeued += len(batch)
+            print(f"Master unavailable, keeping {len(batch)} health records queued: {self.last_error}")
+            if self._stop_event.wait(self.backoff_max_s):
+                return
+
+
+class LogForwarder:
+    """
+    Same interface as HealthForwarder, but payloads are appended to the
+    ingest log (ingest_log.py) for the master to consume, so they survive a
+    master outage for as long as the log retains them. offer_many returns
+    False when the append fails, and the caller answers 503 as for a full
+    outbox. Each payload is stamped with "logged_at" (epoch s) so a replay
+    knows when it was produced.
+
+    Sharded masters each read their own log: pass one log per shard and the
+    HashRing the masters use, and every payload goes to its vehicle's shard.
+    A batch spanning shards is appended log by log, so a failure part way
+    leaves the earlier shards written and a retried batch duplicates them.
+
+    The log is unbounded, so reserve() always succeeds. An append that fails
+    (disk full, broker down) comes after scoring, so those readings stay in
+    the rolling state and a retry counts them again.
+    """
+
+    def __init__(self, logs, ring=None):
+        self.logs = logs if isinstance(logs, list) else [logs]
+        self.ring = ring
+
+        # Counters for the status endpoint
+        self.sent = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+
+    def offer(self, payload: dict) -> bool:
+        return self.offer_many([payload])
+
+    def reserve(self, count: int) -> bool:
+        return True
+
+    def release(self, count: int):
+        pass
+
+    def offer_many(self, payloads: list[dict], reserved: bool = False) -> bool:
+        now = time.time()
+        by_shard: dict[int, list[dict]] = {}
+        for p in payloads:
+            shard = self.ring.shard_for(p["vehicle_id"]) if self.ring else 0
+            by_shard.setdefault(shard, []).append({**p, "logged_at": now})
+        try:
+            for shard, items in by_shard.items():
+                self.logs[shard].append_many(items)
+        except IngestLogError as e:
+            self.rejected += len(payloads)
+            self.last_error = str(e)
+            return False
+        self.sent += len(payloads)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "ingest_log": [log.stats() for log in self.logs] if self.ring else self.logs[0].stats(),
+            "sent": self.sent,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+    def stop(self, flush_timeout_s: float = 5.0):
+        for log in self.logs:
+            log.close()
@@ -1,57 +1,208 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-import requests
-import math
-import joblib
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+import json
 import numpy as np
 import os
+import sys
 
-MASTER_URL = "http://127.0.0.1:8000/store_health"
+# Shared backend modules (model_registry, ingest_log) live one directory up
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-# Load the trained ML model
+from batch_scoring import build_feature_matrix, select_columns
+from feature_state import RollingFeatureState
+from forwarder import HealthForwarder, LogForwarder
+from ingest_log import open_ingest_log
+from ml_batcher import MicroBatcher
+from model_manager import ModelManager
+import model_registry
+from rule_engine import DEFAULT_RULES_PATH, RuleConfigError, RuleManager
+from scoring import (
+    FEATURE_KEYS,
+    derived_inputs,
+    derived_matrix,
+    ml_score_from_decision,
+    score_dict_batch,
+    score_wire_batch,
+    temporal_scores,
+)
+from scoring_pool import ScoringPool
+from sharding import HashRing, shard_suffix
+from wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, WIRE_FIELDS, WireFormatError, decode_records
+
+# sync=true: the master acks a batch only after it is committed, so the
+# forwarder's retries cover a master crash as well
+MASTER_BATCH_URL = "http://127.0.0.1:8000/store_health_batch?sync=true"
+
+# ML model: served from the versioned registry (backend/models/registry), falling
+# back to the legacy models/isoforest.pkl. Serving uses the flattened NumPy form
+# (.npz) so sklearn is not imported; a pickle is compiled once on first load.
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "isoforest.pkl")
-ML_MODEL = None
+FLAT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "isoforest.npz")
+MODEL_WATCH_INTERVAL_S = float(os.getenv("MODEL_WATCH_INTERVAL_S", "10"))
+
+MODEL_MANAGER = ModelManager(FEATURE_KEYS, MODEL_PATH, FLAT_MODEL_PATH)
 try:
-    if os.path.exists(MODEL_PATH):
-        ML_MODEL = joblib.load(MODEL_PATH)
-        print(f"✓ ML model loaded from {MODEL_PATH}")
-    else:
-        print(f"Warning: ML model not found at {MODEL_PATH}. ML scoring will be skipped.")
+    MODEL_MANAGER.load()
 except Exception as e:
     print(f"Error loading ML model: {e}")
+MODEL_MANAGER.start_watcher(MODEL_WATCH_INTERVAL_S)
+
+# Anomaly rules: thresholds/weights from a JSON file, compiled at load and
+# recompiled when the file changes
+RULES_PATH = os.getenv("RULES_PATH", DEFAULT_RULES_PATH)
+RULES_WATCH_INTERVAL_S = float(os.getenv("RULES_WATCH_INTERVAL_S", "10"))
+
+RULE_MANAGER = RuleManager(RULES_PATH)
+RULE_MANAGER.load()
+RULE_MANAGER.start_watcher(RULES_WATCH_INTERVAL_S)
 
-FEATURE_KEYS = [
-    "vehicle_speed_kmh",
-    "engine_rpm",
-    "coolant_temp_c",
-    "oil_temp_c",
-    "battery_voltage_v",
-    "brake_disc_temp_c",
-    "vibration_rms_g",
-    "tire_pressure_psi",
-    "hard_brake_events",
-    "dtc_count",
-]
+# Micro-batching window for single-reading ML scoring
+ML_BATCH_MAX_ROWS = int(os.getenv("ML_BATCH_MAX_ROWS", "256"))
+ML_BATCH_MAX_WAIT_MS = float(os.getenv("ML_BATCH_MAX_WAIT_MS", "5"))
+# Each batch is scored by whichever model is active when it is dispatched
+ML_BATCHER = MicroBatcher(
+    lambda X: MODEL_MANAGER.model.decision_function(X),
+    max_batch_rows=ML_BATCH_MAX_ROWS,
+    max_wait_ms=ML_BATCH_MAX_WAIT_MS,
+)
+
+# Batch scoring worker processes (0 = score in this process's threadpool)
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "0"))
+SCORING_POOL = ScoringPool(SCORING_WORKERS) if SCORING_WORKERS > 0 else None
 
 app = FastAPI(title="AURA Data Analysis Agent - Prototype v0")
 
+# Per-vehicle rolling windows over FEATURE_KEYS (EWMA, rate of change, windowed max);
+# vehicles idle for FEATURE_IDLE_TTL_S, or least recent past FEATURE_MAX_VEHICLES, are dropped
+FEATURE_STATE = RollingFeatureState(
+    FEATURE_KEYS,
+    window=int(os.getenv("FEATURE_WINDOW", "30")),
+    alpha=float(os.getenv("FEATURE_EWMA_ALPHA", "0.2")),
+    max_vehicles=int(os.getenv("FEATURE_MAX_VEHICLES", "100000")),
+    idle_ttl_s=float(os.getenv("FEATURE_IDLE_TTL_S", "3600")),
+)
+
+# Health payloads reach the Master Agent either through the durable ingest log
+# (INGEST_LOG=segments or kafka; the master must use the same settings) or,
+# by default, by POSTing them in the background. With SHARD_COUNT > 1 (same
+# value as the masters) each shard gets its own log, suffixed like theirs.
+INGEST_LOG = os.getenv("INGEST_LOG", "")
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+if INGEST_LOG:
+    FORWARDER = LogForwarder(
+        [
+            open_ingest_log(
+                INGEST_LOG,
+                directory=os.getenv("INGEST_LOG_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "ingest_log"))
+                + shard_suffix(SHARD_COUNT, i),
+                partitions=int(os.getenv("INGEST_LOG_PARTITIONS", "8")),
+                fsync=os.getenv("INGEST_LOG_FSYNC", "0") == "1",
+                bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+                topic=os.getenv("INGEST_TOPIC", "aura.health") + shard_suffix(SHARD_COUNT, i),
+            )
+            for i in range(SHARD_COUNT)
+        ],
+        ring=HashRing(SHARD_COUNT) if SHARD_COUNT > 1 else None,
+    )
+else:
+    FORWARDER = HealthForwarder(
+        MASTER_BATCH_URL,
+        max_outbox=int(os.getenv("FORWARD_MAX_OUTBOX", "50000")),
+        max_batch=int(os.getenv("FORWARD_MAX_BATCH", "500")),
+        linger_ms=float(os.getenv("FORWARD_LINGER_MS", "50")),
+        senders=int(os.getenv("FORWARD_SENDERS", "4")),
+    )
+
+
+@app.on_event("shutdown")
+def shutdown():
+    MODEL_MANAGER.stop()
+    RULE_MANAGER.stop()
+    FORWARDER.stop()
+    if SCORING_POOL is not None:
+        SCORING_POOL.shutdown()
+
 
 class RawTelemetry(BaseModel):
     vehicle_id: str
     sensors: dict
+    # Epoch seconds the reading was taken; defaults to arrival time
+    timestamp: float | None = None
+
+
+class TelemetryBatch(BaseModel):
+    readings: list[RawTelemetry]
 
 
 @app.get("/")
 def root():
-    return {"status": "ok", "service": "data-agent", "version": "0.0.1", "ml_model_loaded": ML_MODEL is not None}
+    return {
+        "status": "ok",
+        "service": "data-agent",
+        "version": "0.0.1",
+        "ml_model_loaded": MODEL_MANAGER.model is not None,
+        "ml_model_version": MODEL_MANAGER.version,
+        "rules_version": RULE_MANAGER.rules.version,
+        "ml_batching": ML_BATCHER.stats(),
+        "scoring_pool": SCORING_POOL.stats() if SCORING_POOL is not None else None,
+        "forwarder": FORWARDER.stats(),
+        "vehicles_tracked": len(FEATURE_STATE),
+        "vehicles_evicted": FEATURE_STATE.evicted,
+    }
+
+
+@app.get("/admin/model")
+def model_status():
+    """Active model version/metadata and the versions available in the registry."""
+    return MODEL_MANAGER.status()
+
+
+@app.post("/admin/model/reload", status_code=202)
+def reload_model(version: str | None = None):
+    """
+    Load a model version (default: the registry's ACTIVE version) in the
+    background and swap it in atomically once validated. Poll /admin/model
+    to see when it is active.
+    """
+    if version is not None and version != "legacy" and version not in model_registry.list_versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    MODEL_MANAGER.reload_async(version)
+    return {"loading": version or model_registry.get_active_version() or "legacy", "active": MODEL_MANAGER.version}
+
+
+@app.get("/admin/rules")
+def rules_status():
+    """Active anomaly rule set (version, subsystem weights, sensor aliases)."""
+    return RULE_MANAGER.status()
+
+
+@app.post("/admin/rules/reload")
+def reload_rules():
+    """Recompile the rules file now; a file that fails validation leaves the current rules active."""
+    try:
+        version = RULE_MANAGER.load()
+    except (OSError, RuleConfigError) as e:
+        raise HTTPException(status_code=422, detail=f"Rules not reloaded: {e}")
+    return {"active": version}
+
+
+@app.get("/vehicles/{vehicle_id}/features")
+def vehicle_features(vehicle_id: str):
+    """Current rolling-window features for one vehicle."""
+    snapshot = FEATURE_STATE.snapshot(vehicle_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No readings seen for this vehicle")
+    return snapshot
 
 
 def compute_ml_anomaly(sensors: dict) -> tuple[float, str]:
     """
     Score telemetry using trained Isolation Forest model.
     Returns: (anomaly_score, label) where score in [0, 1] and label is "normal" or "anomaly".
+    The row is scored through ML_BATCHER so concurrent requests share one model call.
     """
-    if ML_MODEL is None:
+    if MODEL_MANAGER.model is None:
         return 0.0, "unknown"
     
     try:
@@ -62,24 +213,8 @@ def compute_ml_anomaly(sensors: dict) -> tuple[float, str]:
             if val is None:
                 val = 0.0
             row.append(float(val))
-        X = np.array([row], dtype=np.float32)
-        
-        # Get prediction: -1 is anomaly, 1 is normal
-        prediction = ML_MODEL.predict(X)[0]
-        
-        # Get decision function score (distance from separation hyperplane)
-        # Higher = more normal, Lower = more anomalous
-        # Typical range: roughly [-0.5, 0.5] but can vary
-        df_score = ML_MODEL.decision_function(X)[0]
-        
-        # Map decision function to [0, 1] anomaly scale
-        # df_score > 0.2 => normal (0.0)
-        # df_score < -0.2 => anomaly (1.0)
-        # Linear mapping between
-        anomaly_score = max(0.0, min(1.0, 0.5 - df_score * 2.5))
-        
-        label = "anomaly" if prediction == -1 else "normal"
-        return round(anomaly_score, 2), label
+        df_score = ML_BATCHER.score(np.array(row, dtype=np.float32))
+        return ml_score_from_decision(df_score)
     except Exception as e:
         print(f"Error computing ML anomaly: {e}")
         import traceback
@@ -88,84 +223,37 @@ def compute_ml_anomaly(sensors: dict) -> tuple[float, str]:
 
 
 def compute_anomaly(sensors: dict) -> tuple[float, dict]:
-    # Read sensors with safe defaults and fallbacks
-    brake_temp = float(sensors.get("brake_disc_temp_c", sensors.get("brake_temp", 60)))
-    vib = float(sensors.get("vibration_rms_g", sensors.get("vibration", 0.25)))
-    vibration_spike = float(sensors.get("vibration_spike", 0))
-    coolant = float(sensors.get("coolant_temp_c", sensors.get("engine_temp", 90)))
-    oil_temp = float(sensors.get("oil_temp_c", sensors.get("oil_temp", sensors.get("oil_temperature", 90))))
-    battery = float(sensors.get("battery_voltage_v", sensors.get("battery", 13.8)))
-    tire_p = float(sensors.get("tire_pressure_psi", 33))
-    hard_brakes = float(sensors.get("hard_brake_events", 0))
-    dtc_count = int(sensors.get("dtc_count", 0))
-    brake_pressure = float(sensors.get("brake_pressure_bar", sensors.get("brake_pressure", 0)))
-    engine_rpm = float(sensors.get("engine_rpm", 0))
-
-    # Brakes: combine disc temp, brake pressure spikes, and hard-brake events
-    brake_temp_comp = max(0.0, (brake_temp - 100.0) / 80.0)
-    pressure_comp = max(0.0, (brake_pressure - 60.0) / 60.0)
-    hard_brake_comp = min(1.0, hard_brakes * 0.5)
-    brake_comp = max(brake_temp_comp, pressure_comp, hard_brake_comp)
-
-    # Suspension: vibration RMS and spikes
-    vib_comp = max(0.0, (vib - 0.25) / 0.65)
-    spike_comp = min(1.0, vibration_spike * 0.7)
-    vib_comp = max(vib_comp, spike_comp)
-
-    # Engine: coolant, oil temp, and high RPM under load
-    coolant_comp = max(0.0, (coolant - 95.0) / 25.0)
-    oil_comp = max(0.0, (oil_temp - 95.0) / 35.0)
-    rpm_comp = max(0.0, (engine_rpm - 3000.0) / 4000.0)
-    engine_comp = max(coolant_comp, oil_comp, rpm_comp)
-
-    # Electrical: battery under-voltage
-    batt_comp = 0.0
-    if battery < 13.3:
-        batt_comp = min(1.0, (13.3 - battery) / 1.5)
-
-    # Tires: low <28 or high >40 psi
-    tire_comp = 0.0
-    if tire_p < 28:
-        tire_comp = min(1.0, (28.0 - tire_p) / 8.0)
-    elif tire_p > 40:
-        tire_comp = min(1.0, (tire_p - 40.0) / 8.0)
-
-    # Events / diagnostics: DTCs and hard braking and vibration spikes
-    event_comp = min(1.0, hard_brakes * 0.25 + dtc_count * 0.30 + vibration_spike * 0.2)
-
-    # Weighted sum across subsystems
-    w_brakes = 0.30
-    w_susp = 0.20
-    w_engine = 0.20
-    w_elec = 0.10
-    w_tire = 0.10
-    w_event = 0.10
-
-    score = (
-        w_brakes * brake_comp
-        + w_susp * vib_comp
-        + w_engine * engine_comp
-        + w_elec * batt_comp
-        + w_tire * tire_comp
-        + w_event * event_comp
-    )
-    score = float(max(0.0, min(1.0, round(score, 2))))
-
-    subsystems = {
-        "brakes": round(brake_comp, 2),
-        "suspension": round(vib_comp, 2),
-        "engine": round(engine_comp, 2),
-        "electrical": round(batt_comp, 2),
-        "tires": round(tire_comp, 2),
-        "events": round(event_comp, 2),
-    }
-    return score, subsystems
+    """Rule-based (score, subsystems) for one reading, from the compiled rules in RULE_MANAGER."""
+    return RULE_MANAGER.rules.score(sensors)
 
 
 @app.post("/analyze")
 def analyze(telemetry: RawTelemetry):
-    # Rule-based anomaly score and subsystems breakdown
-    rule_score, subsystems = compute_anomaly(telemetry.sensors)
+    # Hold the payload's outbox room first, so a reading turned away with a 503
+    # never reaches the rolling state and the client's retry is counted once
+    if not FORWARDER.reserve(1):
+        raise HTTPException(status_code=503, detail="Forwarding outbox full, retry later")
+    try:
+        response, health_payload = analyze_one(telemetry)
+    except BaseException:
+        FORWARDER.release(1)
+        raise
+    # queue for the Master Agent; the response does not wait on the master's DB write
+    FORWARDER.offer_many([health_payload], reserved=True)
+    return response
+
+
+def analyze_one(telemetry: RawTelemetry) -> tuple[dict, dict]:
+    """Score one reading; returns (response, health_payload)."""
+    # Rolling-window view of this vehicle, including this reading
+    X, present = build_feature_matrix([telemetry.sensors or {}], FEATURE_KEYS, return_mask=True)
+    derived = FEATURE_STATE.update_batch(
+        [telemetry.vehicle_id], np.where(present, X, np.nan), np.array([telemetry.timestamp], dtype=np.float64)
+    )
+    features = derived_matrix(derived)
+
+    # Rule-based anomaly score and subsystems breakdown (rules may use the derived features)
+    rule_score, subsystems = compute_anomaly({**(telemetry.sensors or {}), **derived_inputs(features[0])})
     
     # ML-based anomaly score
     ml_score, ml_label = compute_ml_anomaly(telemetry.sensors)
@@ -174,6 +262,10 @@ def analyze(telemetry: RawTelemetry):
     combined_score = round(0.7 * rule_score + 0.3 * ml_score, 2)
     combined_score = float(max(0.0, min(1.0, combined_score)))
 
+    temporal = temporal_scores(
+        MODEL_MANAGER.model, RULE_MANAGER.rules, features, derived["count"], FEATURE_STATE.window
+    )[0]
+
     # Preserve whatever sensors were sent so downstream can inspect exact inputs
     sensor_snapshot = dict(telemetry.sensors or {})
 
@@ -186,14 +278,190 @@ def analyze(telemetry: RawTelemetry):
         "ml_anomaly_score": ml_score,
         "ml_label": ml_label,
         "rule_anomaly_score": rule_score,
+        "temporal": temporal,
     }
 
-    # forward to Master Agent
-    resp = requests.post(MASTER_URL, json=health_payload, timeout=2)
     return {
         "anomaly_score": combined_score,
         "subsystems": subsystems,
         "ml_anomaly_score": ml_score,
         "ml_label": ml_label,
-        "master_status": resp.status_code,
-    }
\ No newline at end of file
+        "temporal": temporal,
+        "master_status": "queued",
+    }, health_payload
+
+
+def update_state_dicts(vehicle_ids: list[str], sensor_dicts: list[dict], timestamps: np.ndarray) -> tuple:
+    """Stateful step for JSON readings: build the ML matrix and advance the rolling state."""
+    X, present = build_feature_matrix(sensor_dicts, FEATURE_KEYS, return_mask=True)
+    derived = FEATURE_STATE.update_batch(vehicle_ids, np.where(present, X, np.nan), timestamps)
+    return X, derived_matrix(derived), derived["count"]
+
+
+def update_state_wire(vehicle_ids: list[str], values: np.ndarray, timestamps: np.ndarray) -> tuple:
+    """Stateful step for decoded binary records."""
+    derived = FEATURE_STATE.update_batch(vehicle_ids, select_columns(values, WIRE_FIELDS, FEATURE_KEYS), timestamps)
+    return derived_matrix(derived), derived["count"]
+
+
+def reading_timestamps(readings: list[RawTelemetry]) -> np.ndarray:
+    """Each reading's own timestamp; NaN (arrival time) where it has none."""
+    return np.array([np.nan if r.timestamp is None else r.timestamp for r in readings], dtype=np.float64)
+
+
+async def score_readings(
+    vehicle_ids: list[str], sensor_dicts: list[dict], timestamps: np.ndarray
+) -> tuple[list[dict], list[dict]]:
+    """
+    Score a batch of readings column-wise.
+    Returns (results, health_payloads): the per-reading response items and the
+    payloads to forward to the Master Agent, both in input order.
+    The rolling state is updated here; the stateless scoring runs in
+    SCORING_POOL when enabled.
+    """
+    X, derived, counts = await run_in_threadpool(update_state_dicts, vehicle_ids, sensor_dicts, timestamps)
+    args = (RULE_MANAGER.rules, vehicle_ids, sensor_dicts, X, derived, counts, FEATURE_STATE.window)
+    active = MODEL_MANAGER.active
+    if SCORING_POOL is not None and (active is None or active.path is not None):
+        return await SCORING_POOL.score_dicts(active.path if active else None, *args)
+    return await run_in_threadpool(score_dict_batch, active.model if active else None, *args)
+
+
+async def score_wire_records(
+    vehicle_ids: list[str], values: np.ndarray, timestamps: np.ndarray
+) -> tuple[list[dict], list[dict]]:
+    """Same as score_readings, for a decoded binary message (no per-key dict lookups)."""
+    derived, counts = await run_in_threadpool(update_state_wire, vehicle_ids, values, timestamps)
+    args = (RULE_MANAGER.rules, vehicle_ids, values, derived, counts, FEATURE_STATE.window)
+    active = MODEL_MANAGER.active
+    if SCORING_POOL is not None and (active is None or active.path is not None):
+        return await SCORING_POOL.score_wire(active.path if active else None, *args)
+    return await run_in_threadpool(score_wire_batch, active.model if active else None, *args)
+
+
+async def score_and_forward(score_fn, args: tuple, count: int) -> list[dict] | None:
+    """
+    Reserve outbox room for `count` readings, score them with score_fn(*args)
+    and queue their health payloads. None (nothing scored) if the outbox is
+    full; the room is given back if scoring raises.
+    """
+    if not FORWARDER.reserve(count):
+        return None
+    try:
+        results, health_payloads = await score_fn(*args)
+    except BaseException:
+        FORWARDER.release(count)
+        raise
+    FORWARDER.offer_many(health_payloads, reserved=True)
+    return results
+
+
+@app.post(
+    "/analyze_batch",
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": TelemetryBatch.model_json_schema()},
+                WIRE_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+            "required": True,
+        }
+    },
+)
+async def analyze_batch(request: Request):
+    """
+    Score many readings in one request (gateways buffer readings).
+    Rule and ML scoring run column-wise over the whole batch; results are
+    identical to calling /analyze once per reading.
+
+    Body is JSON `{"readings": [...]}` by default, or the binary record format
+    from wire.py when sent with `Content-Type: application/x-aura-telemetry`.
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type == WIRE_CONTENT_TYPE:
+            vehicle_ids, values, timestamps = decode_records(body)
+            score_fn, args = score_wire_records, (vehicle_ids, values, timestamps)
+        else:
+            readings = TelemetryBatch.model_validate_json(body).readings
+            vehicle_ids = [r.vehicle_id for r in readings]
+            score_fn, args = score_readings, (vehicle_ids, [r.sensors or {} for r in readings], reading_timestamps(readings))
+    except WireFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid telemetry record: {e}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    if not vehicle_ids:
+        return {"count": 0, "results": [], "master_status": None}
+
+    results = await score_and_forward(score_fn, args, len(vehicle_ids))
+    if results is None:
+        raise HTTPException(status_code=503, detail="Forwarding outbox full, retry later")
+    return {
+        "count": len(results),
+        "results": results,
+        "master_status": "queued",
+    }
+
+
+@app.websocket("/ws/telemetry")
+async def telemetry_stream(websocket: WebSocket, ack_every: int = 1):
+    """
+    Long-lived ingestion channel: one connection per vehicle or gateway.
+
+    Each text frame is either one reading `{"vehicle_id", "sensors"}` or a
+    gateway batch `{"readings": [...]}`; binary frames carry wire.py records. With ack_every=1 (default) every frame
+    is answered with its scores; with ack_every=N the server only sends
+    `{"ack": seq}` once N more readings have been accepted, where seq counts
+    readings accepted on this connection. Bad frames, frames that fail to
+    score and a full outbox are reported as `{"error": ..., "seq": seq}`
+    without closing the stream.
+    """
+    await websocket.accept()
+    seq = 0
+    last_ack = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                if message.get("bytes") is not None:
+                    vehicle_ids, values, timestamps = decode_records(message["bytes"])
+                    score_fn, args = score_wire_records, (vehicle_ids, values, timestamps)
+                else:
+                    data = json.loads(message.get("text") or "")
+                    if isinstance(data, dict) and "readings" in data:
+                        readings = TelemetryBatch.model_validate(data).readings
+                    else:
+                        readings = [RawTelemetry.model_validate(data)]
+                    vehicle_ids = [r.vehicle_id for r in readings]
+                    score_fn, args = score_readings, (
+                        vehicle_ids, [r.sensors or {} for r in readings], reading_timestamps(readings)
+                    )
+            except (ValueError, ValidationError) as e:
+                await websocket.send_json({"error": "invalid_frame", "detail": str(e), "seq": seq})
+                continue
+            if not vehicle_ids:
+                continue
+
+            try:
+                results = await score_and_forward(score_fn, args, len(vehicle_ids))
+            except Exception as e:
+                # e.g. a sensor value the rules cannot use; the frame is dropped, the stream stays open
+                print(f"Error scoring telemetry frame: {type(e).__name__}: {e}")
+                await websocket.send_json({"error": "scoring_failed", "detail": str(e), "seq": seq})
+                continue
+            if results is None:
+                await websocket.send_json({"error": "outbox_full", "seq": seq})
+                continue
+            seq += len(vehicle_ids)
+
+            if ack_every <= 1:
+                await websocket.send_json({"seq": seq, "results": results})
+            elif seq - last_ack >= ack_every:
+                await websocket.send_json({"ack": seq})
+                last_ack = seq
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,103 @@
+"""
+Micro-batching for model inference.
+
+Request handlers run in FastAPI's threadpool and each wants one row scored.
+Calling sklearn once per row is dominated by per-call overhead, so handlers
+submit their row here and block on a Future; a single worker thread gathers
+rows for up to `max_wait_ms` (or until `max_batch_rows` are queued), scores
+them with one call, and fans the results back out.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        score_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_rows: int = 256,
+        max_wait_ms: float = 5.0,
+    ):
+        self.score_fn = score_fn
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_s = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ml-micro-batcher", daemon=True)
+        self._thread.start()
+
+        # Simple counters for the status endpoint
+        self.batches_scored = 0
+        self.rows_scored = 0
+
+    def submit(self, row: np.ndarray) -> Future:
+        """Queue a single feature row; the Future resolves to its score."""
+        fut: Future = Future()
+        self._queue.put((row, fut))
+        return fut
+
+    def score(self, row: np.ndarray, timeout: float | None = 2.0) -> float:
+        """Submit a row and wait for its score."""
+        return self.submit(row).result(timeout=timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join(timeout=1.0)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_rows": self.max_batch_rows,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "batches_scored": self.batches_scored,
+            "rows_scored": self.rows_scored,
+            "avg_batch_rows": round(self.rows_scored / self.batches_scored, 2) if self.batches_scored else 0.0,
+        }
+
+    def _collect(self) -> list:
+        """Block for the first item, then gather more until the window closes."""
+        first = self._queue.get()
+        if first is None:
+            return []
+        items = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(items) < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while not self._stopped.is_set():
+            items = self._collect()
+            if not items:
+                continue
+            # Drop rows whose caller already gave up
+            items = [(row, fut) for row, fut in items if fut.set_running_or_notify_cancel()]
+            if not items:
+                continue
+            try:
+                X = np.stack([row for row, _ in items])
+                scores = self.score_fn(X)
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+
+            self.batches_scored += 1
+            self.rows_scored += len(items)
+            for (_, fut), score in zip(items, scores.tolist()):
+                fut.set_result(score)
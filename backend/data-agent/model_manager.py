@@ -0,0 +1,162 @@
+"""
+Hot-swappable ML model for the data-agent.
+
+The served model lives in a single attribute (`ActiveModel` tuple) that is
+replaced in one assignment, so request handlers always see either the old or
+the new model, never a half-loaded one. New versions are loaded, validated
+against the agent's FEATURE_KEYS and warmed up on a background thread before
+the swap; in-flight requests keep scoring on the old model meanwhile.
+
+Reloads are triggered by POST /admin/model/reload or by the watcher thread
+noticing that the registry's ACTIVE pointer changed (e.g. after ml_training.py
+registers a new version).
+"""
+
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+import model_registry
+from flat_forest import FlatForest, compile_pickle
+
+
+class ActiveModel(NamedTuple):
+    model: FlatForest
+    version: str
+    metadata: dict
+    loaded_at: float
+    # Compiled .npz the model was loaded from (None if it could not be written)
+    path: str | None = None
+
+
+class ModelManager:
+    def __init__(self, feature_keys: list[str], legacy_pkl_path: str, legacy_npz_path: str):
+        self.feature_keys = list(feature_keys)
+        self.legacy_pkl_path = legacy_pkl_path
+        self.legacy_npz_path = legacy_npz_path
+        self.active: ActiveModel | None = None
+        self.last_error: str | None = None
+        self._load_lock = threading.Lock()
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @property
+    def model(self) -> FlatForest | None:
+        active = self.active
+        return active.model if active else None
+
+    @property
+    def version(self) -> str | None:
+        active = self.active
+        return active.version if active else None
+
+    @property
+    def path(self) -> str | None:
+        active = self.active
+        return active.path if active else None
+
+    def _load_legacy(self) -> tuple[FlatForest, dict, str] | None:
+        """The pre-registry model at models/isoforest.pkl (or its compiled .npz)."""
+        pkl, npz = self.legacy_pkl_path, self.legacy_npz_path
+        metadata = {"version": "legacy", "feature_keys": self.feature_keys}
+        if os.path.exists(npz) and (not os.path.exists(pkl) or os.path.getmtime(npz) >= os.path.getmtime(pkl)):
+            return FlatForest.load(npz), metadata, npz
+        if os.path.exists(pkl):
+            return compile_pickle(pkl, npz), metadata, npz
+        return None
+
+    def _load_version(self, version: str) -> tuple[FlatForest, dict, str]:
+        metadata = model_registry.read_metadata(version)
+        path = model_registry.version_dir(version)
+        npz = os.path.join(path, model_registry.FLAT_MODEL_FILE)
+        if os.path.exists(npz):
+            model = FlatForest.load(npz)
+        else:
+            model = compile_pickle(os.path.join(path, model_registry.MODEL_FILE), npz)
+        return model, metadata, npz
+
+    def load(self, version: str | None = None) -> str | None:
+        """
+        Load `version` (default: registry ACTIVE, else the legacy model file),
+        validate it and swap it in. Returns the version now being served.
+        """
+        with self._load_lock:
+            version = version or model_registry.get_active_version()
+            if version is None or version == "legacy":
+                loaded = self._load_legacy()
+                if loaded is None:
+                    print("Warning: no ML model in registry or at legacy path. ML scoring will be skipped.")
+                    return self.version
+            else:
+                loaded = self._load_version(version)
+            model, metadata, path = loaded
+
+            if metadata.get("feature_keys") != self.feature_keys:
+                raise ValueError(f"Model {metadata.get('version')} feature_keys do not match the data-agent FEATURE_KEYS")
+            # Warm up and sanity-check before serving
+            score = model.decision_function(np.zeros((1, len(self.feature_keys)), dtype=np.float32))
+            if not np.isfinite(score).all():
+                raise ValueError(f"Model {metadata.get('version')} produced non-finite warm-up score")
+
+            self.active = ActiveModel(model, metadata["version"], metadata, time.time(), path if os.path.exists(path) else None)
+            self.last_error = None
+            print(f"✓ ML model {metadata['version']} active")
+            return self.active.version
+
+    def reload_async(self, version: str | None = None) -> threading.Thread:
+        def run():
+            try:
+                self.load(version)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Error reloading ML model: {self.last_error}")
+
+        thread = threading.Thread(target=run, name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def start_watcher(self, interval_s: float):
+        """
+        Poll the registry's ACTIVE pointer and load the version it names when the
+        pointer changes. A version pinned through reload()/the admin endpoint
+        stays served until ACTIVE moves again.
+        """
+        if interval_s <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            last_seen = model_registry.get_active_version()
+            while not self._stop.wait(interval_s):
+                try:
+                    wanted = model_registry.get_active_version()
+                except OSError:
+                    continue
+                if wanted == last_seen:
+                    continue
+                last_seen = wanted
+                if wanted and wanted != self.version:
+                    try:
+                        self.load(wanted)
+                    except Exception as e:
+                        self.last_error = f"{type(e).__name__}: {e}"
+                        print(f"Error reloading ML model {wanted}: {self.last_error}")
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> dict:
+        active = self.active
+        return {
+            "active_version": active.version if active else None,
+            "metadata": active.metadata if active else None,
+            "loaded_at": active.loaded_at if active else None,
+            "registry_active": model_registry.get_active_version(),
+            "available_versions": model_registry.list_versions(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,355 @@
+"""
+Declarative anomaly rules, compiled to Python/NumPy code at load time.
+
+Rules live in a JSON file (rules.json next to this module, or RULES_PATH):
+
+    inputs      name -> {"keys": [sensor keys tried in order], "default": v,
+                         "type": "float" | "int"}
+    subsystems  [{"name", "weight", "components": [...]}, ...]
+
+An input's keys may also name a per-vehicle rolling feature from the
+data-agent's feature state: "ewma.<sensor>", "roc.<sensor>" (rate of change
+per second) or "max.<sensor>" (max over the window), for any sensor in
+FEATURE_KEYS. Such an input should list only that key; while a vehicle has no
+history for it the input takes its default.
+
+A subsystem's value is the max of its components and the rule score is the
+weighted sum of subsystems, in file order. A component is either
+
+    a ramp      {"input", "below"?, "above"?, "span", "cap"?}
+                (below - x) / span when x < below, (x - above) / span when
+                x > above, else 0.0; optionally capped with min(cap, .)
+    a linear    {"linear": {input: coefficient, ...}, "cap"?}
+                sum of input * coefficient in file order, optionally capped
+
+RuleSet generates the source of two straight-line functions from the config:
+a scalar evaluator over one sensor dict and a vectorized one over NumPy input
+columns. Both perform the same float64 operations in the same order, so they
+agree exactly, and neither interprets the config per reading.
+RuleManager serves the active RuleSet and swaps in a new one when the file
+changes.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "rules.json")
+
+_INPUT_FIELDS = {"keys", "default", "type"}
+_COMPONENT_FIELDS = {"input", "below", "above", "span", "cap", "linear"}
+_CASTS = {"float": float, "int": int}
+
+
+class RuleConfigError(ValueError):
+    pass
+
+
+def _number(value, where: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise RuleConfigError(f"{where} must be a finite number, got {value!r}")
+    return float(value)
+
+
+def _lit(value: float) -> str:
+    # repr() of a float round-trips exactly
+    return repr(float(value))
+
+
+class RuleSet:
+    def __init__(self, config: dict):
+        self.config = config
+        self.version = str(config.get("version", "unversioned"))
+        self.inputs: dict[str, tuple[tuple, float, type]] = {}
+        self._parse_inputs(config.get("inputs"))
+        self.subsystems: list[str] = []
+        self.weights: list[float] = []
+        components = self._parse_subsystems(config.get("subsystems"))
+
+        self.scalar_source, self.vector_source = self._generate(components)
+        namespace = {"np": np}
+        exec(compile(self.scalar_source + "\n" + self.vector_source, f"<rules {self.version}>", "exec"), namespace)
+        self.evaluate = namespace["evaluate"]
+        self._evaluate_columns = namespace["evaluate_columns"]
+
+    def __reduce__(self):
+        # Sent to scoring workers as its config; recompiled once per worker
+        return (compiled_rules, (self.config,))
+
+    def _parse_inputs(self, inputs):
+        if not isinstance(inputs, dict) or not inputs:
+            raise RuleConfigError("'inputs' must be a non-empty object")
+        for name, spec in inputs.items():
+            if not isinstance(spec, dict) or set(spec) - _INPUT_FIELDS:
+                raise RuleConfigError(f"input {name!r}: expected fields {sorted(_INPUT_FIELDS)}")
+            keys = spec.get("keys")
+            if not isinstance(keys, list) or not keys or not all(isinstance(k, str) for k in keys):
+                raise RuleConfigError(f"input {name!r}: 'keys' must be a non-empty list of sensor names")
+            cast = _CASTS.get(spec.get("type", "float"))
+            if cast is None:
+                raise RuleConfigError(f"input {name!r}: 'type' must be one of {sorted(_CASTS)}")
+            default = cast(_number(spec.get("default"), f"input {name!r} default"))
+            self.inputs[name] = (tuple(keys), default, cast)
+
+    def _parse_subsystems(self, subsystems) -> list[list[dict]]:
+        if not isinstance(subsystems, list) or not subsystems:
+            raise RuleConfigError("'subsystems' must be a non-empty list")
+        parsed = []
+        for sub in subsystems:
+            name = sub.get("name") if isinstance(sub, dict) else None
+            if not isinstance(name, str) or name in self.subsystems:
+                raise RuleConfigError(f"subsystem names must be unique strings, got {name!r}")
+            components = sub.get("components")
+            if not isinstance(components, list) or not components:
+                raise RuleConfigError(f"subsystem {name!r}: 'components' must be a non-empty list")
+            self.subsystems.append(name)
+            self.weights.append(_number(sub.get("weight"), f"subsystem {name!r} weight"))
+            parsed.append([self._parse_component(name, c) for c in components])
+        return parsed
+
+    def _parse_component(self, subsystem: str, comp) -> dict:
+        where = f"subsystem {subsystem!r} component"
+        if not isinstance(comp, dict) or set(comp) - _COMPONENT_FIELDS:
+            raise RuleConfigError(f"{where}: expected fields {sorted(_COMPONENT_FIELDS)}")
+        out = {"cap": _number(comp["cap"], f"{where} cap") if "cap" in comp else None}
+
+        if "linear" in comp:
+            terms = comp["linear"]
+            if set(comp) - {"linear", "cap"} or not isinstance(terms, dict) or not terms:
+                raise RuleConfigError(f"{where}: 'linear' takes a non-empty {{input: coefficient}} object and 'cap'")
+            for name, coef in terms.items():
+                if name not in self.inputs:
+                    raise RuleConfigError(f"{where}: unknown input {name!r}")
+                _number(coef, f"{where} coefficient")
+            out["linear"] = [(name, float(coef)) for name, coef in terms.items()]
+            return out
+
+        if comp.get("input") not in self.inputs:
+            raise RuleConfigError(f"{where}: unknown input {comp.get('input')!r}")
+        if "below" not in comp and "above" not in comp:
+            raise RuleConfigError(f"{where}: a ramp needs 'below' and/or 'above'")
+        span = _number(comp.get("span"), f"{where} span")
+        if span <= 0:
+            raise RuleConfigError(f"{where}: 'span' must be positive")
+        out.update(input=comp["input"], span=span)
+        for side in ("below", "above"):
+            out[side] = _number(comp[side], f"{where} {side}") if side in comp else None
+        return out
+
+    def _generate(self, subsystems: list[list[dict]]) -> tuple[str, str]:
+        var = {name: f"x{i}" for i, name in enumerate(self.inputs)}
+        scalar = ["def evaluate(sensors):"]
+        vector = ["def evaluate_columns(cols):"]
+
+        for name, (keys, default, cast) in self.inputs.items():
+            # Nested gets, like the hand-written scorer: first alias present wins
+            lookup = repr(default)
+            for key in reversed(keys):
+                lookup = f"sensors.get({key!r}, {lookup})"
+            scalar.append(f"    {var[name]} = {cast.__name__}({lookup})")
+            vector.append(f"    {var[name]} = cols[{name!r}]")
+
+        for k, components in enumerate(subsystems):
+            scalar_parts, vector_parts = [], []
+            for j, comp in enumerate(components):
+                s_expr, v_expr = self._component_exprs(comp, var)
+                scalar.append(f"    c{k}_{j} = {s_expr}")
+                vector.append(f"    c{k}_{j} = {v_expr}")
+                scalar_parts.append(f"c{k}_{j}")
+                vector_parts.append(f"c{k}_{j}")
+            scalar.append(f"    s{k} = {'max(' + ', '.join(scalar_parts) + ')' if len(scalar_parts) > 1 else scalar_parts[0]}")
+            combined = vector_parts[0]
+            for part in vector_parts[1:]:
+                combined = f"np.maximum({combined}, {part})"
+            vector.append(f"    s{k} = {combined}")
+
+        score = " + ".join(f"{_lit(w)} * s{k}" for k, w in enumerate(self.weights))
+        subsystem_vars = ", ".join(f"s{k}" for k in range(len(self.weights)))
+        scalar.append(f"    return {score}, ({subsystem_vars},)")
+        vector.append(f"    return {score}, ({subsystem_vars},)")
+        return "\n".join(scalar) + "\n", "\n".join(vector) + "\n"
+
+    @staticmethod
+    def _component_exprs(comp: dict, var: dict) -> tuple[str, str]:
+        """Source for one component as (scalar expression, vectorized expression)."""
+        cap = comp["cap"]
+
+        def capped(expr):
+            if cap is None:
+                return expr, expr
+            return f"min({_lit(cap)}, {expr})", f"np.fmin({_lit(cap)}, {expr})"
+
+        if "linear" in comp:
+            return capped(" + ".join(f"{var[name]} * {_lit(coef)}" for name, coef in comp["linear"]))
+
+        x, span = var[comp["input"]], _lit(comp["span"])
+        s_expr, v_expr = "0.0", "0.0"
+        # Built inside out: the "below" test wins when both apply, like the tire rule
+        if comp["above"] is not None:
+            above = _lit(comp["above"])
+            s_val, v_val = capped(f"({x} - {above}) / {span}")
+            s_expr = f"({s_val} if {x} > {above} else {s_expr})"
+            v_expr = f"np.where({x} > {above}, {v_val}, {v_expr})"
+        if comp["below"] is not None:
+            below = _lit(comp["below"])
+            s_val, v_val = capped(f"({below} - {x}) / {span}")
+            s_expr = f"({s_val} if {x} < {below} else {s_expr})"
+            v_expr = f"np.where({x} < {below}, {v_val}, {v_expr})"
+        return s_expr, v_expr
+
+    def score(self, sensors: dict) -> tuple[float, dict]:
+        """Rounded (rule_score, subsystems) for one reading."""
+        raw, subsystems = self.evaluate(sensors)
+        score = float(max(0.0, min(1.0, round(raw, 2))))
+        return score, {name: round(v, 2) for name, v in zip(self.subsystems, subsystems)}
+
+    def columns_from_dicts(self, sensor_dicts: list[dict]) -> dict[str, np.ndarray]:
+        """Extract each input column, trying each alias in order like the scalar path."""
+
+        def column(keys, default, cast):
+            def lookup(sensors: dict):
+                for key in keys:
+                    if key in sensors:
+                        return sensors[key]
+                return default
+
+            return np.fromiter((cast(lookup(s)) for s in sensor_dicts), dtype=np.float64, count=len(sensor_dicts))
+
+        return {name: column(*spec) for name, spec in self.inputs.items()}
+
+    def columns_from_matrix(self, values: np.ndarray, fields: list[str]) -> dict[str, np.ndarray]:
+        """
+        Inputs from a (n, len(fields)) float64 matrix where NaN marks a missing
+        sensor (the binary wire format). Only the canonical key of each input is
+        looked up; missing values fall back to the same defaults as the dict path.
+        """
+        index = {field: i for i, field in enumerate(fields)}
+        n = values.shape[0]
+        cols = {}
+        for name, (keys, default, cast) in self.inputs.items():
+            if keys[0] not in index:
+                cols[name] = np.full(n, float(default))
+                continue
+            col = np.where(np.isnan(values[:, index[keys[0]]]), float(default), values[:, index[keys[0]]])
+            cols[name] = np.trunc(col) if cast is int else col
+        return cols
+
+    def with_derived(self, cols: dict[str, np.ndarray], values: np.ndarray, fields: list[str]) -> dict[str, np.ndarray]:
+        """
+        Replace the inputs whose first key is one of `fields` (rolling features,
+        e.g. "roc.coolant_temp_c") with that column of `values`; NaN falls back
+        to the input's default, as it does for sensors in columns_from_matrix.
+        """
+        index = {field: i for i, field in enumerate(fields)}
+        cols = dict(cols)
+        for name, (keys, default, cast) in self.inputs.items():
+            if keys[0] in index:
+                col = np.where(np.isnan(values[:, index[keys[0]]]), float(default), values[:, index[keys[0]]])
+                cols[name] = np.trunc(col) if cast is int else col
+        return cols
+
+    def evaluate_columns(self, cols: dict[str, np.ndarray]) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """
+        Vectorized evaluator. Returns (scores, subsystems) with unrounded (n,)
+        arrays; callers round via .tolist() so rounding matches Python's `round`.
+        """
+        score, subsystems = self._evaluate_columns(cols)
+        return score, dict(zip(self.subsystems, subsystems))
+
+    def evaluate_batch(self, sensor_dicts: list[dict]) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        return self.evaluate_columns(self.columns_from_dicts(sensor_dicts))
+
+
+_COMPILED: dict[str, RuleSet] = {}
+
+
+def compiled_rules(config: dict) -> RuleSet:
+    """RuleSet for `config`, reusing an already compiled one for the same config."""
+    key = json.dumps(config, sort_keys=True)
+    rules = _COMPILED.get(key)
+    if rules is None:
+        if len(_COMPILED) >= 8:
+            _COMPILED.clear()
+        rules = _COMPILED[key] = RuleSet(config)
+    return rules
+
+
+def load_rules(path: str) -> RuleSet:
+    with open(path) as f:
+        try:
+            config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise RuleConfigError(f"{path}: {e}") from e
+    return compiled_rules(config)
+
+
+class RuleManager:
+    def __init__(self, path: str = DEFAULT_RULES_PATH):
+        self.path = path
+        self.rules: RuleSet | None = None
+        self.loaded_at: float | None = None
+        self.last_error: str | None = None
+        self._mtime: float | None = None
+        self._load_lock = threading.Lock()
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def load(self) -> str:
+        """Compile the rules file, check both evaluators agree, and swap it in."""
+        with self._load_lock:
+            mtime = os.path.getmtime(self.path)
+            rules = load_rules(self.path)
+            # Smoke test: a reading with every sensor at its default
+            scalar_score, _ = rules.evaluate({})
+            cols = {name: np.array([float(default)]) for name, (_, default, _) in rules.inputs.items()}
+            batch_score, _ = rules.evaluate_columns(cols)
+            if not math.isfinite(scalar_score) or scalar_score != batch_score.tolist()[0]:
+                raise RuleConfigError(f"Rules {rules.version} failed the evaluator smoke test")
+
+            self.rules = rules
+            self._mtime = mtime
+            self.loaded_at = time.time()
+            self.last_error = None
+            print(f"✓ Anomaly rules {rules.version} active")
+            return rules.version
+
+    def start_watcher(self, interval_s: float):
+        """Reload when the rules file's mtime changes; a bad edit keeps the old rules."""
+        if interval_s <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval_s):
+                try:
+                    if os.path.getmtime(self.path) == self._mtime:
+                        continue
+                    self.load()
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    # Don't retry the same broken file every tick
+                    try:
+                        self._mtime = os.path.getmtime(self.path)
+                    except OSError:
+                        pass
+                    print(f"Error reloading anomaly rules: {self.last_error}")
+
+        self._watcher = threading.Thread(target=watch, name="rules-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> dict:
+        rules = self.rules
+        return {
+            "path": self.path,
+            "version": rules.version if rules else None,
+            "subsystems": dict(zip(rules.subsystems, rules.weights)) if rules else None,
+            "inputs": {name: list(keys) for name, (keys, _, _) in rules.inputs.items()} if rules else None,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,164 @@
+"""
+Stateless batch scoring pipeline.
+
+Everything here is a pure function of its inputs and the model and RuleSet
+passed in, so
+it can run either in the request thread or in a scoring worker process (see
+scoring_pool.py). Per-vehicle state (RollingFeatureState) stays in the
+data-agent process; callers update it first and pass the resulting derived
+features (derived_matrix) and counts in.
+"""
+
+import numpy as np
+
+from batch_scoring import feature_matrix_from_matrix
+from wire import WIRE_FIELDS, snapshots_from_values
+
+FEATURE_KEYS = [
+    "vehicle_speed_kmh",
+    "engine_rpm",
+    "coolant_temp_c",
+    "oil_temp_c",
+    "battery_voltage_v",
+    "brake_disc_temp_c",
+    "vibration_rms_g",
+    "tire_pressure_psi",
+    "hard_brake_events",
+    "dtc_count",
+]
+
+# Rolling features (feature_state.py) as rule inputs, in derived_matrix column order
+DERIVED_FIELDS = [f"{kind}.{key}" for kind in ("ewma", "roc", "max") for key in FEATURE_KEYS]
+
+
+def derived_matrix(derived: dict) -> np.ndarray:
+    """(n, len(DERIVED_FIELDS)) from RollingFeatureState.update_batch output."""
+    return np.hstack([derived["ewma"], derived["rate_of_change"], derived["window_max"]])
+
+
+def derived_inputs(row: np.ndarray) -> dict:
+    """One derived_matrix row as extra sensor keys for the scalar rule evaluator (NaN = absent)."""
+    return {field: v for field, v in zip(DERIVED_FIELDS, row.tolist()) if v == v}
+
+
+def ml_score_from_decision(df_score: float) -> tuple[float, str]:
+    """
+    Map an Isolation Forest decision_function value to (anomaly_score, label).
+    Higher df = more normal, lower = more anomalous; sklearn's predict() is
+    exactly `df < 0 -> -1 (anomaly)`, so the label is derived from the same score.
+    """
+    # Map decision function to [0, 1] anomaly scale
+    # df_score > 0.2 => normal (0.0)
+    # df_score < -0.2 => anomaly (1.0)
+    # Linear mapping between
+    anomaly_score = max(0.0, min(1.0, 0.5 - df_score * 2.5))
+    label = "anomaly" if df_score < 0 else "normal"
+    return round(anomaly_score, 2), label
+
+
+def compute_ml_anomaly_batch(model, X: np.ndarray) -> tuple[list[float], list[str]]:
+    """
+    Score a (n, len(FEATURE_KEYS)) feature matrix with a single decision_function call.
+    Returns per-row (anomaly_scores, labels) matching compute_ml_anomaly.
+    """
+    n = X.shape[0]
+    if model is None:
+        return [0.0] * n, ["unknown"] * n
+
+    try:
+        results = [ml_score_from_decision(df) for df in model.decision_function(X).tolist()]
+        return [r[0] for r in results], [r[1] for r in results]
+    except Exception as e:
+        print(f"Error computing batch ML anomaly: {e}")
+        return [0.0] * n, ["error"] * n
+
+
+def temporal_scores(model, rules, derived: np.ndarray, counts: np.ndarray, window: int) -> list[dict]:
+    """
+    Score each vehicle's smoothed (EWMA) feature vector with the same rule and
+    ML scorers. A one-off spike moves the instantaneous scores but barely moves
+    the sustained ones; a sustained rise moves both.
+    """
+    ewma = derived[:, :len(FEATURE_KEYS)]
+    sustained_raw, sustained_cols = rules.evaluate_columns(
+        rules.with_derived(rules.columns_from_matrix(ewma, FEATURE_KEYS), derived, DERIVED_FIELDS)
+    )
+    ml_sustained, _ = compute_ml_anomaly_batch(model, np.nan_to_num(ewma, nan=0.0).astype(np.float32))
+
+    sustained_scores = sustained_raw.tolist()
+    sustained_lists = {name: col.tolist() for name, col in sustained_cols.items()}
+    counts = counts.tolist()
+    return [
+        {
+            "sustained_rule_score": float(max(0.0, min(1.0, round(sustained_scores[i], 2)))),
+            "sustained_subsystems": {name: round(col[i], 2) for name, col in sustained_lists.items()},
+            "ml_sustained_score": ml_sustained[i],
+            "readings_in_window": min(counts[i], window),
+        }
+        for i in range(len(counts))
+    ]
+
+
+def score_dict_batch(model, rules, vehicle_ids, sensor_dicts, X, derived, counts, window):
+    """
+    Score JSON readings. X is the ML feature matrix already built by the caller
+    (it also fed the rolling state) and `derived` its derived_matrix, which
+    rules can use as inputs. Returns (results, health_payloads).
+    """
+    rule_raw, subsystem_cols = rules.evaluate_columns(
+        rules.with_derived(rules.columns_from_dicts(sensor_dicts), derived, DERIVED_FIELDS)
+    )
+    ml_scores, ml_labels = compute_ml_anomaly_batch(model, X)
+    temporal = temporal_scores(model, rules, derived, counts, window)
+    return assemble_results(vehicle_ids, sensor_dicts, rule_raw, subsystem_cols, ml_scores, ml_labels, temporal)
+
+
+def score_wire_batch(model, rules, vehicle_ids, values, derived, counts, window):
+    """Same as score_dict_batch, for a decoded binary message (no per-key dict lookups)."""
+    rule_raw, subsystem_cols = rules.evaluate_columns(
+        rules.with_derived(rules.columns_from_matrix(values, WIRE_FIELDS), derived, DERIVED_FIELDS)
+    )
+    ml_scores, ml_labels = compute_ml_anomaly_batch(model, feature_matrix_from_matrix(values, WIRE_FIELDS, FEATURE_KEYS))
+    temporal = temporal_scores(model, rules, derived, counts, window)
+    return assemble_results(
+        vehicle_ids, snapshots_from_values(values), rule_raw, subsystem_cols, ml_scores, ml_labels, temporal
+    )
+
+
+def assemble_results(vehicle_ids, sensor_dicts, rule_raw, subsystem_cols, ml_scores, ml_labels, temporal):
+    """Build the per-reading response items and the payloads to forward to the Master Agent."""
+    rule_scores = [float(max(0.0, min(1.0, round(s, 2)))) for s in rule_raw.tolist()]
+    subsystem_lists = {name: col.tolist() for name, col in subsystem_cols.items()}
+
+    results = []
+    health_payloads = []
+    for i, vehicle_id in enumerate(vehicle_ids):
+        rule_score = rule_scores[i]
+        ml_score = ml_scores[i]
+        combined_score = round(0.7 * rule_score + 0.3 * ml_score, 2)
+        combined_score = float(max(0.0, min(1.0, combined_score)))
+        subsystems = {name: round(col[i], 2) for name, col in subsystem_lists.items()}
+
+        health_payloads.append(
+            {
+                "vehicle_id": vehicle_id,
+                "anomaly_score": combined_score,
+                "subsystems": subsystems,
+                "sensor_snapshot": dict(sensor_dicts[i]),
+                "ml_anomaly_score": ml_score,
+                "ml_label": ml_labels[i],
+                "rule_anomaly_score": rule_score,
+                "temporal": temporal[i],
+            }
+        )
+        results.append(
+            {
+                "vehicle_id": vehicle_id,
+                "anomaly_score": combined_score,
+                "subsystems": subsystems,
+                "ml_anomaly_score": ml_score,
+                "ml_label": ml_labels[i],
+                "temporal": temporal[i],
+            }
+        )
+    return results, health_payloads
@@ -0,0 +1,101 @@
+"""
+Process pool for CPU-bound batch scoring.
+
+Rule and ML scoring are NumPy-heavy but still hold the GIL for much of a
+batch, so one data-agent process tops out at about one core. ScoringPool runs
+the stateless part of the pipeline (scoring.score_dict_batch /
+score_wire_batch) in N worker processes that request handlers await.
+
+Workers do not receive the model with each task: they get the path of the
+active model's memory-mapped export (flat_forest.ensure_mmap_dir) and map it
+read-only, so the tree arrays live once in the page cache no matter how many
+workers there are. Every export of a model file is a new directory, so a hot
+reload or a recompiled .npz changes the path, and each worker maps the new
+version on its next task. The RuleSet is pickled as its config and
+compiled once per worker (rule_engine.compiled_rules).
+
+Per-vehicle rolling state stays in the parent (it must see every reading of a
+vehicle in order); callers update it and pass the EWMA rows in.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flat_forest import FlatForest, ensure_mmap_dir
+import scoring
+
+# Per-worker cache of the mapped model: (model_dir, FlatForest); exports never change in place
+_worker_model: tuple[str, FlatForest] | None = None
+
+
+def _load_worker_model(model_dir: str | None) -> FlatForest | None:
+    global _worker_model
+    if model_dir is None:
+        return None
+    if _worker_model is None or _worker_model[0] != model_dir:
+        _worker_model = (model_dir, FlatForest.load_dir(model_dir, mmap_mode="r"))
+    return _worker_model[1]
+
+
+def _run_dicts(model_dir, rules, vehicle_ids, sensor_dicts, X, derived, counts, window):
+    model = _load_worker_model(model_dir)
+    return scoring.score_dict_batch(model, rules, vehicle_ids, sensor_dicts, X, derived, counts, window)
+
+
+def _run_wire(model_dir, rules, vehicle_ids, values, derived, counts, window):
+    model = _load_worker_model(model_dir)
+    return scoring.score_wire_batch(model, rules, vehicle_ids, values, derived, counts, window)
+
+
+class ScoringPool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        # spawn: workers must not inherit the parent's threads (batcher, forwarder, watcher)
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._lock = threading.Lock()
+        # npz_path -> (mtime of the .npz when exported, export directory)
+        self._mmap_dirs: dict[str, tuple[float, str]] = {}
+
+        # Simple counters for the status endpoint
+        self.batches_scored = 0
+        self.rows_scored = 0
+
+    def model_dir(self, npz_path: str | None) -> str | None:
+        """Memory-mapped export of a compiled model, created once per version of the model file."""
+        if npz_path is None:
+            return None
+        mtime = os.path.getmtime(npz_path)
+        with self._lock:
+            cached = self._mmap_dirs.get(npz_path)
+            if cached is None or cached[0] != mtime:
+                cached = self._mmap_dirs[npz_path] = (mtime, ensure_mmap_dir(npz_path))
+            return cached[1]
+
+    async def _submit(self, fn, npz_path, rules, vehicle_ids, *args):
+        loop = asyncio.get_running_loop()
+        model_dir = await loop.run_in_executor(None, self.model_dir, npz_path)
+        result = await loop.run_in_executor(self._executor, fn, model_dir, rules, vehicle_ids, *args)
+        self.batches_scored += 1
+        self.rows_scored += len(vehicle_ids)
+        return result
+
+    async def score_dicts(self, npz_path, rules, vehicle_ids, sensor_dicts, X, derived, counts, window):
+        """scoring.score_dict_batch in a worker, with the model compiled at `npz_path`."""
+        return await self._submit(_run_dicts, npz_path, rules, vehicle_ids, sensor_dicts, X, derived, counts, window)
+
+    async def score_wire(self, npz_path, rules, vehicle_ids, values, derived, counts, window):
+        """scoring.score_wire_batch in a worker, with the model compiled at `npz_path`."""
+        return await self._submit(_run_wire, npz_path, rules, vehicle_ids, values, derived, counts, window)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "batches_scored": self.batches_scored,
+            "rows_scored": self.rows_scored,
+        }
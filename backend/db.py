@@ -0,0 +1,252 @@
+"""
+Shared Postgres access for all AURA services and scripts.
+
+One connection pool per process, created lazily on first use (so a service
+still starts while the database is down). Connections are checked out with
+
+    with db.connection() as conn:
+        ...                      # commit explicitly; anything left open is rolled back
+
+or, for the common one-statement case,
+
+    with db.cursor(commit=True) as cur:
+        cur.execute(...)
+
+Configuration (environment):
+
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD   connection target
+    DB_POOL_MIN / DB_POOL_MAX                         pool size (default 1 / 10)
+    DB_POOL_TIMEOUT_S                                 wait for a free connection before failing (5)
+    DB_STATEMENT_TIMEOUT_MS                           server-side statement_timeout, 0 = none (5000)
+    DB_CONNECT_TIMEOUT_S                              TCP connect timeout (5)
+    DB_HEALTH_CHECK_IDLE_S                            ping connections idle longer than this (30)
+
+DB_POOL_MIN connections are opened with the pool; up to DB_POOL_MAX are
+opened on demand and then kept. A checkout waits up to DB_POOL_TIMEOUT_S when
+all DB_POOL_MAX connections are busy instead of failing at once, so a burst
+queues rather than opening more Postgres connections. Connections that come
+back broken, or that fail the idle health check, are closed and replaced.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+DB_CONFIG = dict(
+    host=os.getenv("DB_HOST", "localhost"),
+    port=int(os.getenv("DB_PORT", "5432")),
+    dbname=os.getenv("DB_NAME", "aura"),
+    user=os.getenv("DB_USER", "postgres"),
+    password=os.getenv("DB_PASSWORD", "postgres"),
+)
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "5"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+CONNECT_TIMEOUT_S = int(os.getenv("DB_CONNECT_TIMEOUT_S", "5"))
+HEALTH_CHECK_IDLE_S = float(os.getenv("DB_HEALTH_CHECK_IDLE_S", "30"))
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """No connection became free within DB_POOL_TIMEOUT_S."""
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        minconn: int = POOL_MIN,
+        maxconn: int = POOL_MAX,
+        timeout_s: float = POOL_TIMEOUT_S,
+        statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+        health_check_idle_s: float = HEALTH_CHECK_IDLE_S,
+        **connect_kwargs,
+    ):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout_s = timeout_s
+        self.health_check_idle_s = health_check_idle_s
+        self.connect_kwargs = {**DB_CONFIG, "connect_timeout": CONNECT_TIMEOUT_S, **connect_kwargs}
+        if statement_timeout_ms > 0:
+            self.connect_kwargs["options"] = f"-c statement_timeout={statement_timeout_ms}"
+
+        # Idle connections (most recently returned last) with the time they were returned
+        self._idle: list[tuple[object, float]] = []
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+        # Counters for the status endpoints
+        self.checkouts = 0
+        self.in_use = 0
+        self.waits = 0
+        self.wait_time_s = 0.0
+        self.max_wait_s = 0.0
+        self.timeouts = 0
+        self.health_checks = 0
+        self.discarded = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def getconn(self):
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            if not self._slots.acquire(timeout=self.timeout_s):
+                with self._lock:
+                    self.timeouts += 1
+                raise PoolTimeout(f"No database connection free within {self.timeout_s}s ({self.maxconn} in use)")
+            waited = time.monotonic() - start
+            with self._lock:
+                self.waits += 1
+                self.wait_time_s += waited
+                self.max_wait_s = max(self.max_wait_s, waited)
+
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+        return conn
+
+    def _checkout_healthy(self):
+        # Dead idle connections (e.g. after a Postgres restart) are dropped until a good one or a new one
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, returned_at = self._idle.pop()
+            if conn.closed:
+                self._discard(conn)
+            elif time.monotonic() - returned_at <= self.health_check_idle_s or self._ping(conn):
+                return conn
+            else:
+                self._discard(conn)
+        return self._connect()
+
+    def _ping(self, conn) -> bool:
+        with self._lock:
+            self.health_checks += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+            self.opened -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def putconn(self, conn):
+        """Return a connection; an open or failed transaction is rolled back first."""
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+                return
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._discard(conn)
+                    return
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self.in_use,
+                "open": self.opened,
+                "idle": len(self._idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "avg_wait_ms": round(self.wait_time_s / self.waits * 1000.0, 2) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_s * 1000.0, 2),
+                "timeouts": self.timeouts,
+                "health_checks": self.health_checks,
+                "discarded": self.discarded,
+            }
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Check out a pooled connection for the duration of the block."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+@contextmanager
+def cursor(commit: bool = False):
+    """A cursor on a pooled connection; with commit=True the block is committed if it succeeds."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
+        if commit:
+            conn.commit()
+
+
+def pool_stats() -> dict | None:
+    """Pool metrics, or None if this process has not touched the database yet."""
+    return _pool.stats() if _pool is not None else None
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
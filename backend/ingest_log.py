@@ -0,0 +1,476 @@
+"""
+Durable, partitioned ingest log between the data-agent and the master.
+
+The data-agent appends scored health records here instead of POSTing them to
+the master, and the master consumes them in batches (see
+master-agent/ingest_consumer.py). A slow or restarting master then only delays
+records: they wait in the log, and the master resumes from its committed
+offsets. Ingest throughput no longer depends on DB write throughput.
+
+Records are JSON objects partitioned by "vehicle_id", so each vehicle's
+records stay in order. Consumers commit their position per group after the
+records are stored. Delivery is at-least-once: records processed but not yet
+committed when the master stops are delivered again. A consumer can also
+rewind to the start of the retained log (seek_to_beginning) to rebuild state.
+
+Two implementations share the same interface:
+
+    SegmentLog   local files, for a single node and for tests
+    KafkaLog     a Kafka topic (kafka-python, imported only when used)
+
+    log.append_many(records)               append, returns the count
+    consumer = log.consumer(group)         group=None: read-only, no commits
+    consumer.poll(max_records, timeout_s)  next records (possibly fewer, or [])
+    consumer.commit()                      persist the position after poll
+    consumer.seek_to_beginning()           replay what the log retains
+    consumer.close(); log.close()
+
+SegmentLog layout, under `directory`:
+
+    meta.json                           partition count, fixed at creation
+    {partition:03d}/{base:020d}.log     segments; `base` is the partition offset of the first byte
+    {partition:03d}/lock                held while appending
+    offsets/{group}.json                committed offsets per partition
+    offsets/{group}.lock                held by the group's one active consumer
+
+Offsets are byte positions within a partition, so a consumer seeks straight
+to its position. Each record is framed as (length, crc32, JSON bytes). An
+append whose write was torn by a crash fails its CRC and is cut off by the
+next append. Sealed segments older than `retention_s` are deleted when a
+new segment is started. A group has one consumer at a time; a second one
+gets IngestLogBusy until the first closes (or its process exits).
+"""
+
+import fcntl
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+FRAME = struct.Struct("<II")  # payload length, crc32 of the payload
+# How much of a segment a consumer reads per step
+READ_CHUNK_BYTES = 1 << 20
+
+
+class IngestLogError(Exception):
+    """An append or commit the log could not perform."""
+
+
+class IngestLogBusy(IngestLogError):
+    """Another consumer is active for the same group."""
+
+
+def partition_for(key: str, partitions: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(key.encode()) % partitions
+
+
+def _encode(record: dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _scan(fd: int, pos: int, max_records: int | None = None, decode: bool = True) -> tuple[list[dict], int]:
+    """
+    Intact records of a segment from byte `pos` and the position after the
+    last one. Stops at the end, at a partly written record, or at a torn one.
+    """
+    records = []
+    size = os.fstat(fd).st_size
+    while max_records is None or len(records) < max_records:
+        buf = os.pread(fd, READ_CHUNK_BYTES, pos)
+        if len(buf) < FRAME.size:
+            break
+        length = FRAME.unpack_from(buf)[0]
+        if FRAME.size + length > len(buf):
+            if pos + FRAME.size + length > size:
+                break  # still being written, or a torn length
+            # A record larger than the chunk
+            buf = os.pread(fd, FRAME.size + length, pos)
+        off = 0
+        while off + FRAME.size <= len(buf) and (max_records is None or len(records) < max_records):
+            length, crc = FRAME.unpack_from(buf, off)
+            end = off + FRAME.size + length
+            if end > len(buf):
+                break
+            payload = buf[off + FRAME.size : end]
+            if zlib.crc32(payload) != crc:
+                return records, pos + off
+            if decode:
+                records.append(json.loads(payload))
+            off = end
+        if off == 0:
+            break
+        pos += off
+    return records, pos
+
+
+class SegmentLog:
+    def __init__(
+        self,
+        directory: str,
+        partitions: int = 8,
+        segment_bytes: int = 64 << 20,
+        retention_s: float = 7 * 86400,
+        fsync: bool = False,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention_s = retention_s
+        # fsync every append: survives power loss, not just a process crash, at a latency cost
+        self.fsync = fsync
+        os.makedirs(os.path.join(directory, "offsets"), exist_ok=True)
+
+        meta_path = os.path.join(directory, "meta.json")
+        try:
+            with open(meta_path) as f:
+                self.partitions = json.load(f)["partitions"]
+        except FileNotFoundError:
+            self.partitions = partitions
+            tmp = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"partitions": partitions}, f)
+            os.replace(tmp, meta_path)
+        if self.partitions != partitions:
+            # Changing it would move vehicles between partitions and break their ordering
+            raise ValueError(f"{directory} was created with {self.partitions} partitions, not {partitions}")
+        for p in range(self.partitions):
+            os.makedirs(self._partition_dir(p), exist_ok=True)
+
+        # Verified end of the active segment per partition, for this process
+        self._ends: dict[int, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+        # Counters for the status endpoint
+        self.appended = 0
+        self.appended_bytes = 0
+        self.segments_deleted = 0
+
+    def _partition_dir(self, partition: int) -> str:
+        return os.path.join(self.directory, f"{partition:03d}")
+
+    def segments(self, partition: int) -> list[int]:
+        """Base offsets of a partition's segments, oldest first."""
+        names = os.listdir(self._partition_dir(partition))
+        return sorted(int(name[:-4]) for name in names if name.endswith(".log"))
+
+    def _segment_path(self, partition: int, base: int) -> str:
+        return os.path.join(self._partition_dir(partition), f"{base:020d}.log")
+
+    def append_many(self, records: list[dict]) -> int:
+        by_partition: dict[int, list[bytes]] = {}
+        for rec in records:
+            by_partition.setdefault(partition_for(rec["vehicle_id"], self.partitions), []).append(_encode(rec))
+        with self._lock:
+            for partition, frames in by_partition.items():
+                data = b"".join(frames)
+                try:
+                    self._append(partition, data)
+                except OSError as e:
+                    raise IngestLogError(f"append to partition {partition} failed: {e}") from e
+                self.appended += len(frames)
+                self.appended_bytes += len(data)
+        return len(records)
+
+    def _append(self, partition: int, data: bytes):
+        with open(os.path.join(self._partition_dir(partition), "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                bases = self.segments(partition) or [0]
+                base = bases[-1]
+                path = self._segment_path(partition, base)
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    end = self._valid_end(partition, base, fd)
+                    if end >= self.segment_bytes:
+                        os.close(fd)
+                        fd = -1
+                        base += end
+                        path = self._segment_path(partition, base)
+                        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                        end = 0
+                        self._expire(partition, keep=base)
+                    os.pwrite(fd, data, end)
+                    if self.fsync:
+                        os.fsync(fd)
+                    self._ends[partition] = (base, end + len(data))
+                finally:
+                    if fd >= 0:
+                        os.close(fd)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _valid_end(self, partition: int, base: int, fd: int) -> int:
+        """End of the last intact record of the active segment; cuts off a torn tail."""
+        size = os.fstat(fd).st_size
+        known_base, pos = self._ends.get(partition, (base, 0))
+        if known_base != base or pos > size:
+            pos = 0
+        # Only bytes appended since this process last looked need checking
+        _, pos = _scan(fd, pos, decode=False)
+        if pos < size:
+            os.ftruncate(fd, pos)
+        return pos
+
+    def _expire(self, partition: int, keep: int):
+        cutoff = time.time() - self.retention_s
+        for base in self.segments(partition):
+            if base == keep:
+                continue
+            path = self._segment_path(partition, base)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                self.segments_deleted += 1
+
+    def end_offsets(self) -> dict[int, int]:
+        ends = {}
+        for p in range(self.partitions):
+            bases = self.segments(p)
+            ends[p] = bases[-1] + os.path.getsize(self._segment_path(p, bases[-1])) if bases else 0
+        return ends
+
+    def consumer(self, group: str | None) -> "SegmentConsumer":
+        return SegmentConsumer(self, group)
+
+    def stats(self) -> dict:
+        return {
+            "kind": "segments",
+            "directory": self.directory,
+            "partitions": self.partitions,
+            "appended": self.appended,
+            "appended_bytes": self.appended_bytes,
+            "segments_deleted": self.segments_deleted,
+        }
+
+    def close(self):
+        pass
+
+
+class SegmentConsumer:
+    def __init__(self, log: SegmentLog, group: str | None):
+        self.log = log
+        self.group = group
+        self._lock_file = None
+        self.positions = {p: 0 for p in range(log.partitions)}
+        if group is not None:
+            self._lock_file = open(self._path(".lock"), "a")
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise IngestLogBusy(f"another consumer holds group {group!r}")
+            try:
+                with open(self._path(".json")) as f:
+                    self.positions.update({int(p): off for p, off in json.load(f).items()})
+            except FileNotFoundError:
+                pass
+        self._next_partition = 0
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.log.directory, "offsets", self.group + suffix)
+
+    def seek_to_beginning(self):
+        self.positions = {p: 0 for p in range(self.log.partitions)}
+
+    def _read(self, partition: int, max_records: int) -> list[dict]:
+        bases = self.log.segments(partition)
+        if not bases:
+            return []
+        # Positions before the first segment were expired by retention
+        pos = max(self.positions[partition], bases[0])
+        out = []
+        for i, base in enumerate(bases):
+            next_base = bases[i + 1] if i + 1 < len(bases) else None
+            if next_base is not None and pos >= next_base:
+                continue
+            try:
+                fd = os.open(self.log._segment_path(partition, base), os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # expired since listing
+            try:
+                records, end = _scan(fd, pos - base, max_records - len(out))
+            finally:
+                os.close(fd)
+            out.extend(records)
+            pos = base + end
+            if len(out) >= max_records or next_base is None:
+                break
+            # A sealed segment read to its end: continue in the next one
+            pos = next_base
+        self.positions[partition] = pos
+        return out
+
+    def poll(self, max_records: int = 500, timeout_s: float = 1.0) -> list[dict]:
+        deadline = time.monotonic() + timeout_s
+        while True:
+            out = []
+            # Rotate the starting partition so one busy partition cannot starve the rest
+            for i in range(self.log.partitions):
+                partition = (self._next_partition + i) % self.log.partitions
+                out.extend(self._read(partition, max_records - len(out)))
+                if len(out) >= max_records:
+                    break
+            self._next_partition = (self._next_partition + 1) % self.log.partitions
+            if out or time.monotonic() >= deadline:
+                return out
+            time.sleep(min(0.05, max(deadline - time.monotonic(), 0)))
+
+    def commit(self):
+        if self.group is None:
+            return
+        path = self._path(".json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.positions, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except OSError as e:
+            raise IngestLogError(f"commit for group {self.group!r} failed: {e}") from e
+
+    def lag(self) -> int:
+        """Bytes appended but not yet consumed, over all partitions."""
+        ends = self.log.end_offsets()
+        return sum(max(ends[p] - self.positions[p], 0) for p in ends)
+
+    def stats(self) -> dict:
+        return {"group": self.group, "lag_bytes": self.lag()}
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class KafkaLog:
+    """
+    The ingest log as a Kafka topic, keyed by vehicle_id so Kafka's
+    partitioner keeps each vehicle in one partition. Offsets and replay are
+    Kafka's own (consumer groups, committed offsets, topic retention).
+
+    Appends are asynchronous: append_many returns once the records are in the
+    producer's buffer, and delivery failures after that are counted in
+    stats(). It raises IngestLogError when the buffer stays full for
+    `max_block_ms`, so the caller can push back.
+    """
+
+    def __init__(self, bootstrap_servers: str, topic: str, linger_ms: int = 5, max_block_ms: int = 100):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.linger_ms = linger_ms
+        self.max_block_ms = max_block_ms
+        self._producer = None
+        self._lock = threading.Lock()
+
+        # Counters for the status endpoint
+        self.appended = 0
+        self.failed = 0
+        self.last_error: str | None = None
+
+    def _get_producer(self):
+        # Created on first append: consumers of the log never need one
+        with self._lock:
+            if self._producer is None:
+                from kafka import KafkaProducer
+
+                self._producer = KafkaProducer(
+                    bootstrap_servers=self.bootstrap_servers,
+                    key_serializer=str.encode,
+                    value_serializer=lambda v: json.dumps(v, separators=(",", ":")).encode(),
+                    acks="all",
+                    linger_ms=self.linger_ms,
+                    max_block_ms=self.max_block_ms,
+                )
+            return self._producer
+
+    def _on_error(self, exc):
+        self.failed += 1
+        self.last_error = str(exc)
+
+    def append_many(self, records: list[dict]) -> int:
+        from kafka.errors import KafkaError
+
+        try:
+            producer = self._get_producer()
+            for rec in records:
+                producer.send(self.topic, key=rec["vehicle_id"], value=rec).add_errback(self._on_error)
+        except KafkaError as e:
+            self.last_error = str(e)
+            raise IngestLogError(f"append to {self.topic} failed: {e}") from e
+        self.appended += len(records)
+        return len(records)
+
+    def consumer(self, group: str | None) -> "KafkaLogConsumer":
+        return KafkaLogConsumer(self, group)
+
+    def stats(self) -> dict:
+        return {
+            "kind": "kafka",
+            "topic": self.topic,
+            "appended": self.appended,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
+
+    def close(self):
+        if self._producer is not None:
+            self._producer.flush()
+            self._producer.close()
+
+
+class KafkaLogConsumer:
+    def __init__(self, log: KafkaLog, group: str | None):
+        from kafka import KafkaConsumer
+
+        self.group = group
+        self._consumer = KafkaConsumer(
+            log.topic,
+            bootstrap_servers=log.bootstrap_servers,
+            group_id=group,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+            value_deserializer=json.loads,
+        )
+
+    def poll(self, max_records: int = 500, timeout_s: float = 1.0) -> list[dict]:
+        batches = self._consumer.poll(timeout_ms=int(timeout_s * 1000), max_records=max_records)
+        return [msg.value for messages in batches.values() for msg in messages]
+
+    def commit(self):
+        if self.group is None:
+            return
+        from kafka.errors import KafkaError
+
+        try:
+            self._consumer.commit()
+        except KafkaError as e:
+            raise IngestLogError(f"commit for group {self.group!r} failed: {e}") from e
+
+    def seek_to_beginning(self):
+        # Partitions are assigned on the first poll; make sure there is an assignment to rewind
+        for _ in range(100):
+            if self._consumer.assignment():
+                break
+            self._consumer.poll(timeout_ms=100, max_records=1, update_offsets=False)
+        else:
+            raise IngestLogError(f"no partitions of {self._consumer.subscription()} assigned")
+        self._consumer.seek_to_beginning()
+
+    def stats(self) -> dict:
+        return {"group": self.group, "partitions": len(self._consumer.assignment())}
+
+    def close(self):
+        self._consumer.close(autocommit=False)
+
+
+def open_ingest_log(kind: str, directory: str = "", partitions: int = 8, fsync: bool = False,
+                    bootstrap_servers: str = "localhost:9092", topic: str = "aura.health"):
+    """The log named by `kind` ("segments" or "kafka")."""
+    if kind == "segments":
+        return SegmentLog(directory, partitions=partitions, fsync=fsync)
+    if kind == "kafka":
+        return KafkaLog(bootstrap_servers, topic)
+    raise ValueError(f"Unknown ingest log {kind!r} (expected segments or kafka)")
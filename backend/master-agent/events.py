@@ -0,0 +1,131 @@
+"""
+Server-sent events for dashboards (GET /events).
+
+Handlers publish events as they change state:
+
+    health     a vehicle's new health record
+    severity   a vehicle moved between ok / warning / critical
+    fleet      fleet severity counts after a transition (no vehicle ids)
+    booking    a booking was confirmed
+
+Each event carries one payload per role (`views`), mirroring what that role
+may read over REST: a car owner gets full records for their own vehicle
+only, the service center gets scores and statuses for every vehicle, and
+manufacturing gets fleet aggregates. Roles with no view never see the event.
+
+publish() is called from sync handlers in the threadpool and hands events to
+the event loop. Each view is encoded once per event, not once per
+subscriber, and nothing is built for roles or vehicles with no subscriber
+(`wants`). Each subscriber has a bounded queue. If a client reads too slowly,
+its oldest events are dropped, not blocking ingest; the dashboard
+re-syncs over REST when it reconnects.
+"""
+
+import asyncio
+import threading
+from collections import Counter
+
+import fast_json
+
+
+class Subscription:
+    def __init__(self, role: str, vehicle_id: str | None, max_queue: int):
+        self.role = role
+        self.vehicle_id = vehicle_id
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.dropped = 0
+
+    def offer(self, frame: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+
+def sse_frame(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {fast_json.dumps(data).decode()}\n\n"
+
+
+def _audience(role: str, vehicle_id: str | None) -> tuple[str, str | None]:
+    # Owners are grouped by vehicle, every other role as a whole
+    return ("vehicle", vehicle_id) if role == "user" else ("role", role)
+
+
+class EventHub:
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        # Subscribers by _audience(); only the event loop mutates it, publishers only read
+        self._groups: dict[tuple[str, str | None], set[Subscription]] = {}
+        self._count = 0
+
+        # Counters for the status endpoint
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, role: str, vehicle_id: str | None) -> Subscription:
+        """Register a subscriber; must be called on the event loop."""
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(role, vehicle_id if role == "user" else None, self.max_queue)
+        with self._lock:
+            self._groups.setdefault(_audience(role, sub.vehicle_id), set()).add(sub)
+            self._count += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        key = _audience(sub.role, sub.vehicle_id)
+        with self._lock:
+            group = self._groups.get(key)
+            if not group or sub not in group:
+                return
+            group.discard(sub)
+            if not group:
+                del self._groups[key]
+            self._count -= 1
+            self.dropped += sub.dropped
+
+    def has_subscribers(self) -> bool:
+        return self._count > 0
+
+    def wants(self, role: str, vehicle_id: str | None = None) -> bool:
+        """Whether anyone would receive a `role` view (for "user", of this vehicle)."""
+        return _audience(role, vehicle_id) in self._groups
+
+    def publish(self, events: list[tuple[str, str | None, dict[str, dict]]]):
+        """
+        Queue (event, vehicle_id, {role: payload}) tuples for subscribers.
+        Thread-safe; vehicle_id scopes the "user" view to that vehicle's owner.
+        """
+        if not events or self._loop is None or not self._count:
+            return
+        frames = [
+            (vehicle_id, {role: sse_frame(event, data) for role, data in views.items()})
+            for event, vehicle_id, views in events
+            if views
+        ]
+        self.published += len(frames)
+        try:
+            self._loop.call_soon_threadsafe(self._fanout, frames)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _fanout(self, frames: list[tuple[str | None, dict[str, str]]]):
+        for vehicle_id, by_role in frames:
+            for role, frame in by_role.items():
+                for sub in list(self._groups.get(_audience(role, vehicle_id), ())):
+                    sub.offer(frame)
+                    self.delivered += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            subs = [sub for group in self._groups.values() for sub in group]
+            by_role = Counter(sub.role for sub in subs)
+            return {
+                "subscribers": self._count,
+                "by_role": dict(by_role),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped + sum(sub.dropped for sub in subs),
+            }
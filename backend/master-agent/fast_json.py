@@ -0,0 +1,68 @@
+"""
+JSON encoding for hot paths.
+
+Uses orjson when it is installed (several times faster than the json module
+for both dumps and loads) and falls back to json configured to match it:
+compact separators, UTF-8 rather than ASCII escapes, and dates and datetimes
+as ISO 8601 strings. The one difference left is NaN and Infinity, which
+orjson writes as null and the fallback rejects with ValueError.
+
+Records are encoded once, on write. LatestStateStore and the shared
+backends keep each vehicle's record as JSON bytes, and read endpoints splice
+those bytes into their responses with Raw and JSONBytesResponse. FastAPI's
+default path would instead walk the object with jsonable_encoder and encode
+it again on every request.
+"""
+
+import datetime as dt
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (dt.date, dt.time)):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, allow_nan=False, default=_default).encode()
+
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Raw:
+    """Already-encoded JSON, inserted verbatim by encode_object()."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def encode_object(fields: dict) -> bytes:
+    """A JSON object whose values are Raw fragments or anything dumps() accepts."""
+    return b"{" + b",".join(
+        dumps(key) + b":" + (value.data if isinstance(value, Raw) else dumps(value)) for key, value in fields.items()
+    ) + b"}"
+
+
+class JSONBytesResponse(Response):
+    """A JSON response whose body is `content` if it is bytes, else encode_object(content)."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else encode_object(content)
@@ -0,0 +1,252 @@
+"""
+Group-commit writer for health_snapshots.
+
+`/store_health` used to run one INSERT and one commit per reading, so every
+reading paid a full WAL flush. Handlers now hand rows to HealthWriter, and a
+background thread writes whatever has accumulated with a single COPY and
+a single commit. It flushes when `max_batch` rows are waiting or `flush_ms`
+after the first row arrived.
+
+Durability:
+  - submit() returns a Future that resolves once the transaction holding the
+    rows has committed (or fails with the database error). Callers that need
+    a durable ack (`?sync=true`) wait on it.
+  - Callers that don't wait get an ack when the row is buffered. Rows still
+    in the buffer are lost if the master crashes before the next flush.
+  - The buffer holds at most `max_buffer` rows; submit() returns None when
+    it is full so the caller can answer 503 instead of growing memory.
+
+created_at keeps its column default, NOW(), which Postgres fixes when the
+flush transaction starts: it is the flush time (normally at most `flush_ms`
+after the row was accepted; later if the batch was retried), the same for
+every row of a batch, and not the commit time. Batches flushed by other
+master processes can commit in a different order than their created_at.
+The keyset pager in history.py only relies on (created_at, id) being unique
+and never changing once a row is visible, so paging never repeats or skips a
+row; rows committed after the first page was read may fall on either side of
+the cursor.
+
+The same transaction upserts each vehicle's newest row of the batch into
+vehicle_latest (created by setup_db.py, or migrate_add_vehicle_latest.py on
+older databases), the read model behind /vehicles and /mfg/summary, so it
+never disagrees with the history. Without either table every flush would
+fail, so the master calls check_schema() at startup and refuses to start.
+
+A batch that fails with a transient error (connection lost, pool busy) is
+retried with backoff. A batch rejected by Postgres (bad data) is retried one
+submission at a time, so only the offending submission fails.
+"""
+
+import io
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+
+import db
+
+COPY_SQL = """
+COPY health_snapshots (vehicle_id, anomaly_score, subsystems, sensor_snapshot)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+UPSERT_LATEST_SQL = """
+INSERT INTO vehicle_latest (vehicle_id, anomaly_score, subsystems, updated_at)
+VALUES %s
+ON CONFLICT (vehicle_id) DO UPDATE
+SET anomaly_score = EXCLUDED.anomaly_score,
+    subsystems = EXCLUDED.subsystems,
+    updated_at = EXCLUDED.updated_at
+"""
+
+# Read nothing; fail if a table or column _store writes is missing
+CHECK_SCHEMA_SQL = (
+    "SELECT vehicle_id, anomaly_score, subsystems, sensor_snapshot FROM health_snapshots LIMIT 0",
+    "SELECT vehicle_id, anomaly_score, subsystems, updated_at FROM vehicle_latest LIMIT 0",
+)
+
+# Connection-level failures worth retrying; anything else is a problem with the rows
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, db.PoolTimeout)
+
+
+def _csv_text(value: str | None) -> str:
+    # Unquoted empty = NULL in COPY csv; quoted "" = empty string
+    if value is None:
+        return ""
+    return '"' + value.replace('"', '""') + '"'
+
+
+class HealthWriter:
+    def __init__(
+        self,
+        max_buffer: int = 100_000,
+        max_batch: int = 5_000,
+        flush_ms: float = 50.0,
+        max_attempts: int = 5,
+        backoff_base_s: float = 0.1,
+        backoff_max_s: float = 2.0,
+    ):
+        self.max_buffer = max_buffer
+        self.max_batch = max_batch
+        self.flush_s = flush_ms / 1000.0
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+
+        # Submissions: (rows, future); `_buffered` counts rows across them
+        self._queue: deque = deque()
+        self._buffered = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        # Counters for the status endpoint
+        self.rows_written = 0
+        self.batches_written = 0
+        self.retries = 0
+        self.failed_rows = 0
+        self.rejected_rows = 0
+        self.last_flush_ms = 0.0
+        self.last_error: str | None = None
+
+        self._thread = threading.Thread(target=self._run, name="health-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows: list[tuple]) -> Future | None:
+        """
+        Buffer rows of (vehicle_id, anomaly_score, subsystems_json, sensor_snapshot_json).
+        All-or-nothing: returns None if the buffer lacks room, else a Future
+        that resolves to len(rows) once they are committed.
+        """
+        fut: Future = Future()
+        with self._cond:
+            if self._stopped or self._buffered + len(rows) > self.max_buffer:
+                self.rejected_rows += len(rows)
+                return None
+            self._queue.append((rows, fut))
+            self._buffered += len(rows)
+            self._cond.notify()
+        return fut
+
+    def check_schema(self):
+        """Raise RuntimeError if the tables _store writes are missing (setup_db.py not run)."""
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    for sql in CHECK_SCHEMA_SQL:
+                        cur.execute(sql)
+                except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn) as e:
+                    raise RuntimeError(
+                        f"health writer cannot store rows, run setup_db.py and the migrations: {e}"
+                    ) from e
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self._buffered,
+            "max_buffer": self.max_buffer,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "avg_batch_rows": round(self.rows_written / self.batches_written, 1) if self.batches_written else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "retries": self.retries,
+            "failed_rows": self.failed_rows,
+            "rejected_rows": self.rejected_rows,
+            "last_error": self.last_error,
+        }
+
+    def stop(self, flush_timeout_s: float = 5.0):
+        """Stop accepting rows and try to flush what is buffered."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout=flush_timeout_s)
+
+    def _take_batch(self) -> list[tuple[list[tuple], Future]]:
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            # Give concurrent writers `flush_ms` to join this commit
+            deadline = time.monotonic() + self.flush_s
+            while self._buffered < self.max_batch and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+
+            items, n = [], 0
+            while self._queue and n < self.max_batch:
+                rows, fut = self._queue.popleft()
+                items.append((rows, fut))
+                n += len(rows)
+            self._buffered -= n
+            return items
+
+    def _store(self, rows: list[tuple]):
+        buf = io.StringIO()
+        for vehicle_id, anomaly_score, subsystems, sensor_snapshot in rows:
+            buf.write(
+                f"{_csv_text(vehicle_id)},{float(anomaly_score)!r},{_csv_text(subsystems)},{_csv_text(sensor_snapshot)}\n"
+            )
+        buf.seek(0)
+        # Rows are in arrival order, so the last one per vehicle is its latest
+        latest = {row[0]: row[:3] for row in rows}
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.copy_expert(COPY_SQL, buf)
+                psycopg2.extras.execute_values(
+                    cur,
+                    UPSERT_LATEST_SQL,
+                    list(latest.values()),
+                    template="(%s, %s, %s, NOW())",
+                    page_size=len(latest),
+                )
+            conn.commit()
+
+    def _write(self, items: list[tuple[list[tuple], Future]]) -> bool:
+        """Write items in one transaction, retrying transient errors. False if Postgres rejected the rows."""
+        rows = [row for item_rows, _ in items for row in item_rows]
+        delay = self.backoff_base_s
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                start = time.monotonic()
+                self._store(rows)
+                self.last_flush_ms = (time.monotonic() - start) * 1000.0
+                self.rows_written += len(rows)
+                self.batches_written += 1
+                for item_rows, fut in items:
+                    fut.set_result(len(item_rows))
+                return True
+            except TRANSIENT_ERRORS as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if attempt == self.max_attempts:
+                    break
+                self.retries += 1
+                time.sleep(delay)
+                delay = min(self.backoff_max_s, delay * 2)
+            except Exception as e:
+                # Rejected rows (or a bug building the COPY payload): retrying as-is won't help
+                self.last_error = f"{type(e).__name__}: {e}"
+                if len(items) == 1:
+                    break
+                return False
+
+        print(f"Dropping {len(rows)} health records: {self.last_error}")
+        self.failed_rows += len(rows)
+        for _, fut in items:
+            fut.set_exception(RuntimeError(self.last_error))
+        return True
+
+    def _run(self):
+        while True:
+            items = self._take_batch()
+            if not items:
+                return
+            if not self._write(items):
+                # Isolate the submission Postgres rejected
+                for item in items:
+                    self._write([item])
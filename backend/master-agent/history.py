@@ -0,0 +1,171 @@
+"""
+Health history queries behind GET /history.
+
+Two modes:
+
+  - pages: raw snapshots in [start, end), newest first, with keyset
+    pagination on (created_at, id). The cursor names the last row returned,
+    so every page is an index range scan no matter how deep it is.
+  - charts (`points=N`): the whole range reduced to at most N points with
+    Largest-Triangle-Three-Buckets, which keeps spikes and the overall shape
+    better than striding. The series is read at a resolution that matches the
+    span (raw rows, or the 1-minute / 1-hour rollups from
+    snapshot_maintenance), so a week-long chart reads about 10k rollup
+    rows, not 300k snapshots.
+
+Rollups trail ingest by up to a couple of minutes (rollup lag + maintenance
+interval), so the newest point of a rollup-backed chart can be that old.
+
+Raw rows of days moved to the cold archive (cold_archive.py) are read from
+there: pages continue into it once the database runs out of older rows, and
+raw charts merge both tiers. Rollups stay in the database.
+"""
+
+import datetime as dt
+
+import numpy as np
+
+# Largest span served from each source when downsampling (about 10k rows per vehicle)
+RAW_MAX_SPAN = dt.timedelta(hours=6)
+ROLLUP_1M_MAX_SPAN = dt.timedelta(days=7)
+
+DEFAULT_CHART_SPAN = dt.timedelta(days=1)
+
+PAGE_SQL = """
+SELECT id, anomaly_score, subsystems, created_at
+FROM health_snapshots
+WHERE vehicle_id = %(vehicle_id)s
+  AND created_at >= COALESCE(%(start)s, '-infinity'::timestamp)
+  AND created_at < COALESCE(%(end)s, 'infinity'::timestamp)
+  AND (%(after_ts)s IS NULL OR (created_at, id) < (%(after_ts)s, %(after_id)s))
+ORDER BY created_at DESC, id DESC
+LIMIT %(limit)s
+"""
+
+SERIES_SQL = {
+    "raw": """
+        SELECT created_at, anomaly_score, subsystems, NULL, NULL, 1
+        FROM health_snapshots
+        WHERE vehicle_id = %(vehicle_id)s AND created_at >= %(start)s AND created_at < %(end)s
+        ORDER BY created_at, id
+    """,
+    "1m": """
+        SELECT bucket, mean_score, subsystem_means, min_score, max_score, samples
+        FROM health_rollup_1m
+        WHERE vehicle_id = %(vehicle_id)s AND bucket >= %(start)s AND bucket < %(end)s
+        ORDER BY bucket
+    """,
+    "1h": """
+        SELECT bucket, mean_score, subsystem_means, min_score, max_score, samples
+        FROM health_rollup_1h
+        WHERE vehicle_id = %(vehicle_id)s AND bucket >= %(start)s AND bucket < %(end)s
+        ORDER BY bucket
+    """,
+}
+
+
+def as_local(ts: dt.datetime | None) -> dt.datetime | None:
+    """Timestamps are stored as local TIMESTAMP; convert aware inputs to match."""
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone().replace(tzinfo=None)
+
+
+def encode_cursor(created_at: dt.datetime, row_id: int) -> str:
+    return f"{created_at.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[dt.datetime, int]:
+    """Inverse of encode_cursor; ValueError if it was not produced by it."""
+    ts, _, row_id = cursor.rpartition("_")
+    return dt.datetime.fromisoformat(ts), int(row_id)
+
+
+def fetch_page(cur, vehicle_id, start, end, after, limit, cold=None) -> tuple[list[dict], str | None]:
+    """
+    One page, oldest first, and the cursor for the next (older) page or None.
+    `after` is a decoded cursor: only rows older than it are returned.
+    `cold` is the ColdArchive holding days no longer in the database, if any.
+    """
+    after_ts, after_id = after or (None, None)
+    cur.execute(
+        PAGE_SQL,
+        {
+            "vehicle_id": vehicle_id,
+            "start": start,
+            "end": end,
+            "after_ts": after_ts,
+            "after_id": after_id,
+            "limit": limit,
+        },
+    )
+    rows = cur.fetchall()
+    if cold is not None and len(rows) < limit:
+        # Archived days are older than every row still in the database
+        before = (rows[-1][3], rows[-1][0]) if rows else after
+        rows += cold.page(vehicle_id, start, end, before, limit - len(rows))
+    next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+    points = [
+        {"anomaly_score": score, "subsystems": subsystems, "timestamp": created_at.isoformat()}
+        for _, score, subsystems, created_at in reversed(rows)
+    ]
+    return points, next_cursor
+
+
+def series_source(span: dt.timedelta) -> str:
+    if span <= RAW_MAX_SPAN:
+        return "raw"
+    return "1m" if span <= ROLLUP_1M_MAX_SPAN else "1h"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the n points Largest-Triangle-Three-Buckets keeps (first and last always)."""
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1][:n])
+
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    # n - 2 buckets over the interior points; bucket i is [edges[i], edges[i + 1])
+    edges = (np.arange(n - 1) * ((size - 2) / (n - 2))).astype(np.int64) + 1
+    edges[-1] = size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < n - 1 else (size - 1, size)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def fetch_series(cur, vehicle_id, start, end, points, cold=None) -> tuple[list[dict], str]:
+    """[start, end) downsampled to at most `points` points, oldest first, and the source used."""
+    source = series_source(end - start)
+    cur.execute(SERIES_SQL[source], {"vehicle_id": vehicle_id, "start": start, "end": end})
+    rows = cur.fetchall()
+    if source == "raw" and cold is not None:
+        # Archived days are older than the database's rows; a day is briefly in
+        # both tiers (archived, partition not yet dropped), so only take older rows
+        hot_from = rows[0][0] if rows else end
+        rows = [
+            (created_at, score, subsystems, None, None, 1)
+            for _, score, subsystems, created_at in cold.series(vehicle_id, start, min(end, hot_from))
+        ] + rows
+    if not rows:
+        return [], source
+
+    x = np.array([row[0].timestamp() for row in rows])
+    y = np.array([row[1] for row in rows], dtype=np.float64)
+    out = []
+    for i in lttb(x, y, points).tolist():
+        ts, score, subsystems, min_score, max_score, samples = rows[i]
+        point = {"anomaly_score": score, "subsystems": subsystems, "timestamp": ts.isoformat()}
+        if source != "raw":
+            point.update(min_score=min_score, max_score=max_score, samples=samples)
+        out.append(point)
+    return out, source
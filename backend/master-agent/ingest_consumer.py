@@ -0,0 +1,106 @@
+"""
+Consumer of the ingest log (ingest_log.py) that drives health storage.
+
+When the data-agent writes to the ingest log instead of POSTing
+/store_health_batch, this thread reads the log in batches of up to
+`max_batch` records and passes each batch to `handler`, which stores it the
+same way /store_health_batch?sync=true does. Offsets are committed only
+after the handler returns, i.e. after the rows are committed. If the master
+stops in between, the batch is delivered again on restart, so history can
+hold a duplicate row but never misses one.
+
+A handler error (DB down, write buffer full) keeps the batch and retries it
+with backoff; the log simply grows meanwhile. The handler returns the number
+of records it skipped as invalid, which are committed past rather than
+retried forever.
+
+With a segment log only one process per group consumes at a time. Other
+master workers wait, and take over if that process exits.
+"""
+
+import threading
+import time
+
+from ingest_log import IngestLogBusy
+
+
+class IngestConsumer:
+    def __init__(
+        self,
+        log,
+        group: str,
+        handler,
+        max_batch: int = 2000,
+        poll_timeout_s: float = 1.0,
+        backoff_base_s: float = 0.2,
+        backoff_max_s: float = 10.0,
+    ):
+        self.log = log
+        self.group = group
+        self.handler = handler
+        self.max_batch = max_batch
+        self.poll_timeout_s = poll_timeout_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._consumer = None
+        self._stop = threading.Event()
+
+        # Counters for the status endpoint
+        self.consumed = 0
+        self.batches = 0
+        self.invalid = 0
+        self.retries = 0
+        self.last_error: str | None = None
+
+        self._thread = threading.Thread(target=self._run, name="ingest-consumer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._consumer is None:
+            try:
+                self._consumer = self.log.consumer(self.group)
+            except IngestLogBusy:
+                # Another worker is consuming this group; take over when it goes away
+                if self._stop.wait(self.poll_timeout_s):
+                    return
+
+        batch: list[dict] = []
+        delay = self.backoff_base_s
+        while not self._stop.is_set():
+            try:
+                if not batch:
+                    batch = self._consumer.poll(self.max_batch, self.poll_timeout_s)
+                    if not batch:
+                        continue
+                self.invalid += self.handler(batch)
+                self._consumer.commit()
+            except Exception as e:
+                self.retries += 1
+                self.last_error = str(e)
+                print(f"Ingest batch of {len(batch)} records failed, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(self.backoff_max_s, delay * 2)
+                continue
+            self.consumed += len(batch)
+            self.batches += 1
+            batch = []
+            delay = self.backoff_base_s
+        self._consumer.close()
+
+    def stats(self) -> dict:
+        return {
+            "group": self.group,
+            "active": self._consumer is not None,
+            "log": self.log.stats(),
+            "consumer": self._consumer.stats() if self._consumer is not None else None,
+            "consumed": self.consumed,
+            "batches": self.batches,
+            "invalid": self.invalid,
+            "retries": self.retries,
+            "last_error": self.last_error,
+        }
+
+    def stop(self, timeout_s: float = 5.0):
+        self._stop.set()
+        self._thread.join(timeout=timeout_s)
+        self.log.close()
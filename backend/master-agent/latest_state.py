@@ -0,0 +1,411 @@
+"""
+Latest health per vehicle, as a struct of arrays.
+
+Each vehicle gets a row index (grown by doubling as new vehicles appear):
+
+    anomaly, rule, ml   (capacity,) float64        combined / rule / ML scores, NaN = not sent
+    subsystems          (capacity, n_subsystems)   one column per subsystem name seen so far
+    label               (capacity,) int16          index into `labels` (ml_label), -1 = none
+    updated_at          (capacity,) float64        when the master accepted the record (epoch s)
+
+Ingest overwrites a row in place, and fleet-wide reads (scores for a list of
+vehicles, severity counts) are NumPy operations over the columns, with no
+per-vehicle JSON parsing. Subsystem columns are added on first sight, so
+renamed or new subsystems from the data-agent's rules need no change here.
+
+Fleet statistics are maintained on ingest rather than computed on read: a
+count of vehicles per severity level, adjusted only when a vehicle changes
+level, and a ScoreHistogram of the current combined and per-subsystem
+scores. A vehicle's old score is removed when its new one is added, so the
+quantiles describe the fleet as it is now, not every reading ever received.
+Reads cost O(bins), independent of fleet size. The histograms have a fixed
+range, so an outlying subsystem score cannot grow them; update_many rejects
+a batch with a NaN or infinite score before changing any counter.
+
+Each row also has a version, bumped whenever anything derived from that
+vehicle may have changed (a new record, or its rows committing to history).
+Together with `epoch` (unique per store) it makes a cheap ETag.
+
+GET /health returns the full record, raw sensor_snapshot and temporal blocks
+included, as JSON text. update_many encodes it once (encode_health) and keeps
+the bytes in a side list, so reads serve them without re-encoding, unless
+keep_detail=False, which drops the raw blocks and encodes on read.
+
+This store lives in one process. state_backends.py shares the same interface
+across worker processes and replicas (Redis, or a file for tests).
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+import fast_json
+
+# Severity thresholds on the combined anomaly score
+CRITICAL_THRESHOLD = 0.3
+WARNING_THRESHOLD = 0.18
+SEVERITY_LEVELS = ["ok", "warning", "critical", "unknown"]
+# Bin width of the score histograms
+HISTOGRAM_RESOLUTION = 0.001
+# Scores at or above this share one overflow bin (subsystem ramps are uncapped)
+HISTOGRAM_MAX = 4.0
+# VehicleHealth fields, in model order
+RECORD_FIELDS = (
+    "vehicle_id",
+    "anomaly_score",
+    "subsystems",
+    "sensor_snapshot",
+    "ml_anomaly_score",
+    "ml_label",
+    "rule_anomaly_score",
+    "temporal",
+)
+
+
+def severity_codes(scores: np.ndarray) -> np.ndarray:
+    """Index into SEVERITY_LEVELS for each score; NaN (no data) is "unknown"."""
+    codes = np.where(scores > CRITICAL_THRESHOLD, 2, np.where(scores > WARNING_THRESHOLD, 1, 0))
+    return np.where(np.isnan(scores), 3, codes)
+
+
+def severity_code(score: float | None) -> int:
+    """Scalar severity_codes, for per-record paths."""
+    if score is None or score != score:
+        return 3
+    if score > CRITICAL_THRESHOLD:
+        return 2
+    return 1 if score > WARNING_THRESHOLD else 0
+
+
+def severity(score: float | None) -> str:
+    return SEVERITY_LEVELS[severity_code(score)]
+
+
+def check_scores(record: dict):
+    """Raise ValueError if a record's combined or subsystem score is NaN or infinite."""
+    scores = [record["anomaly_score"], *(record.get("subsystems") or {}).values()]
+    if not all(math.isfinite(v) for v in scores):
+        raise ValueError(f"non-finite score for {record['vehicle_id']}: {scores}")
+
+
+def encode_health(record: dict) -> bytes:
+    """
+    The "health" value of GET /health for a record: its VehicleHealth fields
+    as JSON text, itself encoded as a JSON string.
+    """
+    return fast_json.dumps(fast_json.dumps({f: record.get(f) for f in RECORD_FIELDS}).decode())
+
+
+def decode_health(fragment: bytes) -> dict:
+    return fast_json.loads(fast_json.loads(fragment))
+
+
+class ScoreHistogram:
+    """
+    Fixed-width bins over [0, max_value) plus an overflow bin, supporting
+    removal, so a quantile can follow a population whose members change
+    value. Quantiles are accurate to +/- resolution / 2 below max_value;
+    negative scores count in the first bin, scores at or above max_value in
+    the overflow bin, whose quantiles report max_value. Values must be finite.
+    """
+
+    def __init__(self, resolution: float = HISTOGRAM_RESOLUTION, max_value: float = HISTOGRAM_MAX):
+        self.resolution = resolution
+        self.max_value = max_value
+        self.overflow = int(round(max_value / resolution))
+        self.counts = np.zeros(self.overflow + 1, dtype=np.int64)
+        self.total = 0
+
+    @classmethod
+    def from_bins(cls, bins: dict[int, int], resolution: float = HISTOGRAM_RESOLUTION) -> "ScoreHistogram":
+        """A histogram from {bin index: count}, e.g. as kept by a shared backend."""
+        hist = cls(resolution)
+        if bins:
+            idx = np.fromiter(bins.keys(), dtype=np.int64, count=len(bins))
+            np.add.at(hist.counts, np.clip(idx, 0, hist.overflow), np.fromiter(bins.values(), dtype=np.int64, count=len(bins)))
+            hist.total = int(hist.counts.sum())
+        return hist
+
+    def _bin(self, value: float) -> int:
+        if value >= self.max_value:
+            return self.overflow
+        return max(int(value / self.resolution), 0)
+
+    def add(self, value: float):
+        idx = self._bin(value)
+        self.counts[idx] += 1
+        self.total += 1
+
+    def remove(self, value: float):
+        idx = self._bin(value)
+        self.counts[idx] -= 1
+        self.total -= 1
+
+    def bins(self) -> dict[int, int]:
+        """Non-empty bins as {bin index: count}."""
+        nonzero = np.flatnonzero(self.counts)
+        return dict(zip(nonzero.tolist(), self.counts[nonzero].tolist()))
+
+    def quantiles(self, qs: tuple[float, ...]) -> list[float | None]:
+        """Nearest-rank quantiles (bin centres); None while empty."""
+        if self.total == 0:
+            return [None] * len(qs)
+        cum = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(np.asarray(qs) * self.total), 1)
+        bins = np.searchsorted(cum, ranks)
+        return [min(round((b + 0.5) * self.resolution, 6), self.max_value) for b in bins.tolist()]
+
+
+class LatestStateStore:
+    def __init__(self, initial_capacity: int = 1024, keep_detail: bool = True):
+        self.keep_detail = keep_detail
+        self._index: dict[str, int] = {}
+        self.vehicle_ids: list[str] = []
+        self._lock = threading.Lock()
+
+        self.anomaly = np.full(initial_capacity, np.nan)
+        self.rule = np.full(initial_capacity, np.nan)
+        self.ml = np.full(initial_capacity, np.nan)
+        self.updated_at = np.zeros(initial_capacity)
+        self.version = np.zeros(initial_capacity, dtype=np.int64)
+        self.epoch = f"{time.time_ns():x}"
+        self.label = np.full(initial_capacity, -1, dtype=np.int16)
+        self.labels: list[str] = []
+        self._label_codes: dict[str, int] = {}
+        self.subsystem_names: list[str] = []
+        self._subsystem_cols: dict[str, int] = {}
+        self.subsystems = np.full((initial_capacity, 0), np.nan)
+        # encode_health() bytes per row (None with keep_detail=False)
+        self.details: list[bytes | None] = []
+
+        # Fleet statistics, maintained by update_many
+        self.severity_totals = np.zeros(len(SEVERITY_LEVELS), dtype=np.int64)
+        self.anomaly_hist = ScoreHistogram()
+        self.subsystem_hists: list[ScoreHistogram] = []
+
+    def __len__(self):
+        return len(self.vehicle_ids)
+
+    def __getstate__(self):
+        # Picklable for FileLatestState (state_backends.py); the lock stays per process
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __contains__(self, vehicle_id: str):
+        return vehicle_id in self._index
+
+    def _grow(self, needed: int):
+        capacity = self.anomaly.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+
+        def grown(arr, fill):
+            out = np.full((new_capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            out[:capacity] = arr
+            return out
+
+        self.anomaly = grown(self.anomaly, np.nan)
+        self.rule = grown(self.rule, np.nan)
+        self.ml = grown(self.ml, np.nan)
+        self.updated_at = grown(self.updated_at, 0.0)
+        self.version = grown(self.version, 0)
+        self.label = grown(self.label, -1)
+        self.subsystems = grown(self.subsystems, np.nan)
+
+    def _slot(self, vehicle_id: str) -> int:
+        slot = self._index.get(vehicle_id)
+        if slot is None:
+            slot = len(self.vehicle_ids)
+            self._index[vehicle_id] = slot
+            self.vehicle_ids.append(vehicle_id)
+            self.details.append(None)
+            self._grow(slot + 1)
+        return slot
+
+    def _subsystem_col(self, name: str) -> int:
+        col = self._subsystem_cols.get(name)
+        if col is None:
+            col = len(self.subsystem_names)
+            self._subsystem_cols[name] = col
+            self.subsystem_names.append(name)
+            self.subsystems = np.concatenate([self.subsystems, np.full((self.subsystems.shape[0], 1), np.nan)], axis=1)
+            self.subsystem_hists.append(ScoreHistogram())
+        return col
+
+    def _label_code(self, label: str | None) -> int:
+        if label is None:
+            return -1
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def update_many(self, records: list[dict], now: float | None = None) -> list[tuple[str, str | None, str]]:
+        """
+        Apply health records (VehicleHealth fields as a dict) in order; for a
+        vehicle that appears more than once, the last record wins. A record's
+        "updated_at" (epoch s) overrides `now`, e.g. when loading from the DB.
+
+        Returns the severity transitions as (vehicle_id, old level or None
+        for a new vehicle, new level). Raises ValueError, changing nothing,
+        if any record has a NaN or infinite score.
+        """
+        now = time.time() if now is None else now
+        for rec in records:
+            check_scores(rec)
+        transitions = []
+        with self._lock:
+            for rec in records:
+                known = rec["vehicle_id"] in self._index
+                slot = self._slot(rec["vehicle_id"])
+                old_level = self._retract(slot) if known else None
+                self.anomaly[slot] = rec["anomaly_score"]
+                self.rule[slot] = np.nan if rec.get("rule_anomaly_score") is None else rec["rule_anomaly_score"]
+                self.ml[slot] = np.nan if rec.get("ml_anomaly_score") is None else rec["ml_anomaly_score"]
+                self.label[slot] = self._label_code(rec.get("ml_label"))
+                self.updated_at[slot] = rec.get("updated_at", now)
+                self.version[slot] += 1
+                self.subsystems[slot] = np.nan
+                for name, value in (rec.get("subsystems") or {}).items():
+                    col = self._subsystem_col(name)  # may widen self.subsystems
+                    self.subsystems[slot, col] = value
+                level = self._count(slot, old_level)
+                if level != old_level:
+                    transitions.append((rec["vehicle_id"], None if old_level is None else SEVERITY_LEVELS[old_level], SEVERITY_LEVELS[level]))
+                if self.keep_detail:
+                    self.details[slot] = encode_health(rec)
+        return transitions
+
+    def _retract(self, slot: int) -> int:
+        """Take a row's current scores out of the histograms before it is overwritten; returns its severity code."""
+        old = self.anomaly[slot].item()
+        if old == old:
+            self.anomaly_hist.remove(old)
+        for col, value in enumerate(self.subsystems[slot].tolist()):
+            if value == value:
+                self.subsystem_hists[col].remove(value)
+        return severity_code(old)
+
+    def _count(self, slot: int, old_level: int | None) -> int:
+        new = self.anomaly[slot].item()
+        level = severity_code(new)
+        # Severity counters only move when a vehicle changes level
+        if level != old_level:
+            if old_level is not None:
+                self.severity_totals[old_level] -= 1
+            self.severity_totals[level] += 1
+        if new == new:
+            self.anomaly_hist.add(new)
+        for col, value in enumerate(self.subsystems[slot].tolist()):
+            if value == value:
+                self.subsystem_hists[col].add(value)
+        return level
+
+    def update(self, record: dict, now: float | None = None) -> list[tuple[str, str | None, str]]:
+        return self.update_many([record], now)
+
+    def get(self, vehicle_id: str) -> dict | None:
+        """Latest record for one vehicle with the VehicleHealth fields, or None."""
+        with self._lock:
+            slot = self._index.get(vehicle_id)
+            if slot is None:
+                return None
+            row = self.subsystems[slot].tolist()
+            code = int(self.label[slot])
+            detail = decode_health(self.details[slot]) if self.details[slot] is not None else {}
+            rule = self.rule[slot].item()
+            ml = self.ml[slot].item()
+            return {
+                "vehicle_id": vehicle_id,
+                "anomaly_score": self.anomaly[slot].item(),
+                "subsystems": {name: v for name, v in zip(self.subsystem_names, row) if v == v},
+                "sensor_snapshot": detail.get("sensor_snapshot"),
+                "ml_anomaly_score": None if ml != ml else ml,
+                "ml_label": self.labels[code] if code >= 0 else None,
+                "rule_anomaly_score": None if rule != rule else rule,
+                "temporal": detail.get("temporal"),
+                "updated_at": self.updated_at[slot].item(),
+            }
+
+    def health_fragment(self, vehicle_id: str) -> bytes | None:
+        """encode_health() of the latest record, as stored on write; None if never seen."""
+        with self._lock:
+            slot = self._index.get(vehicle_id)
+            if slot is None:
+                return None
+            fragment = self.details[slot]
+        return fragment if fragment is not None else encode_health(self.get(vehicle_id))
+
+    def touch(self, vehicle_ids):
+        """Bump the version of vehicles whose other data (e.g. history) changed."""
+        with self._lock:
+            for vid in vehicle_ids:
+                slot = self._index.get(vid)
+                if slot is not None:
+                    self.version[slot] += 1
+
+    def version_of(self, vehicle_id: str) -> int:
+        """Current version of a vehicle; 0 if it has never reported."""
+        with self._lock:
+            slot = self._index.get(vehicle_id)
+            return 0 if slot is None else int(self.version[slot])
+
+    def anomaly_score(self, vehicle_id: str) -> float | None:
+        with self._lock:
+            slot = self._index.get(vehicle_id)
+            return None if slot is None else self.anomaly[slot].item()
+
+    def anomaly_scores(self, vehicle_ids: list[str]) -> np.ndarray:
+        """Combined scores for `vehicle_ids` in order; NaN for vehicles never seen."""
+        with self._lock:
+            slots = np.fromiter((self._index.get(v, -1) for v in vehicle_ids), dtype=np.int64, count=len(vehicle_ids))
+            scores = self.anomaly[np.where(slots >= 0, slots, 0)] if len(self.vehicle_ids) else np.full(len(slots), np.nan)
+        return np.where(slots >= 0, scores, np.nan)
+
+    def severity_counts(self) -> dict[str, int]:
+        """Vehicles per severity level across the whole fleet."""
+        with self._lock:
+            counts = self.severity_totals.tolist()
+        return dict(zip(SEVERITY_LEVELS, counts))
+
+    def score_quantiles(self, qs: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict:
+        """Current fleet quantiles of the combined score and of each subsystem score."""
+
+        def named(hist: ScoreHistogram) -> dict:
+            return {f"p{round(q * 100, 1):g}": v for q, v in zip(qs, hist.quantiles(qs))}
+
+        with self._lock:
+            return {
+                "anomaly_score": named(self.anomaly_hist),
+                "subsystems": {name: named(h) for name, h in zip(self.subsystem_names, self.subsystem_hists)},
+            }
+
+    def score_histograms(self) -> dict:
+        """The histograms behind score_quantiles as sparse bins, for merging across shards (sharding.py)."""
+        with self._lock:
+            return {
+                "resolution": HISTOGRAM_RESOLUTION,
+                "max": HISTOGRAM_MAX,
+                "anomaly_score": self.anomaly_hist.bins(),
+                "subsystems": {name: h.bins() for name, h in zip(self.subsystem_names, self.subsystem_hists)},
+            }
+
+    def stats(self) -> dict:
+        arrays = (self.anomaly, self.rule, self.ml, self.updated_at, self.version, self.label, self.subsystems)
+        return {
+            "backend": "memory",
+            "vehicles": len(self.vehicle_ids),
+            "capacity": int(self.anomaly.shape[0]),
+            "subsystems": list(self.subsystem_names),
+            "array_bytes": int(sum(a.nbytes for a in arrays)),
+            "keep_detail": self.keep_detail,
+        }
@@ -1,18 +1,46 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
-from fastapi.security import HTTPBearer
-from pydantic import BaseModel
-import psycopg2
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, ValidationError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import asyncio
 import json
-from typing import List, Optional
+import os
+import time
+import psycopg2
+import sys
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
 import jwt
 import hashlib
 
+# Shared backend modules (db, snapshot_maintenance) live one directory up
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import db
+import history as history_queries
+from cold_archive import ColdArchive
+from events import EventHub
+from fast_json import JSONBytesResponse, Raw, encode_object
+import fast_json
+from health_writer import HealthWriter
+from ingest_consumer import IngestConsumer
+from ingest_log import open_ingest_log
+from latest_state import SEVERITY_LEVELS, severity, severity_codes
+from sharding import HashRing, shard_suffix
+from snapshot_maintenance import SnapshotMaintenance
+from state_backends import open_latest_state
+from token_cache import TokenCache
+
 # JWT configuration
 JWT_SECRET = "aura_secret_key_change_in_production"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRY_HOURS = 24
+# Verified tokens are remembered for up to AUTH_CACHE_TTL_S (never past their exp)
+TOKEN_CACHE = TokenCache(
+    max_entries=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl_s=float(os.getenv("AUTH_CACHE_TTL_S", "300")),
+)
 
 app = FastAPI(title="AURA Master Agent - Prototype v0")
 
@@ -24,13 +52,181 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-store: dict[str, str] = {}
+# This master's shard in a sharded deployment (see sharding.py): it only
+# accepts vehicles the ring assigns to SHARD_INDEX. SHARD_COUNT=1 is unsharded.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_RING = HashRing(SHARD_COUNT)
+# Keeps shards apart when they share a Redis server or an ingest log
+SHARD_SUFFIX = shard_suffix(SHARD_COUNT, SHARD_INDEX)
+
+# Latest health per vehicle (see latest_state.py); sensor snapshots are kept
+# only for GET /health and can be dropped at fleet scale. "memory" is private
+# to this process; run more than one worker or replica with "redis" (or
+# "file" on one host) so they all see the same state (see state_backends.py)
+LATEST_STATE = open_latest_state(
+    os.getenv("LATEST_STATE_BACKEND", "memory"),
+    keep_detail=os.getenv("LATEST_STATE_KEEP_DETAIL", "1") != "0",
+    redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    redis_prefix=os.getenv("LATEST_STATE_REDIS_PREFIX", f"aura:latest{SHARD_SUFFIX}:"),
+    path=os.getenv("LATEST_STATE_FILE", "aura_latest_state.bin"),
+)
+
+# health_snapshots rows are written by a group-commit background writer
+HEALTH_WRITER = HealthWriter(
+    max_buffer=int(os.getenv("HEALTH_WRITER_MAX_BUFFER", "100000")),
+    max_batch=int(os.getenv("HEALTH_WRITER_MAX_BATCH", "5000")),
+    flush_ms=float(os.getenv("HEALTH_WRITER_FLUSH_MS", "50")),
+)
+# How long a ?sync=true request waits for its rows to commit
+HEALTH_SYNC_TIMEOUT_S = float(os.getenv("HEALTH_SYNC_TIMEOUT_S", "10"))
+
+# Push channel for dashboards (GET /events)
+EVENT_HUB = EventHub(max_queue=int(os.getenv("EVENTS_MAX_QUEUE", "1000")))
+EVENTS_HEARTBEAT_S = float(os.getenv("EVENTS_HEARTBEAT_S", "15"))
+
+# Cold tier for raw snapshots: with COLD_ARCHIVE_AFTER_DAYS > 0, days that old
+# move from health_snapshots to columnar files (HEALTH_RETENTION_DAYS then
+# does not apply), and /history reads them from there
+COLD_ARCHIVE_AFTER_DAYS = int(os.getenv("COLD_ARCHIVE_AFTER_DAYS", "0"))
+COLD_ARCHIVE = (
+    ColdArchive(
+        os.getenv(
+            "COLD_ARCHIVE_DIR",
+            os.path.join(os.path.dirname(__file__), "..", "..", "data", f"cold_archive{SHARD_SUFFIX}"),
+        ),
+        fsync=os.getenv("COLD_ARCHIVE_FSYNC", "1") == "1",
+    )
+    if COLD_ARCHIVE_AFTER_DAYS > 0
+    else None
+)
+
+# Daily partitions, rollups and retention for health_snapshots (interval 0
+# disables; it also stops itself until the table is partitioned). Raw
+# partitions are kept unless HEALTH_RETENTION_DAYS is set.
+SNAPSHOT_MAINTENANCE = SnapshotMaintenance(
+    interval_s=float(os.getenv("SNAPSHOT_MAINTENANCE_INTERVAL_S", "60")),
+    retention_days=int(os.getenv("HEALTH_RETENTION_DAYS", "0")),
+    premake_days=int(os.getenv("HEALTH_PARTITION_PREMAKE_DAYS", "3")),
+    rollup_lag_s=float(os.getenv("ROLLUP_LAG_S", "60")),
+    rollup_1m_retention_days=int(os.getenv("ROLLUP_1M_RETENTION_DAYS", "90")),
+    archive=COLD_ARCHIVE,
+    archive_after_days=COLD_ARCHIVE_AFTER_DAYS,
+)
+
+# Durable ingest log written by the data-agent (INGEST_LOG=segments or kafka,
+# same settings as the data-agent). Unset: records arrive only over HTTP.
+# Sharded, each shard has its own log: directory and topic get SHARD_SUFFIX.
+INGEST_LOG = os.getenv("INGEST_LOG", "")
+INGEST = (
+    open_ingest_log(
+        INGEST_LOG,
+        directory=os.getenv("INGEST_LOG_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "ingest_log"))
+        + SHARD_SUFFIX,
+        partitions=int(os.getenv("INGEST_LOG_PARTITIONS", "8")),
+        bootstrap_servers=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+        topic=os.getenv("INGEST_TOPIC", "aura.health") + SHARD_SUFFIX,
+    )
+    if INGEST_LOG
+    else None
+)
+# Started after the latest state is loaded (start_ingest_consumer)
+INGEST_CONSUMER: IngestConsumer | None = None
+
+
+@app.on_event("startup")
+def check_health_schema():
+    # A missing table makes every flush fail; stop here instead of dropping data.
+    # An unreachable database is not fatal (the writer retries once it is back).
+    try:
+        HEALTH_WRITER.check_schema()
+    except (psycopg2.Error, db.PoolTimeout) as e:
+        print(f"Could not check the health tables, database unreachable: {e}")
+
+
+@app.on_event("startup")
+def load_latest_state():
+    """
+    Seed LATEST_STATE from vehicle_latest so fleet statistics survive a
+    restart, or with INGEST_REPLAY_STATE=1 by replaying the ingest log.
+    """
+    if len(LATEST_STATE):
+        # A shared backend already holds newer records than the read model may
+        print(f"Latest state already holds {len(LATEST_STATE)} vehicles, not reloading")
+        return
+    if INGEST is not None and os.getenv("INGEST_REPLAY_STATE", "0") == "1":
+        replay_latest_state()
+        return
+    try:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                # One full read of the read model; can exceed the per-request statement_timeout
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute("SELECT vehicle_id, anomaly_score, subsystems, updated_at FROM vehicle_latest")
+                rows = cur.fetchall()
+    except (psycopg2.Error, db.PoolTimeout) as e:
+        print(f"Starting with empty latest state, could not read vehicle_latest: {e}")
+        return
+    LATEST_STATE.update_many(
+        [
+            {"vehicle_id": vid, "anomaly_score": score, "subsystems": subsystems, "updated_at": updated_at.timestamp()}
+            for vid, score, subsystems, updated_at in rows
+        ]
+    )
+    print(f"Loaded latest state for {len(rows)} vehicles")
+
+
+def replay_latest_state():
+    """Rebuild LATEST_STATE from everything the ingest log retains; history is not rewritten."""
+    consumer = INGEST.consumer(None)
+    try:
+        consumer.seek_to_beginning()
+        replayed = 0
+        while batch := consumer.poll(10_000, 1.0):
+            healths, _ = validate_health_records(batch)
+            LATEST_STATE.update_many(
+                [{**h.model_dump(), "updated_at": rec.get("logged_at", time.time())} for h, rec in healths]
+            )
+            replayed += len(batch)
+    finally:
+        consumer.close()
+    print(f"Replayed {replayed} ingest log records into latest state for {len(LATEST_STATE)} vehicles")
+
+
+@app.on_event("startup")
+def start_ingest_consumer():
+    global INGEST_CONSUMER
+    if INGEST is not None:
+        INGEST_CONSUMER = IngestConsumer(
+            INGEST,
+            os.getenv("INGEST_GROUP", f"master-agent{SHARD_SUFFIX}"),
+            store_logged_health,
+            max_batch=int(os.getenv("INGEST_MAX_BATCH", "2000")),
+        )
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if INGEST_CONSUMER is not None:
+        INGEST_CONSUMER.stop()
+    SNAPSHOT_MAINTENANCE.stop()
+    HEALTH_WRITER.stop()
+    db.close_pool()
+
+
+@app.exception_handler(db.PoolTimeout)
+def pool_timeout_handler(request: Request, exc: db.PoolTimeout):
+    # All pooled connections busy: tell clients to back off instead of failing with a 500
+    return JSONResponse(status_code=503, content={"detail": "Database busy, retry later"})
 
 
 class VehicleHealth(BaseModel):
+    # NaN and infinite scores are rejected here; the latest-state histograms cannot place them
+    model_config = ConfigDict(allow_inf_nan=False)
+
     vehicle_id: str
     anomaly_score: float
-    subsystems: dict
+    subsystems: dict[str, float]
     # Optional snapshot of raw sensors that produced this health record
     sensor_snapshot: dict | None = None
     # ML-based anomaly score and decision label
@@ -38,6 +234,12 @@ class VehicleHealth(BaseModel):
     ml_label: str | None = None
     # Rule-based anomaly score (before ML combination)
     rule_anomaly_score: float | None = None
+    # Rolling-window scores from the data-agent (sustained rule/ML scores)
+    temporal: dict | None = None
+
+
+class HealthBatch(BaseModel):
+    records: List[VehicleHealth]
 
 
 # ========== AUTHENTICATION MODELS ==========
@@ -60,6 +262,7 @@ class TokenData(BaseModel):
     user_id: str
     role: str
     vehicle_id: str | None = None  # Only for car owners
+    exp: float | None = None  # Expiry (epoch seconds)
 
 
 # ========== UTILITY FUNCTIONS ==========
@@ -89,6 +292,7 @@ def verify_jwt_token(token: str) -> TokenData:
             user_id=payload.get("user_id"),
             role=payload.get("role"),
             vehicle_id=payload.get("vehicle_id"),
+            exp=payload.get("exp"),
         )
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -96,14 +300,26 @@ def verify_jwt_token(token: str) -> TokenData:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def verify_token_cached(token: str) -> TokenData:
+    """verify_jwt_token, skipped for tokens that verified recently (see token_cache.py)."""
+    token_data = TOKEN_CACHE.get(token)
+    if token_data is None:
+        token_data = verify_jwt_token(token)
+        TOKEN_CACHE.put(token, token_data, token_data.exp)
+    return token_data
+
+
 def get_token_from_request(request: Request) -> TokenData:
-    """Extract and verify JWT token from Authorization header."""
+    """
+    Extract and verify JWT token from Authorization header.
+    Protected endpoints take it as a dependency: Depends(get_token_from_request).
+    """
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
     
     token = auth_header.replace("Bearer ", "")
-    return verify_jwt_token(token)
+    return verify_token_cached(token)
 
 
 # Mock user database (in production, use real DB)
@@ -119,19 +335,21 @@ USERS_DB = {
 }
 
 
-def get_db_conn():
-    return psycopg2.connect(
-        host="localhost",
-        port=5432,
-        dbname="aura",
-        user="postgres",
-        password="postgres",
-    )
-
-
 @app.get("/")
 def root():
-    return {"status": "ok", "service": "master-agent", "version": "0.0.5"}
+    return {
+        "status": "ok",
+        "service": "master-agent",
+        "version": "0.0.5",
+        "db_pool": db.pool_stats(),
+        "health_writer": HEALTH_WRITER.stats(),
+        "latest_state": LATEST_STATE.stats(),
+        "snapshot_maintenance": SNAPSHOT_MAINTENANCE.stats(),
+        "events": EVENT_HUB.stats(),
+        "auth_cache": TOKEN_CACHE.stats(),
+        "ingest": INGEST_CONSUMER.stats() if INGEST_CONSUMER is not None else None,
+        "shard": {"index": SHARD_INDEX, "count": SHARD_COUNT},
+    }
 
 
 # ========== AUTHENTICATION ENDPOINTS ==========
@@ -200,36 +418,138 @@ def validate_token(token: str):
         }
 
 
+def health_row(health: VehicleHealth) -> tuple:
+    sensor_snapshot_json = fast_json.dumps(health.sensor_snapshot).decode() if health.sensor_snapshot else None
+    return (health.vehicle_id, health.anomaly_score, fast_json.dumps(health.subsystems).decode(), sensor_snapshot_json)
+
+
+def write_health_rows(rows: list[tuple], sync: bool, records: list[dict]) -> str:
+    """
+    Queue rows on HEALTH_WRITER. With sync=True wait until they are committed.
+    Returns the durability of the ack: "committed" or "buffered".
+
+    The matching `records` are applied to the latest state and published only
+    once the rows are accepted (with sync=True, committed), so a request that
+    fails with 503/504 has not been applied yet and its retry applies it once.
+    """
+    fut = HEALTH_WRITER.submit(rows)
+    if fut is None:
+        raise HTTPException(status_code=503, detail="Health write buffer full, retry later")
+    # History changes when the rows commit, so dashboard ETags must change then too
+    vehicle_ids = {row[0] for row in rows}
+    fut.add_done_callback(lambda _: LATEST_STATE.touch(vehicle_ids))
+    if not sync:
+        apply_health(records)
+        return "buffered"
+    try:
+        fut.result(timeout=HEALTH_SYNC_TIMEOUT_S)
+    except FutureTimeoutError:
+        # Still queued: it may commit later, so a retry can duplicate the rows
+        raise HTTPException(status_code=504, detail="Health records not committed in time")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Health records not stored: {e}")
+    apply_health(records)
+    return "committed"
+
+
+def apply_health(records: list[dict]):
+    """Make stored records visible: latest state first, then /events subscribers."""
+    transitions = LATEST_STATE.update_many(records)
+    publish_health(records, transitions)
+
+
+def publish_health(records: list[dict], transitions: list[tuple]):
+    """Push new health records and severity transitions to /events subscribers."""
+    if not EVENT_HUB.has_subscribers():
+        return
+    service = EVENT_HUB.wants("service")
+    events = []
+    for rec in records:
+        views = {}
+        if EVENT_HUB.wants("user", rec["vehicle_id"]):
+            # Owners append this to their history chart, so give it a history-style timestamp
+            views["user"] = {**rec, "timestamp": datetime.now().isoformat()}
+        if service:
+            # Service center: scores only, no sensor data
+            score = rec["anomaly_score"]
+            views["service"] = {"vehicle_id": rec["vehicle_id"], "anomaly_score": score, "status": severity(score)}
+        events.append(("health", rec["vehicle_id"], views))
+    for vid, old, new in transitions:
+        change = {"vehicle_id": vid, "from": old, "to": new}
+        events.append(("severity", vid, {"user": change, "service": change}))
+    if transitions and EVENT_HUB.wants("manufacturing"):
+        summary = {"counts": LATEST_STATE.severity_counts(), "fleet_size": len(LATEST_STATE)}
+        events.append(("fleet", None, {"manufacturing": summary}))
+    EVENT_HUB.publish(events)
+
+
 @app.post("/store_health")
-def store_health(health: VehicleHealth):
+def store_health(health: VehicleHealth, sync: bool = False):
+    """
+    Store one health record. By default the ack means "buffered for the next
+    group commit"; pass ?sync=true to wait until the row is committed.
+    """
+    check_shard([health.vehicle_id])
     key = f"health:{health.vehicle_id}"
-    store[key] = health.model_dump_json()
-
-    conn = get_db_conn()
-    cur = conn.cursor()
-    sensor_snapshot_json = json.dumps(health.sensor_snapshot) if health.sensor_snapshot else None
-    cur.execute(
-        """
-        INSERT INTO health_snapshots (vehicle_id, anomaly_score, subsystems, sensor_snapshot)
-        VALUES (%s, %s, %s, %s)
-        """,
-        (health.vehicle_id, health.anomaly_score, json.dumps(health.subsystems), sensor_snapshot_json),
+    durability = write_health_rows([health_row(health)], sync, [health.model_dump()])
+    return {"stored": True, "key": key, "durability": durability}
+
+
+@app.post("/store_health_batch")
+def store_health_batch(batch: HealthBatch, sync: bool = False):
+    """Store many health records; they are committed together (see /store_health for ?sync)."""
+    if not batch.records:
+        return {"stored": 0}
+
+    check_shard([health.vehicle_id for health in batch.records])
+    durability = store_health_records(batch.records, sync)
+    return {"stored": len(batch.records), "durability": durability}
+
+
+def check_shard(vehicle_ids: list[str]):
+    """421 if any vehicle belongs to another shard (the router or client used a different ring)."""
+    if SHARD_COUNT == 1:
+        return
+    for vid in vehicle_ids:
+        shard = SHARD_RING.shard_for(vid)
+        if shard != SHARD_INDEX:
+            raise HTTPException(status_code=421, detail=f"Vehicle {vid} belongs to shard {shard}, not {SHARD_INDEX}")
+
+
+def store_health_records(healths: list[VehicleHealth], sync: bool) -> str:
+    return write_health_rows(
+        [health_row(health) for health in healths], sync, [health.model_dump() for health in healths]
     )
-    conn.commit()
-    cur.close()
-    conn.close()
 
-    return {"stored": True, "key": key}
+
+def validate_health_records(records: list[dict]) -> tuple[list[tuple[VehicleHealth, dict]], int]:
+    """Ingest log records that are valid VehicleHealth, with their raw record, and how many were not."""
+    healths = []
+    for rec in records:
+        try:
+            healths.append((VehicleHealth(**rec), rec))
+        except ValidationError as e:
+            print(f"Skipping invalid ingest log record for {rec.get('vehicle_id')}: {e.errors(include_url=False)}")
+    return healths, len(records) - len(healths)
+
+
+def store_logged_health(records: list[dict]) -> int:
+    """IngestConsumer handler: store a batch from the ingest log, returning once it is committed."""
+    healths, invalid = validate_health_records(records)
+    if SHARD_COUNT > 1:
+        # The log only holds this shard's vehicles unless the data-agent used a different SHARD_COUNT
+        healths = [(h, rec) for h, rec in healths if SHARD_RING.shard_for(h.vehicle_id) == SHARD_INDEX]
+    if healths:
+        try:
+            store_health_records([h for h, _ in healths], sync=True)
+        except HTTPException as e:
+            raise RuntimeError(e.detail) from e
+    return invalid
 
 
 @app.get("/health/{vehicle_id}")
-def get_health(vehicle_id: str, request: Request):
+def get_health(vehicle_id: str, token_data: TokenData = Depends(get_token_from_request)):
     """Get health data for a vehicle. Only car owners can access their own vehicle."""
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only car owners (role="user") can access health data
     if token_data.role != "user":
         raise HTTPException(status_code=403, detail="Only car owners can view health data")
@@ -238,22 +558,34 @@ def get_health(vehicle_id: str, request: Request):
     if token_data.vehicle_id and token_data.vehicle_id != vehicle_id:
         raise HTTPException(status_code=403, detail="You can only view your own vehicle's health")
     
-    key = f"health:{vehicle_id}"
-    data = store.get(key)
-    return {"vehicle_id": vehicle_id, "health": data}
+    return JSONBytesResponse(health_for(vehicle_id))
+
+
+def health_for(vehicle_id: str) -> bytes:
+    """GET /health body: "health" is the record's JSON text, as encoded on write (the dashboard parses it)."""
+    fragment = LATEST_STATE.health_fragment(vehicle_id)
+    return encode_object({"vehicle_id": vehicle_id, "health": Raw(fragment) if fragment is not None else None})
 
 
 @app.get("/history/{vehicle_id}")
-def get_history(vehicle_id: str, request: Request, limit: int = 20):
+def get_history(
+    vehicle_id: str,
+    limit: int = Query(20, ge=1, le=1000),
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    cursor: str | None = None,
+    points: int | None = Query(None, ge=2, le=5000),
+    token_data: TokenData = Depends(get_token_from_request),
+):
     """
-    Return last N (default 20) health snapshots from DB for this vehicle.
+    Health snapshots for this vehicle, oldest first, optionally within [from, to).
     Only accessible to car owners of that vehicle.
+
+    - Default: the newest `limit` snapshots, plus `next_cursor`; pass it back
+      as `cursor` for the page before (keyset pagination).
+    - `points=N`: the whole range (default: the last day) downsampled to at
+      most N shape-preserving points, read from rollups for long ranges.
     """
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only car owners (role="user") can access health history
     if token_data.role != "user":
         raise HTTPException(status_code=403, detail="Only car owners can view health history")
@@ -262,63 +594,83 @@ def get_history(vehicle_id: str, request: Request, limit: int = 20):
     if token_data.vehicle_id and token_data.vehicle_id != vehicle_id:
         raise HTTPException(status_code=403, detail="You can only view your own vehicle's history")
     
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT anomaly_score, subsystems, created_at
-        FROM health_snapshots
-        WHERE vehicle_id = %s
-        ORDER BY id DESC
-        LIMIT %s
-        """,
-        (vehicle_id, limit),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    history = []
-    for score, subsystems, created_at in rows:
-        # subsystems is already JSONB, but psycopg returns as dict or str depending on driver
-        if isinstance(subsystems, str):
-            subsystems = json.loads(subsystems)
-        history.append(
-            {
-                "anomaly_score": score,
-                "subsystems": subsystems,
-                "timestamp": created_at.isoformat(),
-            }
-        )
+    start, end = history_queries.as_local(start), history_queries.as_local(end)
 
-    # Reverse so oldest first, easiest for charts
-    history.reverse()
-    return {"vehicle_id": vehicle_id, "points": history}
+    if points is not None:
+        end = end or datetime.now()
+        start = start or end - history_queries.DEFAULT_CHART_SPAN
+        if start >= end:
+            raise HTTPException(status_code=422, detail="'from' must be before 'to'")
+        with db.cursor() as cur:
+            series, source = history_queries.fetch_series(cur, vehicle_id, start, end, points, cold=COLD_ARCHIVE)
+        return JSONBytesResponse({"vehicle_id": vehicle_id, "points": series, "source": source})
+
+    try:
+        after = history_queries.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    with db.cursor() as cur:
+        page, next_cursor = history_queries.fetch_page(cur, vehicle_id, start, end, after, limit, cold=COLD_ARCHIVE)
+    return JSONBytesResponse({"vehicle_id": vehicle_id, "points": page, "next_cursor": next_cursor})
+
+
+@app.get("/events")
+async def events(request: Request, token: str | None = None):
+    """
+    Server-sent event stream of health, severity, fleet and booking updates,
+    filtered by the caller's role and vehicle (see events.py). Browsers'
+    EventSource cannot set headers, so the token may also be passed as
+    ?token=. The stream ends when the token expires.
+    """
+    if token is None:
+        auth_header = request.headers.get("Authorization") or ""
+        token = auth_header[len("Bearer "):] if auth_header.startswith("Bearer ") else None
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
+    token_data = verify_token_cached(token)
+    expires_at = token_data.exp
+
+    sub = EVENT_HUB.subscribe(token_data.role, token_data.vehicle_id)
+
+    async def stream():
+        try:
+            yield f"retry: 3000\nevent: ready\ndata: {json.dumps({'role': token_data.role})}\n\n"
+            while not await request.is_disconnected():
+                if expires_at is not None and time.time() >= expires_at:
+                    yield "event: expired\ndata: {}\n\n"
+                    return
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), timeout=EVENTS_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            EVENT_HUB.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/vehicles")
-def list_vehicles(request: Request):
+def list_vehicles(token_data: TokenData = Depends(get_token_from_request)):
     """
     Return vehicles based on user role:
     - Car Owner (user): only their own vehicle with full data
     - Service Center (service): all vehicles with anomaly scores only (no sensor data)
     - Manufacturing (manufacturing): fleet summary only
     """
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT DISTINCT vehicle_id
-        FROM health_snapshots
-        ORDER BY vehicle_id
-        """
-    )
-    ids = [row[0] for row in cur.fetchall()]
+    with db.cursor() as cur:
+        cur.execute(
+            """
+            SELECT vehicle_id
+            FROM vehicle_latest
+            ORDER BY vehicle_id
+            """
+        )
+        ids = [row[0] for row in cur.fetchall()]
 
     vehicles: List[dict] = []
 
@@ -333,44 +685,24 @@ def list_vehicles(request: Request):
         # Manufacturing sees fleet summary only
         pass
 
-    for vid in ids:
-        key = f"health:{vid}"
-        latest = store.get(key)
-        anomaly = None
-        status = "unknown"
-
-        if latest:
-            data = json.loads(latest)
-            anomaly = float(data.get("anomaly_score", 0.0))
-            if anomaly > 0.3:
-                status = "critical"
-            elif anomaly > 0.18:
-                status = "warning"
-            else:
-                status = "ok"
-
+    # One vectorized lookup for all ids; NaN = no health received yet
+    scores = LATEST_STATE.anomaly_scores(ids)
+    statuses = [SEVERITY_LEVELS[c] for c in severity_codes(scores).tolist()]
+    for vid, anomaly, status in zip(ids, scores.tolist(), statuses):
         vehicles.append(
             {
                 "vehicle_id": vid,
-                "anomaly_score": anomaly,
+                "anomaly_score": None if anomaly != anomaly else anomaly,
                 "status": status,
             }
         )
 
-    cur.close()
-    conn.close()
-
-    return {"vehicles": vehicles}
+    return JSONBytesResponse({"vehicles": vehicles})
 
 
 @app.get("/contact_decision/{vehicle_id}")
-def contact_decision(vehicle_id: str, request: Request):
+def contact_decision(vehicle_id: str, token_data: TokenData = Depends(get_token_from_request)):
     """Determine if customer should be contacted. Only accessible to car owners."""
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only car owners (role="user") can access contact decisions
     if token_data.role != "user":
         raise HTTPException(status_code=403, detail="Only car owners can view contact decisions")
@@ -379,28 +711,26 @@ def contact_decision(vehicle_id: str, request: Request):
     if token_data.vehicle_id and token_data.vehicle_id != vehicle_id:
         raise HTTPException(status_code=403, detail="You can only view your own vehicle's contact decision")
     
-    key = f"health:{vehicle_id}"
-    data = store.get(key)
-    if not data:
+    return JSONBytesResponse(contact_decision_for(vehicle_id))
+
+
+def contact_decision_for(vehicle_id: str) -> dict:
+    score = LATEST_STATE.anomaly_score(vehicle_id)
+    if score is None:
         return {
             "vehicle_id": vehicle_id,
             "should_contact": False,
             "reason": "no_recent_health_data",
         }
 
-    parsed = json.loads(data)
-    score = float(parsed.get("anomaly_score", 0.0))
-
-    if score > 0.3:
-        level = "critical"
+    level = severity(score)
+    if level == "critical":
         reason = "high_risk_failure_predicted"
         should_contact = True
-    elif score > 0.18:
-        level = "warning"
+    elif level == "warning":
         reason = "moderate_risk_recommend_scheduling"
         should_contact = True
     else:
-        level = "ok"
         reason = "low_risk_no_immediate_action"
         should_contact = False
 
@@ -412,60 +742,69 @@ def contact_decision(vehicle_id: str, request: Request):
         "reason": reason,
     }
 
+
+@app.get("/vehicles/{vehicle_id}/dashboard")
+def vehicle_dashboard(
+    vehicle_id: str,
+    request: Request,
+    history_limit: int = Query(20, ge=1, le=1000),
+    token_data: TokenData = Depends(get_token_from_request),
+):
+    """
+    Owner dashboard in one request: /health, the newest /history points and
+    /contact_decision. Carries an ETag from the vehicle's in-memory version,
+    so a poll with a matching If-None-Match gets 304 without touching the DB.
+    """
+    # Only car owners (role="user") can access the dashboard
+    if token_data.role != "user":
+        raise HTTPException(status_code=403, detail="Only car owners can view the vehicle dashboard")
+
+    # Car owners can only access their own vehicle
+    if token_data.vehicle_id and token_data.vehicle_id != vehicle_id:
+        raise HTTPException(status_code=403, detail="You can only view your own vehicle's dashboard")
+
+    # Read the version before the data: if both change in between, the next poll just refetches
+    version = LATEST_STATE.version_of(vehicle_id)
+    etag = f'"{vehicle_id}-{LATEST_STATE.epoch}-{version}-{history_limit}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    with db.cursor() as cur:
+        points, next_cursor = history_queries.fetch_page(cur, vehicle_id, None, None, None, history_limit, cold=COLD_ARCHIVE)
+
+    body = {
+        "vehicle_id": vehicle_id,
+        "health": Raw(health_for(vehicle_id)),
+        "history": {"vehicle_id": vehicle_id, "points": points, "next_cursor": next_cursor},
+        "contact_decision": contact_decision_for(vehicle_id),
+    }
+    return JSONBytesResponse(body, headers=headers)
+
+
 @app.get("/mfg/summary")
-def mfg_summary(request: Request):
+def mfg_summary(histograms: bool = False, token_data: TokenData = Depends(get_token_from_request)):
     """
     Manufacturing view: fleet summary only.
     Only accessible to manufacturing role.
-    Returns aggregate counts by severity, but NOT individual vehicle details with IDs.
+    Returns aggregate counts by severity and score quantiles, but NOT individual vehicle details with IDs.
+    ?histograms=true adds the score histograms, which the shard router merges into fleet quantiles.
     """
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only manufacturing team can view fleet summary
     if token_data.role != "manufacturing":
         raise HTTPException(status_code=403, detail="Only manufacturing team can view fleet summary")
     
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT vehicle_id,
-               anomaly_score,
-               created_at
-        FROM health_snapshots
-        WHERE id IN (
-          SELECT DISTINCT ON (vehicle_id)
-                 id
-          FROM health_snapshots
-          ORDER BY vehicle_id, id DESC
-        )
-        ORDER BY anomaly_score DESC NULLS LAST
-        """
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    counts = {"ok": 0, "warning": 0, "critical": 0, "unknown": 0}
-    for vid, score, ts in rows:
-        level = "unknown"
-        if score is not None:
-            if score > 0.3:
-                level = "critical"
-            elif score > 0.18:
-                level = "warning"
-            else:
-                level = "ok"
-        counts[level] = counts.get(level, 0) + 1
-
-    return {
-        "counts": counts,
-        "fleet_size": len(rows),
+    # Counters and histograms are maintained on ingest (latest_state.py), so this is O(1) in fleet size
+    summary = {
+        "counts": LATEST_STATE.severity_counts(),
+        "fleet_size": len(LATEST_STATE),
+        "quantiles": LATEST_STATE.score_quantiles(),
         "message": "Fleet summary - aggregated view only (no vehicle details)"
     }
+    if histograms:
+        summary["histograms"] = LATEST_STATE.score_histograms()
+    return summary
 
 
 # ========== BOOKING LIFECYCLE ENDPOINTS ==========
@@ -478,16 +817,11 @@ class BookingRequest(BaseModel):
 
 
 @app.post("/bookings/confirm")
-def confirm_booking(req: BookingRequest, request: Request):
+def confirm_booking(req: BookingRequest, token_data: TokenData = Depends(get_token_from_request)):
     """
     Confirm a suggested booking slot.
     Only car owners can confirm their own vehicle bookings.
     """
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only car owners can confirm bookings
     if token_data.role != "user":
         raise HTTPException(status_code=403, detail="Only car owners can confirm bookings")
@@ -496,104 +830,93 @@ def confirm_booking(req: BookingRequest, request: Request):
     if token_data.vehicle_id and token_data.vehicle_id != req.vehicle_id:
         raise HTTPException(status_code=403, detail="You can only confirm your own vehicle bookings")
     
-    conn = get_db_conn()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute(
-            """
-            INSERT INTO bookings (vehicle_id, slot_start, slot_end, center_id, status, confirmed_at)
-            VALUES (%s, %s, %s, %s, 'confirmed', CURRENT_TIMESTAMP)
-            RETURNING id, vehicle_id, slot_start, slot_end, center_id, status, confirmed_at
-            """,
-            (req.vehicle_id, req.slot_start, req.slot_end, req.center_id),
-        )
-        booking = cur.fetchone()
-        conn.commit()
-        
-        return {
-            "success": True,
-            "booking_id": booking[0],
-            "vehicle_id": booking[1],
-            "slot_start": booking[2].isoformat() if booking[2] else None,
-            "slot_end": booking[3].isoformat() if booking[3] else None,
-            "center_id": booking[4],
-            "status": booking[5],
-            "confirmed_at": booking[6].isoformat() if booking[6] else None,
-        }
-    except Exception as e:
-        conn.rollback()
-        print(f"Error confirming booking: {e}")
-        return {"success": False, "error": str(e)}
-    finally:
-        cur.close()
-        conn.close()
+    with db.connection() as conn:
+        cur = conn.cursor()
+
+        try:
+            cur.execute(
+                """
+                INSERT INTO bookings (vehicle_id, slot_start, slot_end, center_id, status, confirmed_at)
+                VALUES (%s, %s, %s, %s, 'confirmed', CURRENT_TIMESTAMP)
+                RETURNING id, vehicle_id, slot_start, slot_end, center_id, status, confirmed_at
+                """,
+                (req.vehicle_id, req.slot_start, req.slot_end, req.center_id),
+            )
+            booking = cur.fetchone()
+            conn.commit()
+
+            confirmed = {
+                "booking_id": booking[0],
+                "vehicle_id": booking[1],
+                "slot_start": booking[2].isoformat() if booking[2] else None,
+                "slot_end": booking[3].isoformat() if booking[3] else None,
+                "center_id": booking[4],
+                "status": booking[5],
+                "confirmed_at": booking[6].isoformat() if booking[6] else None,
+            }
+            EVENT_HUB.publish([("booking", booking[1], {"user": confirmed, "service": confirmed})])
+            return {"success": True, **confirmed}
+        except Exception as e:
+            conn.rollback()
+            print(f"Error confirming booking: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            cur.close()
 
 
 @app.get("/bookings/upcoming")
-def get_upcoming_bookings(request: Request, limit: int = 10):
+def get_upcoming_bookings(limit: int = 10, token_data: TokenData = Depends(get_token_from_request)):
     """
     Fetch upcoming confirmed bookings. 
     - Service Center (service): see all upcoming bookings
     - Others: forbidden
     """
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only service center can view all upcoming bookings
     if token_data.role != "service":
         raise HTTPException(status_code=403, detail="Only service center can view upcoming bookings")
     
-    conn = get_db_conn()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute(
-            """
-            SELECT id, vehicle_id, slot_start, slot_end, center_id, status, confirmed_at
-            FROM bookings
-            WHERE status = 'confirmed' AND slot_start >= CURRENT_TIMESTAMP
-            ORDER BY slot_start ASC
-            LIMIT %s
-            """,
-            (limit,),
-        )
-        rows = cur.fetchall()
-        
-        bookings = []
-        for row in rows:
-            bookings.append({
-                "booking_id": row[0],
-                "vehicle_id": row[1],
-                "slot_start": row[2].isoformat() if row[2] else None,
-                "slot_end": row[3].isoformat() if row[3] else None,
-                "center_id": row[4],
-                "status": row[5],
-                "confirmed_at": row[6].isoformat() if row[6] else None,
-            })
-        
-        return {"bookings": bookings, "count": len(bookings)}
-    except Exception as e:
-        print(f"Error fetching upcoming bookings: {e}")
-        return {"bookings": [], "count": 0, "error": str(e)}
-    finally:
-        cur.close()
-        conn.close()
+    with db.connection() as conn:
+        cur = conn.cursor()
+
+        try:
+            cur.execute(
+                """
+                SELECT id, vehicle_id, slot_start, slot_end, center_id, status, confirmed_at
+                FROM bookings
+                WHERE status = 'confirmed' AND slot_start >= CURRENT_TIMESTAMP
+                ORDER BY slot_start ASC
+                LIMIT %s
+                """,
+                (limit,),
+            )
+            rows = cur.fetchall()
+
+            bookings = []
+            for row in rows:
+                bookings.append({
+                    "booking_id": row[0],
+                    "vehicle_id": row[1],
+                    "slot_start": row[2].isoformat() if row[2] else None,
+                    "slot_end": row[3].isoformat() if row[3] else None,
+                    "center_id": row[4],
+                    "status": row[5],
+                    "confirmed_at": row[6].isoformat() if row[6] else None,
+                })
+
+            return {"bookings": bookings, "count": len(bookings)}
+        except Exception as e:
+            print(f"Error fetching upcoming bookings: {e}")
+            return {"bookings": [], "count": 0, "error": str(e)}
+        finally:
+            cur.close()
 
 
 @app.get("/bookings/vehicle/{vehicle_id}")
-def get_vehicle_bookings(vehicle_id: str, request: Request):
+def get_vehicle_bookings(vehicle_id: str, token_data: TokenData = Depends(get_token_from_request)):
     """
     Fetch all bookings for a specific vehicle.
     - Car Owner (user): only their own vehicle bookings
     """
-    try:
-        token_data = get_token_from_request(request)
-    except HTTPException:
-        raise
-    
     # Only car owners can view their own vehicle bookings
     if token_data.role != "user":
         raise HTTPException(status_code=403, detail="Only car owners can view booking history")
@@ -602,38 +925,37 @@ def get_vehicle_bookings(vehicle_id: str, request: Request):
     if token_data.vehicle_id and token_data.vehicle_id != vehicle_id:
         raise HTTPException(status_code=403, detail="You can only view your own vehicle's bookings")
     
-    conn = get_db_conn()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute(
-            """
-            SELECT id, vehicle_id, slot_start, slot_end, center_id, status, confirmed_at
-            FROM bookings
-            WHERE vehicle_id = %s
-            ORDER BY slot_start DESC
-            LIMIT 20
-            """,
-            (vehicle_id,),
-        )
-        rows = cur.fetchall()
-        
-        bookings = []
-        for row in rows:
-            bookings.append({
-                "booking_id": row[0],
-                "vehicle_id": row[1],
-                "slot_start": row[2].isoformat() if row[2] else None,
-                "slot_end": row[3].isoformat() if row[3] else None,
-                "center_id": row[4],
-                "status": row[5],
-                "confirmed_at": row[6].isoformat() if row[6] else None,
-            })
-        
-        return {"bookings": bookings}
-    except Exception as e:
-        print(f"Error fetching vehicle bookings: {e}")
-        return {"bookings": [], "error": str(e)}
-    finally:
-        cur.close()
-        conn.close()
+    with db.connection() as conn:
+        cur = conn.cursor()
+
+        try:
+            cur.execute(
+                """
+                SELECT id, vehicle_id, slot_start, slot_end, center_id, status, confirmed_at
+                FROM bookings
+                WHERE vehicle_id = %s
+                ORDER BY slot_start DESC
+                LIMIT 20
+                """,
+                (vehicle_id,),
+            )
+            rows = cur.fetchall()
+
+            bookings = []
+            for row in rows:
+                bookings.append({
+                    "booking_id": row[0],
+                    "vehicle_id": row[1],
+                    "slot_start": row[2].isoformat() if row[2] else None,
+                    "slot_end": row[3].isoformat() if row[3] else None,
+                    "center_id": row[4],
+                    "status": row[5],
+                    "confirmed_at": row[6].isoformat() if row[6] else None,
+                })
+
+            return {"bookings": bookings}
+        except Exception as e:
+            print(f"Error fetching vehicle bookings: {e}")
+            return {"bookings": [], "error": str(e)}
+        finally:
+            cur.close()
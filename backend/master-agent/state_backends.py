@@ -0,0 +1,395 @@
+"""
+Latest-state backends shared by every master process.
+
+LatestStateStore (latest_state.py) keeps the latest record per vehicle in
+process memory, so with several uvicorn workers or master replicas each
+process only sees the records it ingested itself. The backends here offer
+the same interface with the state kept outside the process:
+
+    memory   LatestStateStore; one process only (the default)
+    redis    RedisLatestState; any number of processes and hosts
+    file     FileLatestState; processes on one host sharing a file, for
+             tests and local multi-worker runs without a Redis server
+
+The interface (LatestStateBackend) is what main.py uses: update_many /
+update return severity transitions; get, health_fragment (the record as
+JSON bytes encoded on write), anomaly_score and anomaly_scores read records
+and scores; severity_counts / score_quantiles / len() are the fleet
+statistics, with score_histograms for merging them across shards; and
+version_of / touch / epoch build ETags. Severity counts and histograms are
+maintained on ingest by every backend, so fleet reads stay O(bins).
+
+Transitions are reported to the process that applied the update, so events
+(events.py) still reach only the subscribers connected to that process.
+"""
+
+import fcntl
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Protocol
+
+import numpy as np
+import redis
+
+import fast_json
+from latest_state import (
+    CRITICAL_THRESHOLD,
+    HISTOGRAM_MAX,
+    HISTOGRAM_RESOLUTION,
+    SEVERITY_LEVELS,
+    WARNING_THRESHOLD,
+    LatestStateStore,
+    ScoreHistogram,
+    check_scores,
+    decode_health,
+    encode_health,
+)
+
+
+class LatestStateBackend(Protocol):
+    epoch: str
+
+    def __len__(self) -> int: ...
+    def update_many(self, records: list[dict], now: float | None = None) -> list[tuple[str, str | None, str]]: ...
+    def update(self, record: dict, now: float | None = None) -> list[tuple[str, str | None, str]]: ...
+    def get(self, vehicle_id: str) -> dict | None: ...
+    def health_fragment(self, vehicle_id: str) -> bytes | None: ...
+    def touch(self, vehicle_ids): ...
+    def version_of(self, vehicle_id: str) -> int: ...
+    def anomaly_score(self, vehicle_id: str) -> float | None: ...
+    def anomaly_scores(self, vehicle_ids: list[str]) -> np.ndarray: ...
+    def severity_counts(self) -> dict[str, int]: ...
+    def score_quantiles(self, qs: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict: ...
+    def score_histograms(self) -> dict: ...
+    def stats(self) -> dict: ...
+
+
+def _named_quantiles(hist: ScoreHistogram, qs: tuple[float, ...]) -> dict:
+    return {f"p{round(q * 100, 1):g}": v for q, v in zip(qs, hist.quantiles(qs))}
+
+
+# Applies a batch of records atomically, keeping the fleet counters and
+# histograms in step with the per-vehicle hashes. ARGV: key prefix, critical
+# and warning thresholds, histogram resolution, overflow bin (ScoreHistogram),
+# then per record: vehicle_id,
+# anomaly_score, subsystems JSON, encode_health(record), updated_at. Returns the
+# transitions flattened as vehicle_id, old level ("" for new), new level.
+UPDATE_LUA = """
+local prefix = ARGV[1]
+local critical, warning, resolution = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local overflow = tonumber(ARGV[5])
+
+local function level(score)
+  if score > critical then return 'critical' end
+  if score > warning then return 'warning' end
+  return 'ok'
+end
+
+local function bin(value)
+  return math.min(math.max(math.floor(value / resolution), 0), overflow)
+end
+
+local function add(key, value, delta)
+  if redis.call('HINCRBY', key, bin(value), delta) <= 0 then
+    redis.call('HDEL', key, bin(value))
+  end
+end
+
+local out = {}
+for i = 6, #ARGV, 5 do
+  local vid, score, subsystems = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2]
+  local key = prefix .. 'v:' .. vid
+  local old = redis.call('HMGET', key, 'anomaly_score', 'subsystems')
+  local old_level = ''
+  if old[1] then
+    old_level = level(tonumber(old[1]))
+    add(prefix .. 'hist:anomaly', tonumber(old[1]), -1)
+    for name, value in pairs(cjson.decode(old[2])) do
+      if type(value) == 'number' then add(prefix .. 'hist:sub:' .. name, value, -1) end
+    end
+  else
+    redis.call('SADD', prefix .. 'vehicles', vid)
+  end
+
+  add(prefix .. 'hist:anomaly', score, 1)
+  for name, value in pairs(cjson.decode(subsystems)) do
+    if type(value) == 'number' then
+      redis.call('SADD', prefix .. 'subsystems', name)
+      add(prefix .. 'hist:sub:' .. name, value, 1)
+    end
+  end
+
+  local new_level = level(score)
+  if new_level ~= old_level then
+    if old_level ~= '' then redis.call('HINCRBY', prefix .. 'severity', old_level, -1) end
+    redis.call('HINCRBY', prefix .. 'severity', new_level, 1)
+    table.insert(out, vid)
+    table.insert(out, old_level)
+    table.insert(out, new_level)
+  end
+
+  redis.call('HSET', key, 'anomaly_score', ARGV[i + 1], 'subsystems', subsystems,
+             'record', ARGV[i + 3], 'updated_at', ARGV[i + 4])
+  redis.call('HINCRBY', key, 'version', 1)
+end
+return out
+"""
+
+# Bumps the version of the given vehicle hashes that exist
+TOUCH_LUA = """
+for _, key in ipairs(KEYS) do
+  if redis.call('EXISTS', key) == 1 then redis.call('HINCRBY', key, 'version', 1) end
+end
+return 0
+"""
+
+
+class RedisLatestState:
+    """
+    Latest state in Redis (or anything speaking its protocol), shared by all
+    master processes:
+
+        {prefix}v:{vehicle_id}    hash: anomaly_score, subsystems, record (encode_health), updated_at, version
+        {prefix}vehicles          set of vehicle ids
+        {prefix}severity          hash: vehicles per severity level
+        {prefix}hist:anomaly      hash: histogram bin -> count of current combined scores
+        {prefix}hist:sub:{name}   hash: the same per subsystem ({prefix}subsystems lists names)
+        {prefix}epoch             set once by the first process, so ETags agree across processes
+
+    Updates run as a Lua script, so the counters and histograms stay exact
+    with concurrent writers. Fleet reads (anomaly_scores, score_quantiles)
+    pipeline their per-key reads into one round trip.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "aura:latest:", keep_detail: bool = True,
+                 max_script_batch: int = 500, client=None):
+        self.url = url
+        self.prefix = prefix
+        self.keep_detail = keep_detail
+        self.max_script_batch = max_script_batch
+        self.client = client if client is not None else redis.Redis.from_url(url)
+        self._update = self.client.register_script(UPDATE_LUA)
+        self._touch = self.client.register_script(TOUCH_LUA)
+        self.client.set(prefix + "epoch", f"{time.time_ns():x}", nx=True)
+        self.epoch = self.client.get(prefix + "epoch").decode()
+
+    def _key(self, vehicle_id: str) -> str:
+        return f"{self.prefix}v:{vehicle_id}"
+
+    def __len__(self):
+        return self.client.scard(self.prefix + "vehicles")
+
+    def update_many(self, records: list[dict], now: float | None = None) -> list[tuple[str, str | None, str]]:
+        """See LatestStateStore.update_many; each chunk of max_script_batch records applies atomically."""
+        now = time.time() if now is None else now
+        for rec in records:
+            check_scores(rec)
+        overflow = int(round(HISTOGRAM_MAX / HISTOGRAM_RESOLUTION))  # ScoreHistogram.overflow
+        transitions = []
+        for start in range(0, len(records), self.max_script_batch):
+            args = [self.prefix, CRITICAL_THRESHOLD, WARNING_THRESHOLD, HISTOGRAM_RESOLUTION, overflow]
+            for rec in records[start : start + self.max_script_batch]:
+                if not self.keep_detail:
+                    rec = {**rec, "sensor_snapshot": None, "temporal": None}
+                args += [
+                    rec["vehicle_id"],
+                    repr(float(rec["anomaly_score"])),
+                    fast_json.dumps(rec.get("subsystems") or {}),
+                    encode_health(rec),
+                    repr(float(rec.get("updated_at", now))),
+                ]
+            flat = [v.decode() for v in self._update(args=args)]
+            transitions += [(flat[i], flat[i + 1] or None, flat[i + 2]) for i in range(0, len(flat), 3)]
+        return transitions
+
+    def update(self, record: dict, now: float | None = None) -> list[tuple[str, str | None, str]]:
+        return self.update_many([record], now)
+
+    def get(self, vehicle_id: str) -> dict | None:
+        record, updated_at = self.client.hmget(self._key(vehicle_id), "record", "updated_at")
+        if record is None:
+            return None
+        return {**decode_health(record), "updated_at": float(updated_at)}
+
+    def health_fragment(self, vehicle_id: str) -> bytes | None:
+        return self.client.hget(self._key(vehicle_id), "record")
+
+    def touch(self, vehicle_ids):
+        keys = [self._key(vid) for vid in vehicle_ids]
+        if keys:
+            self._touch(keys=keys)
+
+    def version_of(self, vehicle_id: str) -> int:
+        version = self.client.hget(self._key(vehicle_id), "version")
+        return 0 if version is None else int(version)
+
+    def anomaly_score(self, vehicle_id: str) -> float | None:
+        score = self.client.hget(self._key(vehicle_id), "anomaly_score")
+        return None if score is None else float(score)
+
+    def anomaly_scores(self, vehicle_ids: list[str]) -> np.ndarray:
+        """Combined scores for `vehicle_ids` in order, NaN for vehicles never seen; one round trip."""
+        pipe = self.client.pipeline(transaction=False)
+        for vid in vehicle_ids:
+            pipe.hget(self._key(vid), "anomaly_score")
+        return np.array([np.nan if s is None else float(s) for s in pipe.execute()], dtype=np.float64)
+
+    def severity_counts(self) -> dict[str, int]:
+        counts = self.client.hgetall(self.prefix + "severity")
+        return {level: int(counts.get(level.encode(), 0)) for level in SEVERITY_LEVELS}
+
+    def score_histograms(self) -> dict:
+        names = sorted(name.decode() for name in self.client.smembers(self.prefix + "subsystems"))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self.prefix + "hist:anomaly")
+        for name in names:
+            pipe.hgetall(f"{self.prefix}hist:sub:{name}")
+        bins = [{int(b): int(c) for b, c in hist.items()} for hist in pipe.execute()]
+        return {
+            "resolution": HISTOGRAM_RESOLUTION,
+            "max": HISTOGRAM_MAX,
+            "anomaly_score": bins[0],
+            "subsystems": dict(zip(names, bins[1:])),
+        }
+
+    def score_quantiles(self, qs: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict:
+        hists = self.score_histograms()
+        return {
+            "anomaly_score": _named_quantiles(ScoreHistogram.from_bins(hists["anomaly_score"]), qs),
+            "subsystems": {
+                name: _named_quantiles(ScoreHistogram.from_bins(bins), qs) for name, bins in hists["subsystems"].items()
+            },
+        }
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "vehicles": len(self),
+            "prefix": self.prefix,
+            "keep_detail": self.keep_detail,
+        }
+
+
+class FileLatestState:
+    """
+    A LatestStateStore shared through a file by processes on one host.
+
+    Every operation takes a lock on `{path}.lock` (shared for reads,
+    exclusive for writes) and reloads the pickled store only if another
+    process wrote since this one last read it; writes re-pickle the whole
+    store and replace the file. That is fine for tests and a few workers,
+    not for fleet-scale ingest, which should use Redis.
+    """
+
+    # Write counter at the start of the file, read to skip unchanged reloads
+    _HEADER = struct.Struct("<Q")
+
+    def __init__(self, path: str, keep_detail: bool = True):
+        self.path = path
+        self.keep_detail = keep_detail
+        self._store: LatestStateStore | None = None
+        self._generation = -1
+        self._lock = threading.Lock()
+        with self._locked(write=True):
+            pass  # create the file if it does not exist yet
+        self.epoch = self._store.epoch
+
+    @contextmanager
+    def _locked(self, write: bool):
+        with self._lock, open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            try:
+                self._load()
+                yield self._store
+                if write:
+                    self._save()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            if self._store is None:
+                self._store = LatestStateStore(keep_detail=self.keep_detail)
+            return
+        with f:
+            (generation,) = self._HEADER.unpack(f.read(self._HEADER.size))
+            if generation != self._generation:
+                self._store = pickle.load(f)
+                self._generation = generation
+
+    def _save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._HEADER.pack(self._generation + 1))
+            pickle.dump(self._store, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self._generation += 1
+
+    def __len__(self):
+        with self._locked(write=False) as store:
+            return len(store)
+
+    def update_many(self, records: list[dict], now: float | None = None) -> list[tuple[str, str | None, str]]:
+        with self._locked(write=True) as store:
+            return store.update_many(records, now)
+
+    def update(self, record: dict, now: float | None = None) -> list[tuple[str, str | None, str]]:
+        return self.update_many([record], now)
+
+    def get(self, vehicle_id: str) -> dict | None:
+        with self._locked(write=False) as store:
+            return store.get(vehicle_id)
+
+    def health_fragment(self, vehicle_id: str) -> bytes | None:
+        with self._locked(write=False) as store:
+            return store.health_fragment(vehicle_id)
+
+    def touch(self, vehicle_ids):
+        with self._locked(write=True) as store:
+            store.touch(vehicle_ids)
+
+    def version_of(self, vehicle_id: str) -> int:
+        with self._locked(write=False) as store:
+            return store.version_of(vehicle_id)
+
+    def anomaly_score(self, vehicle_id: str) -> float | None:
+        with self._locked(write=False) as store:
+            return store.anomaly_score(vehicle_id)
+
+    def anomaly_scores(self, vehicle_ids: list[str]) -> np.ndarray:
+        with self._locked(write=False) as store:
+            return store.anomaly_scores(vehicle_ids)
+
+    def severity_counts(self) -> dict[str, int]:
+        with self._locked(write=False) as store:
+            return store.severity_counts()
+
+    def score_quantiles(self, qs: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict:
+        with self._locked(write=False) as store:
+            return store.score_quantiles(qs)
+
+    def score_histograms(self) -> dict:
+        with self._locked(write=False) as store:
+            return store.score_histograms()
+
+    def stats(self) -> dict:
+        with self._locked(write=False) as store:
+            return {**store.stats(), "backend": "file", "path": self.path}
+
+
+def open_latest_state(kind: str, keep_detail: bool = True, redis_url: str = "redis://localhost:6379/0",
+                      redis_prefix: str = "aura:latest:", path: str = "aura_latest_state.bin") -> LatestStateBackend:
+    """The backend named by `kind` ("memory", "redis" or "file")."""
+    if kind == "memory":
+        return LatestStateStore(keep_detail=keep_detail)
+    if kind == "redis":
+        return RedisLatestState(redis_url, prefix=redis_prefix, keep_detail=keep_detail)
+    if kind == "file":
+        return FileLatestState(path, keep_detail=keep_detail)
+    raise ValueError(f"Unknown latest state backend {kind!r} (expected memory, redis or file)")
@@ -0,0 +1,76 @@
+"""
+Cache of verified JWTs.
+
+Dashboards send the same bearer token with every request, and verifying it
+(HMAC check, payload decode, TokenData construction) is a measurable share of
+the cheapest endpoints. TokenCache remembers the TokenData of tokens that
+verified, keyed by a SHA-256 of the token so raw tokens are not kept in
+memory, for at most `ttl_s` and never past the token's own `exp`. It is an
+LRU bounded at `max_entries`.
+
+Only successful verifications are cached, so a bad or expired token is
+always rejected by the full check.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = 10_000, ttl_s: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # sha256(token) -> (token data, expires_at epoch s), least recently used first
+        self._entries: OrderedDict[bytes, tuple[object, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters for the status endpoint
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        """The cached token data, or None if absent or expired."""
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, data, exp: float | None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_s
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (data, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,51 @@
+"""
+Migration script to create the vehicle_latest read model.
+
+One row per vehicle with its most recent health snapshot. The master's health
+writer upserts it in the same transaction as the history insert, so /vehicles
+and /mfg/summary no longer scan all of health_snapshots. This script creates
+the table and backfills it from the existing history; it is safe to re-run
+and to run while the master is ingesting (a backfilled row never overwrites a
+newer live one).
+"""
+
+import db
+
+
+def migrate():
+    with db.cursor(commit=True) as cur:
+        # The backfill reads the whole history table; don't apply the request statement_timeout
+        cur.execute("SET LOCAL statement_timeout = 0")
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS vehicle_latest (
+                vehicle_id VARCHAR(20) PRIMARY KEY,
+                anomaly_score DOUBLE PRECISION NOT NULL,
+                subsystems JSONB NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        print("✓ Created vehicle_latest table")
+
+        cur.execute("""
+            INSERT INTO vehicle_latest (vehicle_id, anomaly_score, subsystems, updated_at)
+            SELECT DISTINCT ON (vehicle_id)
+                   vehicle_id, anomaly_score, subsystems, COALESCE(created_at, NOW())
+            FROM health_snapshots
+            ORDER BY vehicle_id, id DESC
+            ON CONFLICT (vehicle_id) DO UPDATE
+            SET anomaly_score = EXCLUDED.anomaly_score,
+                subsystems = EXCLUDED.subsystems,
+                updated_at = EXCLUDED.updated_at
+            WHERE vehicle_latest.updated_at < EXCLUDED.updated_at;
+        """)
+        print(f"✓ Backfilled {cur.rowcount} vehicles from health_snapshots")
+
+    print("\n✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    finally:
+        db.close_pool()
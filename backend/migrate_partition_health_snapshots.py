@@ -0,0 +1,94 @@
+"""
+Migration script to partition health_snapshots by day and create the rollup tables.
+
+Converts the single health_snapshots table into a table range-partitioned on
+created_at, with one partition per day (see snapshot_maintenance.py):
+
+  1. rename the existing table to health_snapshots_legacy
+  2. create the partitioned health_snapshots (same columns; the primary key
+     becomes (id, created_at) as Postgres requires, ids keep their sequence)
+  3. create daily partitions for the history plus a default partition
+  4. copy the history across and drop the legacy table
+
+It also creates health_rollup_1m, health_rollup_1h and rollup_watermarks. The
+master's maintenance job fills the rollups and applies retention from then on.
+
+Everything runs in one transaction, and the copy rewrites the whole history,
+so stop the master first. Re-running it on an already partitioned table only
+makes sure the rollup tables exist.
+"""
+
+import datetime as dt
+
+import db
+from snapshot_maintenance import PARTITION_PREFIX, ROLLUP_TABLES_SQL, ensure_partitions
+
+PREMAKE_DAYS = 3
+
+
+def migrate():
+    with db.cursor(commit=True) as cur:
+        # Rewrites the history table; don't apply the request statement_timeout
+        cur.execute("SET LOCAL statement_timeout = 0")
+
+        cur.execute("SELECT relkind FROM pg_class WHERE relname = 'health_snapshots'")
+        row = cur.fetchone()
+        if row and row[0] == "p":
+            print("health_snapshots is already partitioned, skipping conversion.")
+        else:
+            if row:
+                cur.execute("ALTER TABLE health_snapshots RENAME TO health_snapshots_legacy")
+                cur.execute("ALTER TABLE health_snapshots_legacy RENAME CONSTRAINT health_snapshots_pkey TO health_snapshots_legacy_pkey")
+                # Keep issuing ids from the existing sequence, widened: a row every 2 s per vehicle outgrows INTEGER
+                cur.execute("ALTER SEQUENCE health_snapshots_id_seq AS BIGINT")
+            else:
+                cur.execute("CREATE SEQUENCE IF NOT EXISTS health_snapshots_id_seq AS BIGINT")
+
+            cur.execute("""
+                CREATE TABLE health_snapshots (
+                    id BIGINT NOT NULL DEFAULT nextval('health_snapshots_id_seq'),
+                    vehicle_id VARCHAR(20) NOT NULL,
+                    anomaly_score DOUBLE PRECISION NOT NULL,
+                    subsystems JSONB NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    sensor_snapshot JSONB DEFAULT NULL,
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at);
+            """)
+            cur.execute("ALTER SEQUENCE health_snapshots_id_seq OWNED BY health_snapshots.id")
+            cur.execute(f"CREATE TABLE {PARTITION_PREFIX}default PARTITION OF health_snapshots DEFAULT")
+            cur.execute("""
+                CREATE INDEX idx_health_snapshots_vehicle_time
+                ON health_snapshots (vehicle_id, created_at DESC);
+            """)
+            print("✓ Created partitioned health_snapshots")
+
+            cur.execute("SELECT LOCALTIMESTAMP::date")
+            today = cur.fetchone()[0]
+            first_day = today
+            if row:
+                cur.execute("SELECT min(created_at)::date FROM health_snapshots_legacy")
+                first_day = min(cur.fetchone()[0] or today, today)
+            created = ensure_partitions(cur, first_day, today + dt.timedelta(days=PREMAKE_DAYS))
+            print(f"✓ Created {len(created)} daily partitions from {first_day}")
+
+            if row:
+                cur.execute("""
+                    INSERT INTO health_snapshots (id, vehicle_id, anomaly_score, subsystems, created_at, sensor_snapshot)
+                    SELECT id, vehicle_id, anomaly_score, subsystems, COALESCE(created_at, NOW()), sensor_snapshot
+                    FROM health_snapshots_legacy;
+                """)
+                print(f"✓ Copied {cur.rowcount} rows from the legacy table")
+                cur.execute("DROP TABLE health_snapshots_legacy")
+
+        cur.execute(ROLLUP_TABLES_SQL)
+        print("✓ Created rollup tables")
+
+    print("\n✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    finally:
+        db.close_pool()
@@ -3,22 +3,19 @@ import os
 
 import joblib
 import numpy as np
-import psycopg2
 from sklearn.ensemble import IsolationForest
 
-
-DB_CONFIG = dict(
-    host="localhost",
-    port=5432,
-    dbname="aura",
-    user="postgres",
-    password="postgres",
-)
+import db
+from cold_archive import SENSOR_PREFIX, ColdArchive
+from model_registry import register_model
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 MODEL_PATH = os.path.join(MODEL_DIR, "isoforest.pkl")
 
+# Days the master moved out of the database (COLD_ARCHIVE_AFTER_DAYS); same default as the master
+COLD_ARCHIVE_DIR = os.getenv("COLD_ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "cold_archive"))
+
 
 FEATURE_KEYS = [
     "vehicle_speed_kmh",
@@ -39,25 +36,42 @@ FEATURE_KEYS = [
 
 
 def fetch_sensor_snapshots_safely(limit: int = 5000):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    # Assuming your table has a JSONB column called sensor_snapshot
-    cur.execute(
-        """
-        SELECT sensor_snapshot
-        FROM health_snapshots
-        WHERE sensor_snapshot IS NOT NULL
-        ORDER BY id DESC
-        LIMIT %s
-        """,
-        (limit,),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db.cursor() as cur:
+        # Assuming your table has a JSONB column called sensor_snapshot
+        cur.execute(
+            """
+            SELECT sensor_snapshot
+            FROM health_snapshots
+            WHERE sensor_snapshot IS NOT NULL
+            ORDER BY id DESC
+            LIMIT %s
+            """,
+            (limit,),
+        )
+        rows = cur.fetchall()
     return [r[0] for r in rows]
 
 
+def fetch_archived_features(limit: int) -> np.ndarray:
+    """
+    Up to `limit` feature rows from the cold archive, newest days first,
+    built straight from the per-sensor columns (missing sensors are 0.0, as
+    in build_feature_matrix).
+    """
+    columns = ["has_sensor_snapshot"] + [SENSOR_PREFIX + key for key in FEATURE_KEYS]
+    parts, total = [], 0
+    for _, _, cols in ColdArchive(COLD_ARCHIVE_DIR).scan(columns=columns, newest_first=True):
+        keep = cols["has_sensor_snapshot"].astype(bool)
+        X = np.column_stack([cols[SENSOR_PREFIX + key][keep] for key in FEATURE_KEYS])
+        parts.append(np.nan_to_num(X, nan=0.0).astype(np.float32))
+        total += len(X)
+        if total >= limit:
+            break
+    if not parts:
+        return np.empty((0, len(FEATURE_KEYS)), dtype=np.float32)
+    return np.concatenate(parts)[:limit]
+
+
 def build_feature_matrix(snapshots):
     X = []
     for snap in snapshots:
@@ -86,14 +100,20 @@ def train_isolation_forest(X: np.ndarray):
 
 
 def main():
+    limit = 5000
     print("Fetching sensor snapshots...")
-    snapshots = fetch_sensor_snapshots_safely(limit=5000)
-    if not snapshots:
-        print("No sensor_snapshot data found in DB. Run the simulator first.")
-        return
-
+    snapshots = fetch_sensor_snapshots_safely(limit=limit)
     print(f"Fetched {len(snapshots)} snapshots.")
-    X = build_feature_matrix(snapshots)
+    X = build_feature_matrix(snapshots).reshape(-1, len(FEATURE_KEYS))
+    if len(X) < limit:
+        # Older snapshots live in the cold archive once the master has moved them there
+        archived = fetch_archived_features(limit - len(X))
+        if len(archived):
+            print(f"Read {len(archived)} archived snapshots from {COLD_ARCHIVE_DIR}.")
+            X = np.concatenate([X, archived])
+    if len(X) == 0:
+        print("No sensor_snapshot data found in DB or the cold archive. Run the simulator first.")
+        return
     print("Feature matrix shape:", X.shape)
 
     print("Training Isolation Forest...")
@@ -101,6 +121,15 @@ def main():
 
     print(f"Saving model to {MODEL_PATH} ...")
     joblib.dump(model, MODEL_PATH)
+
+    # Register a new version; running data-agents pick it up without a restart
+    version = register_model(
+        model,
+        FEATURE_KEYS,
+        training_rows=X.shape[0],
+        extra={"n_estimators": model.n_estimators, "contamination": model.contamination},
+    )
+    print(f"Registered model version {version} (now ACTIVE).")
     print("Done.")
 
 
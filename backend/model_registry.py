@@ -0,0 +1,104 @@
+"""
+Versioned model registry on local disk.
+
+Layout under backend/models/registry/:
+
+    v1/isoforest.pkl      fitted model written by ml_training.py
+    v1/isoforest.npz      flattened form, compiled by the data-agent on first load
+    v1/metadata.json      {"version", "feature_keys", "training_rows", "trained_at", ...}
+    v2/...
+    ACTIVE                name of the version agents should serve
+
+ml_training.py registers each new model (and by default promotes it to
+ACTIVE); the data-agent watches ACTIVE and hot-swaps the model it serves.
+This module only touches files and JSON, so it can be imported without sklearn.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+REGISTRY_DIR = os.path.join(os.path.dirname(__file__), "models", "registry")
+ACTIVE_FILE = "ACTIVE"
+METADATA_FILE = "metadata.json"
+MODEL_FILE = "isoforest.pkl"
+FLAT_MODEL_FILE = "isoforest.npz"
+
+
+def version_dir(version: str, registry_dir: str = REGISTRY_DIR) -> str:
+    return os.path.join(registry_dir, version)
+
+
+def list_versions(registry_dir: str = REGISTRY_DIR) -> list[str]:
+    """Registered versions, oldest first."""
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = [
+        name
+        for name in os.listdir(registry_dir)
+        if name.startswith("v") and name[1:].isdigit() and os.path.exists(os.path.join(registry_dir, name, METADATA_FILE))
+    ]
+    return sorted(versions, key=lambda v: int(v[1:]))
+
+
+def read_metadata(version: str, registry_dir: str = REGISTRY_DIR) -> dict:
+    with open(os.path.join(version_dir(version, registry_dir), METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def get_active_version(registry_dir: str = REGISTRY_DIR) -> str | None:
+    """Version named in ACTIVE, falling back to the newest registered version."""
+    try:
+        with open(os.path.join(registry_dir, ACTIVE_FILE)) as f:
+            version = f.read().strip()
+        if version:
+            return version
+    except FileNotFoundError:
+        pass
+    versions = list_versions(registry_dir)
+    return versions[-1] if versions else None
+
+
+def set_active_version(version: str, registry_dir: str = REGISTRY_DIR):
+    if version not in list_versions(registry_dir):
+        raise ValueError(f"Unknown model version: {version}")
+    # Write-then-rename so watchers never read a half-written pointer
+    tmp_path = os.path.join(registry_dir, ACTIVE_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(registry_dir, ACTIVE_FILE))
+
+
+def register_model(
+    model,
+    feature_keys: list[str],
+    training_rows: int,
+    promote: bool = True,
+    extra: dict | None = None,
+    registry_dir: str = REGISTRY_DIR,
+) -> str:
+    """Save a fitted model as the next version and (optionally) make it ACTIVE."""
+    import joblib
+
+    os.makedirs(registry_dir, exist_ok=True)
+    versions = list_versions(registry_dir)
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1}"
+    path = version_dir(version, registry_dir)
+    os.makedirs(path)
+
+    joblib.dump(model, os.path.join(path, MODEL_FILE))
+    metadata = {
+        "version": version,
+        "model_type": type(model).__name__,
+        "feature_keys": list(feature_keys),
+        "training_rows": int(training_rows),
+        "trained_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        **(extra or {}),
+    }
+    # metadata.json is written last: a version only counts once it exists
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    if promote:
+        set_active_version(version, registry_dir)
+    return version
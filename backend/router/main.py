@@ -0,0 +1,402 @@
+"""
+AURA shard router: one endpoint in front of N master-agent shards.
+
+Vehicles are spread over the shards with the consistent-hash ring in
+sharding.py. Each shard is a normal master started with SHARD_COUNT=N and
+SHARD_INDEX=i and its own DB_NAME (and Redis prefix / ingest group, which
+default per shard). Run the router where clients expect the master:
+
+    MASTER_SHARDS=http://127.0.0.1:8001,http://127.0.0.1:8002 uvicorn main:app --port 8000
+
+The order of MASTER_SHARDS is the shard index.
+
+  - per-vehicle endpoints (/store_health, /health, /history, /contact_decision,
+    the dashboard, /bookings/confirm, /bookings/vehicle) are proxied to the
+    vehicle's shard; /store_health_batch is split by shard and sent in parallel
+  - fleet endpoints (/vehicles, /mfg/summary, /bookings/upcoming) scatter to
+    every shard and merge the answers; /mfg/summary merges score histograms,
+    so its quantiles are fleet-wide
+  - /events is proxied to the owner's shard, or merged from all shards for
+    fleet roles (fleet counts in "fleet" events are summed across shards)
+  - /auth/* goes to the first shard; tokens are verified by the shards, which
+    share the JWT secret
+
+Event streams are read with httpx's async client on the event loop, so an
+open dashboard holds a connection to each shard but no worker thread; the
+other endpoints use a keep-alive requests session from the threadpool.
+
+The router reads the token's claims without verifying them, only to pick the
+owner's shard. Every shard still verifies the token on each request.
+
+A batch split across shards is not atomic. If one shard fails, the error
+status is returned, and a retry re-sends rows the other shards already
+stored.
+"""
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import jwt
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared backend modules (sharding) live one directory up
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sharding import HashRing, merge_quantiles
+
+MASTER_SHARDS = [url.strip().rstrip("/") for url in os.getenv("MASTER_SHARDS", "http://127.0.0.1:8001").split(",") if url.strip()]
+RING = HashRing(len(MASTER_SHARDS))
+SHARD_TIMEOUT_S = float(os.getenv("SHARD_TIMEOUT_S", "10"))
+
+# Keep-alive connections to the shards, shared by all requests
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=len(MASTER_SHARDS), pool_maxsize=int(os.getenv("SHARD_POOL_SIZE", "32")))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+# Scatter-gather fan-out
+SCATTER_POOL = ThreadPoolExecutor(max_workers=max(4, 4 * len(MASTER_SHARDS)), thread_name_prefix="scatter")
+# Event streams; every open /events holds one connection per shard it reads
+STREAM_CLIENT = httpx.AsyncClient(
+    timeout=httpx.Timeout(SHARD_TIMEOUT_S, read=None),
+    limits=httpx.Limits(max_connections=None, max_keepalive_connections=len(MASTER_SHARDS)),
+)
+
+# Headers passed through to shards, and back to clients
+REQUEST_HEADERS = ("authorization", "content-type", "if-none-match")
+RESPONSE_HEADERS = ("content-type", "etag", "cache-control")
+
+app = FastAPI(title="AURA Shard Router")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://127.0.0.1:5173", "http://localhost:5173"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    SCATTER_POOL.shutdown(wait=False)
+    SESSION.close()
+    await STREAM_CLIENT.aclose()
+
+
+def shard_for(vehicle_id: str) -> str:
+    return MASTER_SHARDS[RING.shard_for(vehicle_id)]
+
+
+def shard_headers(request: Request) -> dict:
+    headers = {k: v for k, v in request.headers.items() if k.lower() in REQUEST_HEADERS}
+    if "authorization" not in request.headers and "token" in request.query_params:
+        # EventSource passes the token as ?token=; endpoints other than /events need the header
+        headers["Authorization"] = f"Bearer {request.query_params['token']}"
+    return headers
+
+
+def call(base: str, method: str, request: Request, path: str | None = None, body: bytes | None = None,
+         params=None) -> requests.Response:
+    try:
+        return SESSION.request(
+            method,
+            base + (path or request.url.path),
+            params=request.query_params if params is None else params,
+            data=body,
+            headers=shard_headers(request),
+            timeout=SHARD_TIMEOUT_S,
+        )
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"Shard {base} unavailable: {e}")
+
+
+async def open_stream(base: str, request: Request) -> httpx.Response:
+    """GET the same path from a shard without reading the body; the stream stays open, heartbeats come from the shard."""
+    upstream = STREAM_CLIENT.build_request(
+        "GET", base + request.url.path, params=request.query_params, headers=shard_headers(request)
+    )
+    try:
+        return await STREAM_CLIENT.send(upstream, stream=True)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Shard {base} unavailable: {e}")
+
+
+def relay(resp: requests.Response | httpx.Response) -> Response:
+    headers = {k: v for k, v in resp.headers.items() if k.lower() in RESPONSE_HEADERS}
+    return Response(resp.content, status_code=resp.status_code, headers=headers)
+
+
+def scatter(request: Request, path: str | None = None, params=None) -> list[requests.Response]:
+    """GET from every shard in parallel, in shard order."""
+    futures = [SCATTER_POOL.submit(call, base, "GET", request, path, None, params) for base in MASTER_SHARDS]
+    return [f.result() for f in futures]
+
+
+def first_error(responses: list[requests.Response]) -> Response | None:
+    for resp in responses:
+        if resp.status_code >= 400:
+            return relay(resp)
+    return None
+
+
+def token_claims(request: Request) -> dict:
+    """The caller's token claims, NOT verified: only used to pick a shard."""
+    auth = request.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else request.query_params.get("token")
+    if not token:
+        return {}
+    try:
+        return jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return {}
+
+
+def owner_shard(request: Request) -> str | None:
+    """The shard of a car owner's vehicle; None for other roles."""
+    claims = token_claims(request)
+    if claims.get("role") == "user" and claims.get("vehicle_id"):
+        return shard_for(claims["vehicle_id"])
+    return None
+
+
+def body_vehicle_id(body: bytes) -> str:
+    try:
+        return json.loads(body)["vehicle_id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=422, detail="Request body must be a JSON object with a vehicle_id")
+
+
+@app.get("/")
+def root():
+    def status(base):
+        try:
+            return SESSION.get(base + "/", timeout=SHARD_TIMEOUT_S).json()
+        except (requests.RequestException, ValueError) as e:
+            return {"status": "unavailable", "error": str(e)}
+
+    return {
+        "status": "ok",
+        "service": "shard-router",
+        "version": "0.0.1",
+        "shards": dict(zip(MASTER_SHARDS, SCATTER_POOL.map(status, MASTER_SHARDS))),
+    }
+
+
+# ========== AUTH (stateless JWTs, any shard) ==========
+
+@app.post("/auth/login")
+@app.post("/auth/validate")
+async def auth(request: Request):
+    body = await request.body()
+    return relay(await run_in_threadpool(call, MASTER_SHARDS[0], "POST", request, None, body))
+
+
+# ========== PER-VEHICLE ENDPOINTS ==========
+
+@app.post("/store_health")
+@app.post("/bookings/confirm")
+async def route_by_body(request: Request):
+    body = await request.body()
+    return relay(await run_in_threadpool(call, shard_for(body_vehicle_id(body)), "POST", request, None, body))
+
+
+@app.post("/store_health_batch")
+async def store_health_batch(request: Request):
+    """Split the batch by shard and store the parts in parallel."""
+    try:
+        records = json.loads(await request.body())["records"]
+        groups: dict[int, list[dict]] = {}
+        for rec in records:
+            groups.setdefault(RING.shard_for(rec["vehicle_id"]), []).append(rec)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=422, detail="Request body must be {\"records\": [...]} with a vehicle_id per record")
+    if not records:
+        return {"stored": 0}
+
+    def send(shard: int, part: list[dict]) -> requests.Response:
+        return call(MASTER_SHARDS[shard], "POST", request, None, json.dumps({"records": part}).encode())
+
+    responses = await run_in_threadpool(
+        lambda: [f.result() for f in [SCATTER_POOL.submit(send, shard, part) for shard, part in groups.items()]]
+    )
+    if (error := first_error(responses)) is not None:
+        return error
+    results = [resp.json() for resp in responses]
+    committed = all(r.get("durability") == "committed" for r in results)
+    return {"stored": sum(r["stored"] for r in results), "durability": "committed" if committed else "buffered"}
+
+
+@app.get("/health/{vehicle_id}")
+@app.get("/history/{vehicle_id}")
+@app.get("/contact_decision/{vehicle_id}")
+@app.get("/vehicles/{vehicle_id}/dashboard")
+@app.get("/bookings/vehicle/{vehicle_id}")
+def route_by_path(vehicle_id: str, request: Request):
+    return relay(call(shard_for(vehicle_id), "GET", request))
+
+
+# ========== FLEET ENDPOINTS (scatter-gather) ==========
+
+@app.get("/vehicles")
+def list_vehicles(request: Request):
+    owner = owner_shard(request)
+    if owner is not None:
+        return relay(call(owner, "GET", request))
+    responses = scatter(request)
+    if (error := first_error(responses)) is not None:
+        return error
+    vehicles = [v for resp in responses for v in resp.json()["vehicles"]]
+    vehicles.sort(key=lambda v: v["vehicle_id"])
+    return {"vehicles": vehicles}
+
+
+def sum_counts(summaries: list[dict]) -> dict:
+    """Severity counts and fleet size summed over per-shard summaries (or fleet events)."""
+    counts: dict[str, int] = {}
+    for summary in summaries:
+        for level, n in summary["counts"].items():
+            counts[level] = counts.get(level, 0) + n
+    return {"counts": counts, "fleet_size": sum(s["fleet_size"] for s in summaries)}
+
+
+@app.get("/mfg/summary")
+def mfg_summary(request: Request):
+    responses = scatter(request, params={"histograms": "true"})
+    if (error := first_error(responses)) is not None:
+        return error
+    summaries = [resp.json() for resp in responses]
+    return {
+        **sum_counts(summaries),
+        "quantiles": merge_quantiles([s["histograms"] for s in summaries]),
+        "message": summaries[0]["message"],
+        "shards": len(summaries),
+    }
+
+
+@app.get("/bookings/upcoming")
+def upcoming_bookings(request: Request, limit: int = 10):
+    responses = scatter(request)
+    if (error := first_error(responses)) is not None:
+        return error
+    results = [resp.json() for resp in responses]
+    # Each shard returns its `limit` soonest; the fleet's soonest are among them
+    bookings = sorted((b for r in results for b in r["bookings"]), key=lambda b: b["slot_start"] or "")[:limit]
+    out = {"bookings": bookings, "count": len(bookings)}
+    errors = [r["error"] for r in results if "error" in r]
+    if errors:
+        out["error"] = errors[0]
+    return out
+
+
+# ========== EVENTS ==========
+
+def _field(lines: list[str], name: str) -> str | None:
+    prefix = name + ": "
+    return next((line[len(prefix):] for line in lines if line.startswith(prefix)), None)
+
+
+async def merge_event_streams(streams: list[httpx.Response], fleet: dict[int, dict]):
+    """
+    Interleave the SSE frames of several shard streams. The "ready" event is
+    sent once, and "fleet" events carry counts summed over the latest known
+    counts of every shard (`fleet`, seeded from /mfg/summary). The merged
+    stream ends when any shard's stream ends, so the client reconnects to all.
+    """
+    frames: asyncio.Queue = asyncio.Queue()
+
+    async def pump(shard: int, resp: httpx.Response):
+        lines: list[str] = []
+        try:
+            async for line in resp.aiter_lines():
+                if line:
+                    lines.append(line)
+                elif lines:
+                    frames.put_nowait((shard, lines))
+                    lines = []
+        except Exception:
+            pass  # closed by the merger, or the shard went away
+        finally:
+            frames.put_nowait((shard, None))
+
+    pumps = [asyncio.create_task(pump(shard, resp)) for shard, resp in enumerate(streams)]
+    ready_sent = False
+    try:
+        while True:
+            shard, lines = await frames.get()
+            if lines is None:
+                return
+            event = _field(lines, "event")
+            if event == "ready":
+                if ready_sent:
+                    continue
+                ready_sent = True
+            elif event == "fleet":
+                try:
+                    fleet[shard] = json.loads(_field(lines, "data") or "")
+                except ValueError:
+                    continue
+                lines = ["event: fleet", "data: " + json.dumps(sum_counts(list(fleet.values())), separators=(",", ":"))]
+            yield "\n".join(lines) + "\n\n"
+    finally:
+        for task in pumps:
+            task.cancel()
+        await close_streams(streams)
+
+
+async def relay_stream(resp: httpx.Response):
+    """A shard's SSE bytes as they arrive; the upstream response is closed when the client goes away."""
+    try:
+        async for chunk in resp.aiter_raw():
+            yield chunk
+    finally:
+        await resp.aclose()
+
+
+async def close_streams(streams: list[httpx.Response]):
+    # Runs once the client's response is over, disconnects included
+    for resp in streams:
+        await resp.aclose()
+
+
+@app.get("/events")
+async def events(request: Request):
+    owner = owner_shard(request)
+    bases = [owner] if owner is not None else MASTER_SHARDS
+    streams: list[httpx.Response] = []
+    try:
+        for base in bases:
+            streams.append(await open_stream(base, request))
+    except HTTPException:
+        await close_streams(streams)
+        raise
+    failed = next((resp for resp in streams if resp.status_code != 200), None)
+    if failed is not None:
+        await failed.aread()
+        out = relay(failed)
+        await close_streams(streams)
+        return out
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    cleanup = BackgroundTask(close_streams, streams)
+    if len(streams) == 1:
+        return StreamingResponse(
+            relay_stream(streams[0]), media_type="text/event-stream", headers=headers, background=cleanup
+        )
+
+    fleet: dict[int, dict] = {}
+    if token_claims(request).get("role") == "manufacturing":
+        for shard, resp in enumerate(await run_in_threadpool(scatter, request, "/mfg/summary", {})):
+            if resp.status_code == 200:
+                fleet[shard] = sum_counts([resp.json()])
+    return StreamingResponse(
+        merge_event_streams(streams, fleet), media_type="text/event-stream", headers=headers, background=cleanup
+    )
@@ -2,18 +2,24 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import datetime as dt
+import os
+import sys
 import requests
-import psycopg2
+
+# Shared backend modules (db) live one directory up
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import db
 
 MASTER_URL = "http://127.0.0.1:8000/contact_decision"
-DB_HOST = "localhost"
-DB_PORT = 5432
-DB_NAME = "aura"
-DB_USER = "postgres"
-DB_PASS = "postgres"
 
 app = FastAPI(title="AURA Scheduling Agent - Stub v0")
 
+
+@app.on_event("shutdown")
+def shutdown():
+    db.close_pool()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://127.0.0.1:5173", "http://localhost:5173"],
@@ -36,26 +42,16 @@ def get_booked_slots(vehicle_id: str):
     Returns list of (slot_start, slot_end) tuples.
     """
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-        )
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT slot_start, slot_end
-            FROM bookings
-            WHERE vehicle_id = %s AND status = 'confirmed'
-            """,
-            (vehicle_id,),
-        )
-        booked = cur.fetchall()
-        cur.close()
-        conn.close()
-        return booked
+        with db.cursor() as cur:
+            cur.execute(
+                """
+                SELECT slot_start, slot_end
+                FROM bookings
+                WHERE vehicle_id = %s AND status = 'confirmed'
+                """,
+                (vehicle_id,),
+            )
+            return cur.fetchall()
     except Exception as e:
         print(f"Error fetching booked slots: {e}")
         return []
@@ -84,7 +80,7 @@ def slot_is_available(slot_start_iso: str, slot_end_iso: str, booked_slots):
 
 @app.get("/")
 def root():
-    return {"status": "ok", "service": "scheduling-agent", "version": "0.0.2"}
+    return {"status": "ok", "service": "scheduling-agent", "version": "0.0.2", "db_pool": db.pool_stats()}
 
 
 def generate_slots(days: int, severity: str):
@@ -1,26 +1,33 @@
-import psycopg2
+import db
 
-conn = psycopg2.connect(
-    host="localhost",
-    port=5432,
-    dbname="aura",
-    user="postgres",
-    password="postgres",
-)
-cur = conn.cursor()
+# Everything the master's health writer touches (see master-agent/health_writer.py)
+with db.cursor(commit=True) as cur:
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS health_snapshots (
+        id SERIAL PRIMARY KEY,
+        vehicle_id VARCHAR(20) NOT NULL,
+        anomaly_score DOUBLE PRECISION NOT NULL,
+        subsystems JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW(),
+        sensor_snapshot JSONB DEFAULT NULL
+    );
+    """)
+    # Tables created before sensor_snapshot existed
+    cur.execute("ALTER TABLE health_snapshots ADD COLUMN IF NOT EXISTS sensor_snapshot JSONB DEFAULT NULL;")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_health_snapshots_vehicle_time
+    ON health_snapshots (vehicle_id, created_at DESC);
+    """)
+    # Read model upserted in the same transaction as every history insert;
+    # the primary key serves both the upsert and /vehicles' ORDER BY vehicle_id
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS vehicle_latest (
+        vehicle_id VARCHAR(20) PRIMARY KEY,
+        anomaly_score DOUBLE PRECISION NOT NULL,
+        subsystems JSONB NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+db.close_pool()
 
-cur.execute("""
-CREATE TABLE IF NOT EXISTS health_snapshots (
-    id SERIAL PRIMARY KEY,
-    vehicle_id VARCHAR(20) NOT NULL,
-    anomaly_score DOUBLE PRECISION NOT NULL,
-    subsystems JSONB NOT NULL,
-    created_at TIMESTAMP DEFAULT NOW()
-);
-""")
-
-conn.commit()
-cur.close()
-conn.close()
-
-print("health_snapshots table ready.")
\ No newline at end of file
+print("health_snapshots and vehicle_latest tables ready.")
@@ -0,0 +1,107 @@
+"""
+Consistent-hash sharding of vehicles across master-agent instances.
+
+A sharded deployment runs N masters, each with its own latest state and its
+own database (DB_NAME per shard), behind the router (backend/router/main.py).
+Every vehicle belongs to exactly one shard:
+
+    ring = HashRing(N)
+    ring.shard_for("VH001")   # 0 .. N-1
+
+Each shard owns `vnodes` points on a 64-bit ring, and a vehicle maps to the
+first point at or after the hash of its id. Shards are named by index, not by
+address, so moving a master to a new host does not move vehicles. Going from
+N to N+1 shards moves about 1/(N+1) of the vehicles; their history stays in
+the old shard's database unless it is copied across.
+
+Masters learn their place from SHARD_COUNT and SHARD_INDEX and refuse
+records for vehicles they do not own. The router reads the same SHARD_COUNT
+from the length of MASTER_SHARDS. With an ingest log, the data-agent (given
+the same SHARD_COUNT) writes each record to its shard's own log or topic,
+named with shard_suffix, so every master reads only its own vehicles.
+
+Fleet quantiles cannot be combined from per-shard quantiles, so shards also
+export their score histograms (GET /mfg/summary?histograms=true) and
+merge_quantiles combines those.
+"""
+
+import bisect
+import hashlib
+import math
+
+import numpy as np
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, shards: int, vnodes: int = 160):
+        if shards < 1:
+            raise ValueError("a ring needs at least one shard")
+        self.shards = shards
+        points = sorted((_hash(f"shard-{s}#{v}"), s) for s in range(shards) for v in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [s for _, s in points]
+
+    def shard_for(self, vehicle_id: str) -> int:
+        if self.shards == 1:
+            return 0
+        i = bisect.bisect_left(self._points, _hash(vehicle_id))
+        return self._owners[i % len(self._owners)]
+
+    def group(self, vehicle_ids) -> dict[int, list[str]]:
+        """vehicle_ids by owning shard."""
+        out: dict[int, list[str]] = {}
+        for vid in vehicle_ids:
+            out.setdefault(self.shard_for(vid), []).append(vid)
+        return out
+
+
+def shard_suffix(shards: int, index: int) -> str:
+    """Appended to per-shard resource names (log directory, topic, Redis prefix); empty when unsharded."""
+    return "" if shards == 1 else f"-{index}"
+
+
+def merge_bins(histograms: list[dict[str, int]]) -> dict[int, int]:
+    """Sum sparse {bin index: count} histograms (JSON object keys are strings)."""
+    out: dict[int, int] = {}
+    for bins in histograms:
+        for b, count in bins.items():
+            out[int(b)] = out.get(int(b), 0) + count
+    return out
+
+
+def quantiles_from_bins(
+    bins: dict[int, int], qs: tuple[float, ...], resolution: float, max_value: float = math.inf
+) -> list[float | None]:
+    """Nearest-rank quantiles (bin centres, at most max_value), as ScoreHistogram.quantiles computes them."""
+    total = sum(bins.values())
+    if total == 0:
+        return [None] * len(qs)
+    idx = np.array(sorted(bins))
+    cum = np.cumsum([bins[b] for b in idx.tolist()])
+    ranks = np.maximum(np.ceil(np.asarray(qs) * total), 1)
+    return [min(round((b + 0.5) * resolution, 6), max_value) for b in idx[np.searchsorted(cum, ranks)].tolist()]
+
+
+def merge_quantiles(histograms: list[dict], qs: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict:
+    """
+    Fleet quantiles, shaped like LatestStateStore.score_quantiles, from the
+    "histograms" of several shards' /mfg/summary?histograms=true.
+    """
+    if not histograms:
+        return {"anomaly_score": {}, "subsystems": {}}
+    resolution = histograms[0]["resolution"]
+    # Shards from before the histograms had an overflow bin send no "max"
+    max_value = histograms[0].get("max", math.inf)
+
+    def named(bins: dict[int, int]) -> dict:
+        return {f"p{round(q * 100, 1):g}": v for q, v in zip(qs, quantiles_from_bins(bins, qs, resolution, max_value))}
+
+    names = sorted({name for h in histograms for name in h["subsystems"]})
+    return {
+        "anomaly_score": named(merge_bins([h["anomaly_score"] for h in histograms])),
+        "subsystems": {name: named(merge_bins([h["subsystems"].get(name, {}) for h in histograms])) for name in names},
+    }
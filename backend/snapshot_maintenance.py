@@ -0,0 +1,391 @@
+"""
+Partitioning, retention and rollups for health_snapshots.
+
+health_snapshots is range-partitioned by created_at into daily partitions
+named health_snapshots_pYYYYMMDD (migrate_partition_health_snapshots.py
+converts the old single table), plus a default partition that catches rows
+if a day's partition was not created in time. SnapshotMaintenance runs in
+the master and, every `interval_s`:
+
+  - creates the partitions for today and the next `premake_days` days
+  - rolls completed minutes of raw rows into health_rollup_1m, then completed
+    hours of those into health_rollup_1h (samples, min/max/mean score and
+    per-subsystem means), tracking progress in rollup_watermarks
+  - drops raw partitions older than `retention_days` if it is set (never
+    ones that have not been rolled up yet) and 1-minute rollups older than
+    `rollup_1m_retention_days`; hourly rollups are kept
+  - with a cold archive (cold_archive.py), raw partitions are instead moved
+    there once they are `archive_after_days` old: written to columnar files,
+    then dropped. A partition is never dropped before it is archived
+
+Rows are timestamped by the database at commit (created_at default), so a
+minute is rolled up only once it is `rollup_lag_s` in the past. Several
+masters can run this at once: a session advisory lock lets one of them work
+per cycle.
+
+It needs the partitioned table: on a database that has not been migrated
+yet, the first cycle prints a warning and the job stops.
+"""
+
+import datetime as dt
+import re
+import threading
+import time
+
+import psycopg2
+
+import db
+from cold_archive import ColdArchive
+
+PARTITION_PREFIX = "health_snapshots_p"
+PARTITION_RE = re.compile(rf"^{PARTITION_PREFIX}(\d{{8}})$")
+
+# Arbitrary key for pg_try_advisory_lock ("AURA"), shared by all masters
+ADVISORY_LOCK_KEY = 0x41555241
+
+ROLLUP_1M_SQL = """
+WITH scores AS (
+    SELECT vehicle_id,
+           date_trunc('minute', created_at) AS bucket,
+           count(*) AS samples,
+           min(anomaly_score) AS min_score,
+           max(anomaly_score) AS max_score,
+           avg(anomaly_score) AS mean_score
+    FROM health_snapshots
+    WHERE created_at >= %(start)s AND created_at < %(end)s
+    GROUP BY 1, 2
+), subs AS (
+    SELECT vehicle_id, bucket, jsonb_object_agg(key, mean) AS subsystem_means
+    FROM (
+        SELECT h.vehicle_id, date_trunc('minute', h.created_at) AS bucket, e.key, avg(e.value::float8) AS mean
+        FROM health_snapshots h, jsonb_each_text(h.subsystems) e
+        WHERE h.created_at >= %(start)s AND h.created_at < %(end)s
+        GROUP BY 1, 2, 3
+    ) per_key
+    GROUP BY 1, 2
+)
+INSERT INTO health_rollup_1m (vehicle_id, bucket, samples, min_score, max_score, mean_score, subsystem_means)
+SELECT s.vehicle_id, s.bucket, s.samples, s.min_score, s.max_score, s.mean_score, COALESCE(u.subsystem_means, '{}')
+FROM scores s
+LEFT JOIN subs u USING (vehicle_id, bucket)
+ON CONFLICT (vehicle_id, bucket) DO UPDATE
+SET samples = EXCLUDED.samples,
+    min_score = EXCLUDED.min_score,
+    max_score = EXCLUDED.max_score,
+    mean_score = EXCLUDED.mean_score,
+    subsystem_means = EXCLUDED.subsystem_means
+"""
+
+# Hourly rollups are built from the minute rollups; means are weighted by samples
+ROLLUP_1H_SQL = """
+WITH scores AS (
+    SELECT vehicle_id,
+           date_trunc('hour', bucket) AS hour,
+           sum(samples) AS samples,
+           min(min_score) AS min_score,
+           max(max_score) AS max_score,
+           sum(mean_score * samples) / sum(samples) AS mean_score
+    FROM health_rollup_1m
+    WHERE bucket >= %(start)s AND bucket < %(end)s
+    GROUP BY 1, 2
+), subs AS (
+    SELECT vehicle_id, hour, jsonb_object_agg(key, mean) AS subsystem_means
+    FROM (
+        SELECT r.vehicle_id, date_trunc('hour', r.bucket) AS hour, e.key,
+               sum(e.value::float8 * r.samples) / sum(r.samples) AS mean
+        FROM health_rollup_1m r, jsonb_each_text(r.subsystem_means) e
+        WHERE r.bucket >= %(start)s AND r.bucket < %(end)s
+        GROUP BY 1, 2, 3
+    ) per_key
+    GROUP BY 1, 2
+)
+INSERT INTO health_rollup_1h (vehicle_id, bucket, samples, min_score, max_score, mean_score, subsystem_means)
+SELECT s.vehicle_id, s.hour, s.samples, s.min_score, s.max_score, s.mean_score, COALESCE(u.subsystem_means, '{}')
+FROM scores s
+LEFT JOIN subs u USING (vehicle_id, hour)
+ON CONFLICT (vehicle_id, bucket) DO UPDATE
+SET samples = EXCLUDED.samples,
+    min_score = EXCLUDED.min_score,
+    max_score = EXCLUDED.max_score,
+    mean_score = EXCLUDED.mean_score,
+    subsystem_means = EXCLUDED.subsystem_means
+"""
+
+ROLLUP_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS health_rollup_1m (
+    vehicle_id VARCHAR(20) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    samples INTEGER NOT NULL,
+    min_score DOUBLE PRECISION NOT NULL,
+    max_score DOUBLE PRECISION NOT NULL,
+    mean_score DOUBLE PRECISION NOT NULL,
+    subsystem_means JSONB NOT NULL,
+    PRIMARY KEY (vehicle_id, bucket)
+);
+CREATE TABLE IF NOT EXISTS health_rollup_1h (LIKE health_rollup_1m INCLUDING ALL);
+CREATE INDEX IF NOT EXISTS idx_health_rollup_1m_bucket ON health_rollup_1m (bucket);
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    rollup TEXT PRIMARY KEY,
+    through TIMESTAMP NOT NULL
+);
+"""
+
+
+def partition_name(day: dt.date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def ensure_partitions(cur, first_day: dt.date, last_day: dt.date) -> list[str]:
+    """Create the daily partitions for first_day..last_day that don't exist yet."""
+    created = []
+    day = first_day
+    while day <= last_day:
+        name = partition_name(day)
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            cur.execute(
+                f"CREATE TABLE {name} PARTITION OF health_snapshots FOR VALUES FROM (%s) TO (%s)",
+                (day, day + dt.timedelta(days=1)),
+            )
+            created.append(name)
+        day += dt.timedelta(days=1)
+    return created
+
+
+def raw_partitions(cur) -> list[tuple[str, dt.date]]:
+    """Daily partitions of health_snapshots, oldest first (the default partition is not included)."""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'health_snapshots'::regclass
+        """
+    )
+    parts = []
+    for (name,) in cur.fetchall():
+        m = PARTITION_RE.match(name)
+        if m:
+            parts.append((name, dt.datetime.strptime(m.group(1), "%Y%m%d").date()))
+    return sorted(parts, key=lambda p: p[1])
+
+
+def archive_partition(conn, archive: ColdArchive, name: str, day: dt.date) -> dict:
+    """Copy one raw partition into the cold archive, one vehicle at a time (see ColdArchive.write_day)."""
+    # A server-side cursor streams the day instead of loading it into memory
+    with conn.cursor(name=f"archive_{name}") as cur:
+        cur.itersize = 10000
+        cur.execute(
+            f"""
+            SELECT vehicle_id, id, created_at, anomaly_score, subsystems, sensor_snapshot
+            FROM {name}
+            ORDER BY vehicle_id, created_at, id
+            """
+        )
+
+        def by_vehicle():
+            vehicle_id, rows = None, []
+            for vid, *row in cur:
+                if vid != vehicle_id:
+                    if rows:
+                        yield vehicle_id, rows
+                    vehicle_id, rows = vid, []
+                rows.append(tuple(row))
+            if rows:
+                yield vehicle_id, rows
+
+        written = archive.write_day(day, by_vehicle())
+    conn.commit()
+    return written
+
+
+def _watermark(cur, rollup: str) -> dt.datetime | None:
+    cur.execute("SELECT through FROM rollup_watermarks WHERE rollup = %s", (rollup,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _set_watermark(cur, rollup: str, through: dt.datetime):
+    cur.execute(
+        """
+        INSERT INTO rollup_watermarks (rollup, through) VALUES (%s, %s)
+        ON CONFLICT (rollup) DO UPDATE SET through = EXCLUDED.through
+        """,
+        (rollup, through),
+    )
+
+
+class SnapshotMaintenance:
+    def __init__(
+        self,
+        interval_s: float = 60.0,
+        retention_days: int = 0,
+        premake_days: int = 3,
+        rollup_lag_s: float = 60.0,
+        rollup_1m_retention_days: int = 90,
+        archive: ColdArchive | None = None,
+        archive_after_days: int = 7,
+    ):
+        self.interval_s = interval_s
+        self.retention_days = retention_days
+        self.premake_days = premake_days
+        self.rollup_lag_s = rollup_lag_s
+        self.rollup_1m_retention_days = rollup_1m_retention_days
+        self.archive = archive
+        self.archive_after_days = archive_after_days
+        self._stop = threading.Event()
+
+        # Counters for the status endpoint
+        self.runs = 0
+        self.skipped_runs = 0
+        self.partitions_created = 0
+        self.partitions_dropped = 0
+        self.partitions_archived = 0
+        self.rows_archived = 0
+        self.archive_bytes = 0
+        self.rollup_1m_through: dt.datetime | None = None
+        self.rollup_1h_through: dt.datetime | None = None
+        self.last_run_ms = 0.0
+        self.last_error: str | None = None
+        self.disabled: str | None = None
+
+        self._thread = None
+        if interval_s > 0:
+            self._thread = threading.Thread(target=self._run, name="snapshot-maintenance", daemon=True)
+            self._thread.start()
+
+    def run_once(self) -> bool:
+        """One maintenance cycle; False if another master holds the lock or the table is not partitioned."""
+        if self.disabled:
+            return False
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('health_snapshots')")
+                row = cur.fetchone()
+                conn.rollback()
+                if row is None or row[0] != "p":
+                    self.disabled = "health_snapshots is not partitioned (run migrate_partition_health_snapshots.py)"
+                    self._stop.set()
+                    print(f"Snapshot maintenance disabled: {self.disabled}")
+                    return False
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    self.skipped_runs += 1
+                    return False
+                try:
+                    # Rollup windows and DDL can run longer than the per-request statement_timeout
+                    cur.execute("SET statement_timeout = 0")
+                    conn.commit()
+                    self._cycle(conn, cur)
+                finally:
+                    conn.rollback()
+                    cur.execute("RESET statement_timeout")
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+                    conn.commit()
+        self.runs += 1
+        return True
+
+    def _cycle(self, conn, cur):
+        cur.execute("SELECT LOCALTIMESTAMP")
+        now = cur.fetchone()[0]
+
+        today = now.date()
+        try:
+            self.partitions_created += len(ensure_partitions(cur, today, today + dt.timedelta(days=self.premake_days)))
+            conn.commit()
+        except psycopg2.Error as e:
+            # e.g. the default partition already holds rows for that day; rollups and retention still run
+            conn.rollback()
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Could not create health_snapshots partitions: {self.last_error}")
+
+        # Minutes that can no longer receive rows, one hour per transaction
+        end_1m = (now - dt.timedelta(seconds=self.rollup_lag_s)).replace(second=0, microsecond=0)
+        self.rollup_1m_through = self._advance(
+            conn, cur, "1m", ROLLUP_1M_SQL,
+            "SELECT date_trunc('minute', min(created_at)) FROM health_snapshots",
+            end_1m, dt.timedelta(hours=1),
+        )
+
+        # Hours whose minutes are all rolled up, one day per transaction
+        if self.rollup_1m_through is not None:
+            end_1h = self.rollup_1m_through.replace(minute=0, second=0, microsecond=0)
+            self.rollup_1h_through = self._advance(
+                conn, cur, "1h", ROLLUP_1H_SQL,
+                "SELECT date_trunc('hour', min(bucket)) FROM health_rollup_1m",
+                end_1h, dt.timedelta(days=1),
+            )
+
+        # Retention: only drop raw days that are fully rolled up (and archived, with an archive)
+        days = self.retention_days if self.archive is None else self.archive_after_days
+        cutoff = today - dt.timedelta(days=days) if days > 0 else dt.date.min
+        rolled_up_day = self.rollup_1m_through.date() if self.rollup_1m_through else dt.date.min
+        for name, day in raw_partitions(cur):
+            if day < cutoff and day < rolled_up_day:
+                # A day directory already there means an earlier cycle archived it but did not get to drop it
+                if self.archive is not None and not self.archive.has_day(day):
+                    written = archive_partition(conn, self.archive, name, day)
+                    self.partitions_archived += 1
+                    self.rows_archived += written["rows"]
+                    self.archive_bytes += written["bytes"]
+                    print(f"Archived raw partition {name}: {written['rows']} rows, {written['vehicles']} vehicles, {written['bytes']} bytes")
+                cur.execute(f"DROP TABLE {name}")
+                conn.commit()
+                self.partitions_dropped += 1
+                print(f"Dropped raw partition {name} (older than {days} days)")
+        cur.execute(
+            "DELETE FROM health_rollup_1m WHERE bucket < %s",
+            (now - dt.timedelta(days=self.rollup_1m_retention_days),),
+        )
+        conn.commit()
+
+    def _advance(self, conn, cur, rollup, sql, first_bucket_sql, end, step) -> dt.datetime | None:
+        start = _watermark(cur, rollup)
+        if start is None:
+            cur.execute(first_bucket_sql)
+            start = cur.fetchone()[0]
+            if start is None:
+                return None  # nothing to roll up yet
+        while start < end:
+            stop = min(start + step, end)
+            cur.execute(sql, {"start": start, "end": stop})
+            _set_watermark(cur, rollup, stop)
+            conn.commit()
+            start = stop
+        return start
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            start = time.monotonic()
+            try:
+                self.run_once()
+            except (psycopg2.Error, db.PoolTimeout, OSError) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Snapshot maintenance failed: {self.last_error}")
+            self.last_run_ms = (time.monotonic() - start) * 1000.0
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "interval_s": self.interval_s,
+            "retention_days": self.retention_days,
+            "disabled": self.disabled,
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "partitions_created": self.partitions_created,
+            "partitions_dropped": self.partitions_dropped,
+            "archive": {
+                "root": self.archive.root,
+                "after_days": self.archive_after_days,
+                "partitions_archived": self.partitions_archived,
+                "rows_archived": self.rows_archived,
+                "bytes_written": self.archive_bytes,
+            } if self.archive is not None else None,
+            "rollup_1m_through": self.rollup_1m_through.isoformat() if self.rollup_1m_through else None,
+            "rollup_1h_through": self.rollup_1h_through.isoformat() if self.rollup_1h_through else None,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,13 @@
+"""
+Unit tests for the backend's pure modules; run with `python -m pytest backend/tests`.
+
+The services are not packages: each imports its siblings and the shared
+backend/ modules by path, so the tests do the same.
+"""
+
+import os
+import sys
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+for path in (BACKEND, os.path.join(BACKEND, "data-agent"), os.path.join(BACKEND, "master-agent")):
+    sys.path.insert(0, os.path.abspath(path))
@@ -0,0 +1,86 @@
+import numpy as np
+
+from batch_scoring import build_feature_matrix, feature_matrix_from_matrix
+from rule_engine import DEFAULT_RULES_PATH, load_rules
+from scoring import FEATURE_KEYS
+from wire import WIRE_FIELDS, decode_records, encode_records, snapshots_from_values
+
+
+def random_readings(n: int, seed: int = 0) -> list[dict]:
+    """Sensor dicts spread across every rule threshold, with aliases and missing keys."""
+    rng = np.random.default_rng(seed)
+    readings = []
+    for _ in range(n):
+        sensors = {
+            "brake_disc_temp_c": rng.uniform(40, 220),
+            "brake_pressure_bar": rng.uniform(0, 140),
+            "hard_brake_events": int(rng.integers(0, 4)),
+            "vibration_rms_g": rng.uniform(0.1, 1.2),
+            "vibration_spike": int(rng.integers(0, 2)),
+            "coolant_temp_c": rng.uniform(70, 130),
+            "oil_temp_c": rng.uniform(70, 140),
+            "engine_rpm": rng.uniform(600, 7500),
+            "battery_voltage_v": rng.uniform(11.0, 14.5),
+            "tire_pressure_psi": rng.uniform(18, 50),
+            "dtc_count": int(rng.integers(0, 4)),
+        }
+        for key in list(sensors):
+            if rng.random() < 0.15:
+                del sensors[key]
+        if "coolant_temp_c" not in sensors and rng.random() < 0.5:
+            sensors["engine_temp"] = rng.uniform(70, 130)
+        readings.append(sensors)
+    return readings
+
+
+def test_vectorized_rules_match_scalar():
+    rules = load_rules(DEFAULT_RULES_PATH)
+    readings = random_readings(2000)
+
+    scores, subsystems = rules.evaluate_batch(readings)
+    for i, sensors in enumerate(readings):
+        score, subs = rules.score(sensors)
+        assert float(max(0.0, min(1.0, round(scores.tolist()[i], 2)))) == score
+        assert {name: round(col.tolist()[i], 2) for name, col in subsystems.items()} == subs
+
+
+def test_wire_columns_match_dict_columns():
+    rules = load_rules(DEFAULT_RULES_PATH)
+    # The wire format only carries canonical keys
+    readings = [{k: v for k, v in s.items() if k in WIRE_FIELDS} for s in random_readings(500, seed=1)]
+    values = np.array([[s.get(f, np.nan) for f in WIRE_FIELDS] for s in readings], dtype=np.float64)
+
+    from_dicts = rules.evaluate_columns(rules.columns_from_dicts(readings))
+    from_matrix = rules.evaluate_columns(rules.columns_from_matrix(values, WIRE_FIELDS))
+    np.testing.assert_array_equal(from_dicts[0], from_matrix[0])
+    for name in rules.subsystems:
+        np.testing.assert_array_equal(from_dicts[1][name], from_matrix[1][name])
+
+    np.testing.assert_array_equal(
+        build_feature_matrix(readings, FEATURE_KEYS), feature_matrix_from_matrix(values, WIRE_FIELDS, FEATURE_KEYS)
+    )
+
+
+def test_wire_snapshots_keep_sensor_types():
+    # As the simulator sends them: counters and flags are ints, measurements floats
+    sensors = {
+        "engine_rpm": 2150,
+        "vehicle_speed_kmh": 63.0,
+        "coolant_temp_c": 92.4,
+        "hard_brake_events": 1,
+        "dtc_count": 0,
+        "brake_pedal": 1,
+        "idling": 0,
+        "odometer_km": 18231.7,
+    }
+    _, values, _ = decode_records(encode_records([{"vehicle_id": "V1", "sensors": sensors}]))
+    snapshot = snapshots_from_values(values)[0]
+    assert snapshot == sensors
+    assert {k: type(v) for k, v in snapshot.items()} == {k: type(v) for k, v in sensors.items()}
+
+
+def test_feature_matrix_marks_missing_sensors():
+    X, present = build_feature_matrix([{"engine_rpm": 900}, {}], ["engine_rpm", "coolant_temp_c"], return_mask=True)
+    assert X.dtype == np.float32
+    np.testing.assert_array_equal(X, [[900, 0], [0, 0]])
+    np.testing.assert_array_equal(present, [[True, False], [False, False]])
@@ -0,0 +1,95 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+import cold_archive
+from cold_archive import ColdArchive, ColdFile, rows_from_columns
+
+DAY = dt.date(2024, 5, 1)
+
+
+def day_rows(day: dt.date, n: int, first_id: int = 1, seed: int = 0) -> list[tuple]:
+    """(id, created_at, anomaly_score, subsystems, sensor_snapshot) rows, some sharing a timestamp."""
+    rng = np.random.default_rng(seed)
+    start = dt.datetime.combine(day, dt.time(0, 0))
+    rows = []
+    for i in range(n):
+        subsystems = {"brakes": round(float(rng.uniform()), 3), "engine": round(float(rng.uniform()), 3)}
+        if i % 7 == 0:
+            del subsystems["engine"]
+        snapshot = None if i % 5 == 0 else {"engine_rpm": 800 + i, "idling": i % 2 == 0, "gear": "D"}
+        created = start + dt.timedelta(seconds=30 * (i // 2))
+        rows.append((first_id + i, created, round(float(rng.uniform()), 3), subsystems, snapshot))
+    return rows
+
+
+def as_history(rows: list[tuple]) -> list[tuple]:
+    return [(r[0], r[2], r[3], r[1]) for r in rows]
+
+
+@pytest.fixture
+def small_groups(monkeypatch):
+    # Several row groups per file without writing thousands of rows
+    monkeypatch.setattr(cold_archive, "ROW_GROUP_ROWS", 64)
+
+
+def test_round_trip(tmp_path, small_groups):
+    archive = ColdArchive(str(tmp_path), fsync=False)
+    rows = day_rows(DAY, 300)
+    written = archive.write_day(DAY, [("VH/1", rows), ("VH2", [])])
+
+    assert written["vehicles"] == 1 and written["rows"] == 300
+    assert archive.days() == [DAY]
+    assert archive.vehicles(DAY) == ["VH/1"]
+    with archive.open(DAY, "VH/1") as f:
+        assert f.subsystems() == ["brakes", "engine"]
+        assert f.sensors() == ["engine_rpm"]
+        cols = f.read()
+    assert rows_from_columns(cols) == as_history(rows)
+    np.testing.assert_array_equal(cols["sensor.engine_rpm"][1:5], [801, 802, 803, 804])
+    assert cols["has_sensor_snapshot"].tolist() == [r[4] is not None for r in rows]
+    assert cols["extra"][1] == {"idling": False, "gear": "D"}
+
+
+def test_time_range_and_missing_columns(tmp_path, small_groups):
+    archive = ColdArchive(str(tmp_path), fsync=False)
+    rows = day_rows(DAY, 300)
+    archive.write_day(DAY, [("VH1", rows)])
+    start, end = rows[100][1], rows[201][1]
+
+    with archive.open(DAY, "VH1") as f:
+        cols = f.read(["id", "sub.", "sensor.absent"], start, end)
+    expected = [r[0] for r in rows if start <= r[1] < end]
+    assert cols["id"].tolist() == expected
+    assert sorted(cols) == ["id", "sensor.absent", "sub.brakes", "sub.engine"]
+    assert np.isnan(cols["sensor.absent"]).all() and len(cols["sensor.absent"]) == len(expected)
+
+
+def test_keyset_pages_and_series_across_days(tmp_path, small_groups):
+    archive = ColdArchive(str(tmp_path), fsync=False)
+    day2 = DAY + dt.timedelta(days=1)
+    rows = day_rows(DAY, 150) + day_rows(day2, 150, first_id=151, seed=1)
+    archive.write_day(DAY, [("VH1", rows[:150])])
+    archive.write_day(day2, [("VH1", rows[150:])])
+    start, end = dt.datetime.combine(DAY, dt.time()), dt.datetime.combine(day2 + dt.timedelta(days=1), dt.time())
+
+    pages, before = [], None
+    while page := archive.page("VH1", start, end, before, 39):
+        pages.extend(page)
+        before = (page[-1][3], page[-1][0])
+    assert pages == as_history(rows)[::-1]
+    assert archive.series("VH1", start, end) == as_history(rows)
+    assert archive.series("VH1", start, dt.datetime.combine(day2, dt.time())) == as_history(rows[:150])
+
+
+def test_rejects_other_files_and_ignores_unfinished_days(tmp_path):
+    path = tmp_path / "not-a-col"
+    path.write_bytes(b"hello world, definitely not a column file")
+    with pytest.raises(ValueError):
+        ColdFile(str(path))
+
+    archive = ColdArchive(str(tmp_path), fsync=False)
+    (tmp_path / f".{DAY.isoformat()}.tmp").mkdir()
+    assert archive.days() == []
+    assert archive.open(DAY, "VH1") is None
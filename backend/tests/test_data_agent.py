@@ -0,0 +1,92 @@
+import importlib.util
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+MAIN_PATH = os.path.join(os.path.dirname(__file__), "..", "data-agent", "main.py")
+
+
+class StubForwarder:
+    """Collects payloads instead of sending them to a master."""
+
+    def __init__(self, room: int = 1000):
+        self.payloads = []
+        self.room = room
+
+    def offer(self, payload: dict) -> bool:
+        return self.offer_many([payload])
+
+    def reserve(self, count: int) -> bool:
+        if count > self.room:
+            return False
+        self.room -= count
+        return True
+
+    def release(self, count: int):
+        self.room += count
+
+    def offer_many(self, payloads: list[dict], reserved: bool = False) -> bool:
+        if not reserved and not self.reserve(len(payloads)):
+            return False
+        self.payloads.extend(payloads)
+        return True
+
+    def stats(self) -> dict:
+        return {}
+
+    def stop(self, flush_timeout_s: float = 5.0):
+        pass
+
+
+@pytest.fixture(scope="module")
+def data_agent():
+    # Loaded by path: the master's main.py is on sys.path under the same name
+    spec = importlib.util.spec_from_file_location("data_agent_main", MAIN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.FORWARDER.stop(flush_timeout_s=0)
+    yield module
+    module.shutdown()
+
+
+@pytest.fixture
+def client(data_agent, monkeypatch):
+    monkeypatch.setattr(data_agent, "FORWARDER", StubForwarder())
+    return TestClient(data_agent.app)
+
+
+def test_stream_reports_a_frame_that_fails_to_score(client, data_agent):
+    with client.websocket_connect("/ws/telemetry") as ws:
+        ws.send_json({"vehicle_id": "WS1", "sensors": {"engine_rpm": 900}})
+        assert ws.receive_json()["seq"] == 1
+
+        ws.send_json({"vehicle_id": "WS1", "sensors": {"engine_rpm": "fast"}})
+        error = ws.receive_json()
+        assert error["error"] == "scoring_failed" and error["seq"] == 1
+
+        # The stream is still open
+        ws.send_json({"vehicle_id": "WS1", "sensors": {"engine_rpm": 950}})
+        assert ws.receive_json()["seq"] == 2
+    assert len(data_agent.FORWARDER.payloads) == 2
+
+
+def test_batch_turned_away_is_not_counted_on_retry(client, data_agent):
+    readings = {"readings": [{"vehicle_id": "RT1", "sensors": {"engine_rpm": 900}}] * 3}
+    data_agent.FORWARDER.room = 2
+    assert client.post("/analyze_batch", json=readings).status_code == 503
+    assert client.post("/analyze", json=readings["readings"][0]).status_code == 200
+    assert data_agent.FEATURE_STATE.snapshot("RT1")["readings_seen"] == 1
+
+    data_agent.FORWARDER.room = 3
+    response = client.post("/analyze_batch", json=readings)
+    assert response.status_code == 200
+    assert data_agent.FEATURE_STATE.snapshot("RT1")["readings_seen"] == 4
+    assert data_agent.FORWARDER.room == 0
+
+
+def test_outbox_room_is_released_when_scoring_fails(client, data_agent):
+    data_agent.FORWARDER.room = 1
+    with pytest.raises(ValueError):
+        client.post("/analyze_batch", json={"readings": [{"vehicle_id": "RT2", "sensors": {"engine_rpm": "fast"}}]})
+    assert data_agent.FORWARDER.room == 1
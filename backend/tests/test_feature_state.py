@@ -0,0 +1,35 @@
+import numpy as np
+
+from feature_state import RollingFeatureState
+
+
+def update(state, vehicle_ids, now):
+    return state.update_batch(vehicle_ids, np.ones((len(vehicle_ids), 1)), now=now)
+
+
+def test_idle_vehicles_are_evicted():
+    state = RollingFeatureState(["x"], window=4, idle_ttl_s=60)
+    update(state, ["A", "B"], now=1000.0)
+    update(state, ["B"], now=1050.0)
+    update(state, ["C"], now=1070.0)
+    assert state.snapshot("A") is None and len(state) == 2
+    assert state.evicted == 1
+
+    # The freed slot starts clean for the next vehicle
+    out = update(state, ["D"], now=1071.0)
+    assert out["count"].tolist() == [1]
+    assert state._next_slot == 3
+
+
+def test_least_recent_vehicle_makes_room():
+    state = RollingFeatureState(["x"], window=4, max_vehicles=2)
+    update(state, ["A", "B"], now=1.0)
+    update(state, ["A"], now=2.0)
+    update(state, ["C"], now=3.0)
+    assert state.snapshot("B") is None
+    assert state.snapshot("A")["readings_seen"] == 2
+
+    # Vehicles of the batch being applied are never evicted for each other
+    out = update(state, ["D", "E", "F"], now=4.0)
+    assert out["count"].tolist() == [1, 1, 1]
+    assert len(state) == 3 and state.evicted == 3
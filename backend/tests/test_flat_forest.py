@@ -0,0 +1,72 @@
+import os
+
+import joblib
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from flat_forest import FlatForest, ensure_mmap_dir
+from scoring import FEATURE_KEYS
+from scoring_pool import ScoringPool
+
+MODEL_PKL = os.path.join(os.path.dirname(__file__), "..", "models", "isoforest.pkl")
+
+
+def test_matches_sklearn_decision_function():
+    rng = np.random.default_rng(0)
+    train = rng.normal(size=(500, 4)).astype(np.float32)
+    model = IsolationForest(n_estimators=50, max_samples=128, random_state=0).fit(train)
+    X = np.vstack([rng.normal(size=(3000, 4)), rng.normal(scale=6.0, size=(100, 4))]).astype(np.float32)
+
+    np.testing.assert_array_equal(FlatForest.from_model(model).decision_function(X), model.decision_function(X))
+
+
+def test_matches_shipped_model():
+    model = joblib.load(MODEL_PKL)
+    rng = np.random.default_rng(1)
+    X = rng.normal(loc=60.0, scale=40.0, size=(2000, len(FEATURE_KEYS))).astype(np.float32)
+
+    np.testing.assert_array_equal(FlatForest.from_model(model).decision_function(X), model.decision_function(X))
+
+
+def test_save_and_load_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    model = IsolationForest(n_estimators=20, random_state=0).fit(rng.normal(size=(200, 3)))
+    forest = FlatForest.from_model(model)
+    X = rng.normal(size=(100, 3))
+    expected = forest.decision_function(X)
+
+    forest.save(str(tmp_path / "model.npz"))
+    np.testing.assert_array_equal(FlatForest.load(str(tmp_path / "model.npz")).decision_function(X), expected)
+    forest.save_dir(str(tmp_path / "model.mmap"))
+    np.testing.assert_array_equal(FlatForest.load_dir(str(tmp_path / "model.mmap")).decision_function(X), expected)
+
+
+def test_empty_and_single_row_batches():
+    rng = np.random.default_rng(3)
+    model = IsolationForest(n_estimators=10, random_state=0).fit(rng.normal(size=(100, 2)))
+    forest = FlatForest.from_model(model)
+
+    assert forest.decision_function(np.zeros((0, 2))).shape == (0,)
+    np.testing.assert_array_equal(forest.decision_function([0.5, -0.5]), model.decision_function([[0.5, -0.5]]))
+
+
+def test_recompiled_model_gets_a_new_mmap_export(tmp_path):
+    rng = np.random.default_rng(4)
+    npz = str(tmp_path / "isoforest.npz")
+    pool = ScoringPool(workers=1)
+    X = rng.normal(size=(50, 3))
+    exports = []
+    try:
+        for seed in range(4):
+            forest = FlatForest.from_model(IsolationForest(n_estimators=10, random_state=seed).fit(rng.normal(size=(100, 3))))
+            forest.save(npz)
+            os.utime(npz, ns=(seed * 10**9, seed * 10**9))  # distinct mtimes however fast the saves are
+            exports.append(pool.model_dir(npz))
+            np.testing.assert_array_equal(FlatForest.load_dir(exports[-1]).decision_function(X), forest.decision_function(X))
+    finally:
+        pool.shutdown()
+
+    assert len(set(exports)) == 4
+    # Only the newest two exports are kept; the live one is never rewritten
+    assert sorted(os.listdir(tmp_path / "isoforest.mmap")) == sorted(os.path.basename(p) for p in exports[-2:])
+    assert ensure_mmap_dir(npz) == exports[-1]
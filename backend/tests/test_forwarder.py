@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from forwarder import HealthForwarder
+
+
+@pytest.fixture
+def forwarder():
+    batches = []
+    sent = threading.Event()
+    # Nothing listens on the URL; _send is replaced below
+    f = HealthForwarder("http://127.0.0.1:9/store_health_batch", max_batch=4, linger_ms=300, senders=1)
+
+    def send(batch):
+        batches.append(batch)
+        sent.set()
+        return True
+
+    f._send = send
+    yield f, batches, sent
+    f.stop(flush_timeout_s=1)
+
+
+def test_trickle_lingers_into_one_batch(forwarder):
+    f, batches, sent = forwarder
+    for i in range(3):
+        f.offer({"vehicle_id": "V1", "seq": i})
+        time.sleep(0.02)
+    assert sent.wait(2)
+    assert [len(b) for b in batches] == [3]
+
+
+def test_full_batch_goes_out_without_lingering(forwarder):
+    f, batches, sent = forwarder
+    start = time.monotonic()
+    f.offer({"vehicle_id": "V1", "seq": 0})
+    f.offer_many([{"vehicle_id": "V1", "seq": i} for i in range(1, 4)])
+    assert sent.wait(2)
+    assert time.monotonic() - start < 0.2
+    assert [len(b) for b in batches] == [4]
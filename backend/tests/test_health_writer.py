@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+
+import psycopg2.errors
+import pytest
+
+import health_writer
+from health_writer import HealthWriter
+
+
+class MissingTableCursor:
+    def __init__(self, missing: str):
+        self.missing = missing
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.executed.append(sql)
+        if f"FROM {self.missing} " in sql:
+            raise psycopg2.errors.UndefinedTable(f'relation "{self.missing}" does not exist')
+
+
+class FakeConnection:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def cursor(self):
+        return self._cur
+
+
+@pytest.fixture
+def writer():
+    w = HealthWriter()
+    yield w
+    w.stop(flush_timeout_s=1)
+
+
+def fake_db(monkeypatch, cur):
+    @contextmanager
+    def connection():
+        yield FakeConnection(cur)
+
+    monkeypatch.setattr(health_writer.db, "connection", connection)
+
+
+def test_missing_vehicle_latest_fails_the_schema_check(writer, monkeypatch):
+    fake_db(monkeypatch, MissingTableCursor("vehicle_latest"))
+    with pytest.raises(RuntimeError, match="setup_db.py"):
+        writer.check_schema()
+
+
+def test_complete_schema_passes(writer, monkeypatch):
+    cur = MissingTableCursor("nothing")
+    fake_db(monkeypatch, cur)
+    writer.check_schema()
+    assert len(cur.executed) == 2
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+
+from history import lttb
+
+
+def reference_lttb(x: list[float], y: list[float], n: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets as originally published, one point at a
+    time, except that the last bucket always ends at the last interior point
+    (floor((n - 2) * every) can round down and drop it).
+    """
+    every = (len(x) - 2) / (n - 2)
+    keep = [0]
+    a = 0
+    for i in range(n - 2):
+        last = i == n - 3
+        avg_start = len(x) - 1 if last else math.floor((i + 1) * every) + 1
+        avg_end = len(x) if last else min(math.floor((i + 2) * every) + 1, len(x))
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+        best, best_area = None, -1.0
+        for j in range(math.floor(i * every) + 1, avg_start):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(len(x) - 1)
+    return keep
+
+
+def test_matches_reference_implementation():
+    rng = np.random.default_rng(0)
+    for size, n in ((1000, 100), (1001, 37), (50, 49), (10, 3), (7, 5)):
+        x = np.cumsum(rng.uniform(0.5, 1.5, size))
+        y = rng.normal(size=size)
+        assert lttb(x, y, n).tolist() == reference_lttb(x.tolist(), y.tolist(), n)
+
+
+def test_keeps_spikes_and_endpoints():
+    x = np.arange(500, dtype=np.float64)
+    y = np.zeros(500)
+    y[123] = 5.0
+    keep = lttb(x, y, 20).tolist()
+
+    assert keep[0] == 0 and keep[-1] == 499
+    assert 123 in keep
+    assert keep == sorted(set(keep))
+
+
+def test_small_inputs():
+    x = np.arange(5, dtype=np.float64)
+    assert lttb(x, x, 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 2).tolist() == [0, 4]
+    assert lttb(x, x, 1).tolist() == [0]
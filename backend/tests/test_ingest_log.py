@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from ingest_log import IngestLogBusy, SegmentLog, partition_for
+
+
+def records(vehicle: str, start: int, n: int) -> list[dict]:
+    return [{"vehicle_id": vehicle, "seq": i} for i in range(start, start + n)]
+
+
+def drain(consumer) -> list[dict]:
+    out = []
+    while batch := consumer.poll(max_records=100, timeout_s=0):
+        out.extend(batch)
+    return out
+
+
+def active_segment(log: SegmentLog, vehicle: str) -> str:
+    partition = partition_for(vehicle, log.partitions)
+    return log._segment_path(partition, log.segments(partition)[-1])
+
+
+@pytest.mark.parametrize("damage", ["truncated", "corrupted"])
+def test_torn_tail_is_skipped_then_cut_off(tmp_path, damage):
+    log = SegmentLog(str(tmp_path), partitions=2)
+    log.append_many(records("V1", 0, 5))
+    path = active_segment(log, "V1")
+    intact = os.path.getsize(path)
+    log.append_many(records("V1", 5, 1))
+    if damage == "truncated":
+        # A crash part way through writing the last record
+        os.truncate(path, os.path.getsize(path) - 3)
+    else:
+        with open(path, "r+b") as f:
+            f.seek(-2, os.SEEK_END)
+            f.write(b"!!")
+
+    assert [r["seq"] for r in drain(log.consumer(None))] == [0, 1, 2, 3, 4]
+
+    # The next writer (a restarted process) cuts the torn record before appending
+    reopened = SegmentLog(str(tmp_path), partitions=2)
+    reopened.append_many(records("V1", 10, 2))
+    assert os.path.getsize(path) > intact
+    assert [r["seq"] for r in drain(reopened.consumer(None))] == [0, 1, 2, 3, 4, 10, 11]
+
+
+def test_consumer_resumes_from_committed_offsets(tmp_path):
+    log = SegmentLog(str(tmp_path), partitions=4)
+    log.append_many(records("V1", 0, 3) + records("V2", 0, 3))
+
+    consumer = log.consumer("master")
+    first = drain(consumer)
+    consumer.commit()
+    log.append_many(records("V1", 3, 2))
+    assert len(drain(consumer)) == 2  # read but not committed
+    consumer.close()
+
+    consumer = log.consumer("master")
+    assert [r["seq"] for r in drain(consumer)] == [3, 4]
+    consumer.seek_to_beginning()
+    assert len(drain(consumer)) == len(first) + 2
+
+
+def test_order_per_vehicle_across_segments(tmp_path):
+    log = SegmentLog(str(tmp_path), partitions=2, segment_bytes=200)
+    for start in range(0, 60, 6):
+        log.append_many(records("V1", start, 3) + records("V2", start, 3))
+    assert len(log.segments(partition_for("V1", 2))) > 1
+
+    got = drain(log.consumer(None))
+    for vehicle in ("V1", "V2"):
+        seqs = [r["seq"] for r in got if r["vehicle_id"] == vehicle]
+        assert seqs == sorted(seqs) and len(seqs) == 30
+
+
+def test_one_consumer_per_group(tmp_path):
+    log = SegmentLog(str(tmp_path))
+    consumer = log.consumer("master")
+    with pytest.raises(IngestLogBusy):
+        log.consumer("master")
+    consumer.close()
+    log.consumer("master").close()
+
+
+def test_partition_count_is_fixed(tmp_path):
+    SegmentLog(str(tmp_path), partitions=4)
+    with pytest.raises(ValueError):
+        SegmentLog(str(tmp_path), partitions=8)
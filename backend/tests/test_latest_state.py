@@ -0,0 +1,164 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from latest_state import SEVERITY_LEVELS, LatestStateStore, ScoreHistogram, decode_health, severity
+
+
+def record(vid: str, score: float, **fields) -> dict:
+    return {"vehicle_id": vid, "anomaly_score": score, "subsystems": {"brakes": score}, **fields}
+
+
+def test_get_returns_the_last_record():
+    store = LatestStateStore(initial_capacity=2)
+    store.update_many(
+        [
+            record("V1", 0.1, ml_anomaly_score=0.4, ml_label="normal", rule_anomaly_score=0.05),
+            record("V1", 0.2, sensor_snapshot={"engine_rpm": 900}, temporal={"window": 3}),
+        ],
+        now=100.0,
+    )
+
+    assert store.get("V1") == {
+        "vehicle_id": "V1",
+        "anomaly_score": 0.2,
+        "subsystems": {"brakes": 0.2},
+        "sensor_snapshot": {"engine_rpm": 900},
+        "ml_anomaly_score": None,
+        "ml_label": None,
+        "rule_anomaly_score": None,
+        "temporal": {"window": 3},
+        "updated_at": 100.0,
+    }
+    assert store.get("V2") is None
+    assert decode_health(store.health_fragment("V1"))["sensor_snapshot"] == {"engine_rpm": 900}
+
+
+def test_grows_past_initial_capacity_and_adds_subsystems():
+    store = LatestStateStore(initial_capacity=2)
+    store.update_many([record(f"V{i}", i / 100) for i in range(50)])
+    store.update(record("V3", 0.5, subsystems={"tires": 0.7}))
+
+    assert len(store) == 50
+    assert store.stats()["capacity"] >= 50
+    assert store.get("V3")["subsystems"] == {"tires": 0.7}
+    assert store.get("V4")["subsystems"] == {"brakes": 0.04}
+    np.testing.assert_array_equal(store.anomaly_scores(["V10", "missing", "V3"]), [0.1, np.nan, 0.5])
+
+
+def test_versions_change_with_updates_and_touch():
+    store = LatestStateStore()
+    assert store.version_of("V1") == 0
+    store.update(record("V1", 0.1))
+    store.update(record("V1", 0.1))
+    store.touch(["V1", "unknown"])
+    assert store.version_of("V1") == 3
+
+
+def test_without_detail_encodes_on_read():
+    store = LatestStateStore(keep_detail=False)
+    store.update(record("V1", 0.1, sensor_snapshot={"engine_rpm": 900}))
+
+    assert store.get("V1")["sensor_snapshot"] is None
+    assert decode_health(store.health_fragment("V1"))["anomaly_score"] == 0.1
+
+
+def test_pickle_round_trip():
+    store = LatestStateStore()
+    store.update(record("V1", 0.25, ml_label="anomaly"))
+    copy = pickle.loads(pickle.dumps(store))
+
+    assert copy.get("V1") == store.get("V1")
+    copy.update(record("V2", 0.1))
+    assert "V2" in copy and "V2" not in store
+
+
+def nearest_rank(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(int(np.ceil(q * len(ordered))), 1) - 1]
+
+
+def test_histogram_quantiles_follow_removals():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1.5, size=1000).tolist()  # past initial_max, so the bins grow
+    hist = ScoreHistogram()
+    for v in values:
+        hist.add(v)
+    for v in values[:400]:
+        hist.remove(v)
+
+    live = values[400:]
+    qs = (0.01, 0.5, 0.9, 0.99, 1.0)
+    for q, got in zip(qs, hist.quantiles(qs)):
+        assert abs(got - nearest_rank(live, q)) <= hist.resolution / 2 + 1e-9
+    assert hist.total == len(live)
+
+
+def test_histogram_bins_round_trip():
+    hist = ScoreHistogram()
+    for v in (0.0, 0.0, 0.5, 2.0, -0.3):
+        hist.add(v)
+
+    copy = ScoreHistogram.from_bins(hist.bins())
+    assert copy.bins() == hist.bins() == {0: 3, 500: 1, 2000: 1}
+    assert copy.quantiles((0.5, 1.0)) == hist.quantiles((0.5, 1.0))
+    assert ScoreHistogram().quantiles((0.5,)) == [None]
+
+
+def test_fleet_statistics_match_a_recount():
+    rng = np.random.default_rng(1)
+    store = LatestStateStore(initial_capacity=4)
+    latest = {}
+    for _ in range(20):
+        batch = [record(f"V{int(i)}", round(float(s), 3)) for i, s in zip(rng.integers(0, 60, 25), rng.uniform(0, 0.6, 25))]
+        store.update_many(batch)
+        latest.update({r["vehicle_id"]: r["anomaly_score"] for r in batch})
+
+    counts = dict.fromkeys(SEVERITY_LEVELS, 0)
+    for score in latest.values():
+        counts[severity(score)] += 1
+    assert store.severity_counts() == counts
+
+    qs = (0.5, 0.9)
+    quantiles = store.score_quantiles(qs)
+    for q in qs:
+        expected = nearest_rank(latest.values(), q)
+        assert abs(quantiles["anomaly_score"][f"p{q * 100:g}"] - expected) <= 0.0005 + 1e-9
+        assert abs(quantiles["subsystems"]["brakes"][f"p{q * 100:g}"] - expected) <= 0.0005 + 1e-9
+
+
+def test_update_reports_severity_transitions():
+    store = LatestStateStore()
+    assert store.update(record("V1", 0.1)) == [("V1", None, "ok")]
+    assert store.update(record("V1", 0.15)) == []
+    assert store.update(record("V1", 0.5)) == [("V1", "ok", "critical")]
+
+
+def test_histogram_range_is_fixed():
+    hist = ScoreHistogram()
+    size = hist.counts.shape[0]
+    for v in (1e9, 4.0, 3.9995, 0.2):
+        hist.add(v)
+
+    assert hist.counts.shape[0] == size
+    assert hist.quantiles((0.25, 0.5, 1.0)) == [0.2005, 3.9995, 4.0]
+    hist.remove(1e12)
+    assert hist.total == 3 and hist.counts[hist.overflow] == 1
+
+
+def test_non_finite_scores_change_nothing():
+    store = LatestStateStore()
+    store.update(record("V1", 0.5))
+    before = (store.severity_counts(), store.score_histograms(), store.get("V1"))
+
+    for bad in (record("V1", float("nan")), record("V2", 0.1, subsystems={"brakes": float("inf")})):
+        with pytest.raises(ValueError):
+            store.update_many([record("V3", 0.1), bad])
+    assert (store.severity_counts(), store.score_histograms(), store.get("V1")) == before
+    assert "V3" not in store
+
+    # A huge but finite subsystem score lands in the overflow bin
+    store.update(record("V1", 0.5, subsystems={"engine": 1e9}))
+    assert store.score_quantiles((1.0,))["subsystems"]["engine"] == {"p100": 4.0}
+    assert store.severity_counts()["critical"] == 1
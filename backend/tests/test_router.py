@@ -0,0 +1,66 @@
+import asyncio
+import importlib.util
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+ROUTER_PATH = os.path.join(os.path.dirname(__file__), "..", "router", "main.py")
+SHARDS = ["http://shard-0", "http://shard-1"]
+
+
+def shard_events(shard: int) -> bytes:
+    return (
+        b"event: ready\ndata: {}\n\n"
+        + f'event: fleet\ndata: {{"counts": {{"ok": {shard + 1}}}, "fleet_size": {shard + 1}}}\n\n'.encode()
+        + f"event: health\ndata: {{\"shard\": {shard}}}\n\n".encode()
+    )
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setenv("MASTER_SHARDS", ",".join(SHARDS))
+    # Loaded by path: the masters' main.py is on sys.path under the same name
+    spec = importlib.util.spec_from_file_location("router_main", ROUTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_events_merge_shard_streams(router):
+    async def open_shard(shard: int):
+        # An open stream: the frames, then nothing until the merger closes it
+        async def body():
+            yield shard_events(shard)
+            await asyncio.Event().wait()
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda req: httpx.Response(200, content=body())))
+        return await client.send(client.build_request("GET", SHARDS[shard]), stream=True)
+
+    async def first_frames(n: int) -> list[str]:
+        streams = [await open_shard(0), await open_shard(1)]
+        merged = router.merge_event_streams(streams, {})
+        frames = [await anext(merged) for _ in range(n)]
+        await merged.aclose()
+        assert all(resp.is_closed for resp in streams)
+        return frames
+
+    frames = [f.strip() for f in asyncio.run(first_frames(5))]
+    assert sum(f.startswith("event: ready") for f in frames) == 1
+    assert sorted(f for f in frames if f.startswith("event: health")) == [
+        'event: health\ndata: {"shard": 0}',
+        'event: health\ndata: {"shard": 1}',
+    ]
+    # The last fleet event sums both shards
+    fleet = [f for f in frames if f.startswith("event: fleet")]
+    assert fleet[-1] == 'event: fleet\ndata: {"counts":{"ok":3},"fleet_size":3}'
+
+
+def test_events_relay_a_shard_error(router):
+    router.STREAM_CLIENT = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda req: httpx.Response(401, json={"detail": "Invalid token"}))
+    )
+    with TestClient(router.app) as client:
+        resp = client.get("/events")
+    assert resp.status_code == 401 and resp.json() == {"detail": "Invalid token"}
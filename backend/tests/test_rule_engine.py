@@ -0,0 +1,144 @@
+import copy
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+from rule_engine import DEFAULT_RULES_PATH, RuleConfigError, RuleManager, RuleSet, load_rules
+from scoring import DERIVED_FIELDS, derived_inputs
+from test_batch_scoring import random_readings
+
+
+def legacy_compute_anomaly(sensors: dict) -> tuple[float, dict]:
+    """The hand-written scorer rules.json replaced, kept verbatim as the reference."""
+    brake_temp = float(sensors.get("brake_disc_temp_c", sensors.get("brake_temp", 60)))
+    vib = float(sensors.get("vibration_rms_g", sensors.get("vibration", 0.25)))
+    vibration_spike = float(sensors.get("vibration_spike", 0))
+    coolant = float(sensors.get("coolant_temp_c", sensors.get("engine_temp", 90)))
+    oil_temp = float(sensors.get("oil_temp_c", sensors.get("oil_temp", sensors.get("oil_temperature", 90))))
+    battery = float(sensors.get("battery_voltage_v", sensors.get("battery", 13.8)))
+    tire_p = float(sensors.get("tire_pressure_psi", 33))
+    hard_brakes = float(sensors.get("hard_brake_events", 0))
+    dtc_count = int(sensors.get("dtc_count", 0))
+    brake_pressure = float(sensors.get("brake_pressure_bar", sensors.get("brake_pressure", 0)))
+    engine_rpm = float(sensors.get("engine_rpm", 0))
+
+    brake_temp_comp = max(0.0, (brake_temp - 100.0) / 80.0)
+    pressure_comp = max(0.0, (brake_pressure - 60.0) / 60.0)
+    hard_brake_comp = min(1.0, hard_brakes * 0.5)
+    brake_comp = max(brake_temp_comp, pressure_comp, hard_brake_comp)
+
+    vib_comp = max(0.0, (vib - 0.25) / 0.65)
+    spike_comp = min(1.0, vibration_spike * 0.7)
+    vib_comp = max(vib_comp, spike_comp)
+
+    coolant_comp = max(0.0, (coolant - 95.0) / 25.0)
+    oil_comp = max(0.0, (oil_temp - 95.0) / 35.0)
+    rpm_comp = max(0.0, (engine_rpm - 3000.0) / 4000.0)
+    engine_comp = max(coolant_comp, oil_comp, rpm_comp)
+
+    batt_comp = 0.0
+    if battery < 13.3:
+        batt_comp = min(1.0, (13.3 - battery) / 1.5)
+
+    tire_comp = 0.0
+    if tire_p < 28:
+        tire_comp = min(1.0, (28.0 - tire_p) / 8.0)
+    elif tire_p > 40:
+        tire_comp = min(1.0, (tire_p - 40.0) / 8.0)
+
+    event_comp = min(1.0, hard_brakes * 0.25 + dtc_count * 0.30 + vibration_spike * 0.2)
+
+    score = 0.30 * brake_comp + 0.20 * vib_comp + 0.20 * engine_comp + 0.10 * batt_comp + 0.10 * tire_comp + 0.10 * event_comp
+    score = float(max(0.0, min(1.0, round(score, 2))))
+    subsystems = {
+        "brakes": round(brake_comp, 2),
+        "suspension": round(vib_comp, 2),
+        "engine": round(engine_comp, 2),
+        "electrical": round(batt_comp, 2),
+        "tires": round(tire_comp, 2),
+        "events": round(event_comp, 2),
+    }
+    return score, subsystems
+
+
+def default_config() -> dict:
+    with open(DEFAULT_RULES_PATH) as f:
+        return json.load(f)
+
+
+ALIASES = {
+    "brake_disc_temp_c": "brake_temp",
+    "vibration_rms_g": "vibration",
+    "coolant_temp_c": "engine_temp",
+    "oil_temp_c": "oil_temperature",
+    "battery_voltage_v": "battery",
+    "brake_pressure_bar": "brake_pressure",
+}
+
+
+def test_default_rules_match_the_legacy_scorer():
+    rules = load_rules(DEFAULT_RULES_PATH)
+    readings = random_readings(2000, seed=2)
+    # Half the readings use the older sensor names
+    readings[::2] = [{ALIASES.get(k, k): v for k, v in s.items()} for s in readings[::2]]
+
+    for sensors in readings + [{}]:
+        assert rules.score(sensors) == legacy_compute_anomaly(sensors)
+
+
+def test_derived_inputs_agree_between_evaluators():
+    config = default_config()
+    config["inputs"]["coolant_roc"] = {"keys": ["roc.coolant_temp_c"], "default": 0}
+    config["subsystems"][2]["components"].append({"input": "coolant_roc", "above": 0.5, "span": 2.0})
+    rules = RuleSet(config)
+
+    readings = random_readings(200, seed=3)
+    rng = np.random.default_rng(3)
+    derived = rng.uniform(-3, 3, size=(len(readings), len(DERIVED_FIELDS)))
+    derived[::4] = np.nan  # no history yet
+
+    cols = rules.with_derived(rules.columns_from_dicts(readings), derived, DERIVED_FIELDS)
+    scores, subsystems = rules.evaluate_columns(cols)
+    for i, sensors in enumerate(readings):
+        raw, subs = rules.evaluate({**sensors, **derived_inputs(derived[i])})
+        assert raw == scores.tolist()[i]
+        assert list(subs) == [col.tolist()[i] for col in subsystems.values()]
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        lambda c: c.pop("inputs"),
+        lambda c: c["inputs"]["vib"].update(default="high"),
+        lambda c: c["subsystems"][0]["components"].append({"input": "nope", "above": 1, "span": 1}),
+        lambda c: c["subsystems"][0]["components"].append({"input": "vib", "span": 1}),
+        lambda c: c["subsystems"][0]["components"].append({"input": "vib", "above": 1, "span": 0}),
+        lambda c: c["subsystems"].append(copy.deepcopy(c["subsystems"][0])),
+    ],
+)
+def test_invalid_configs_are_rejected(edit):
+    config = default_config()
+    edit(config)
+    with pytest.raises(RuleConfigError):
+        RuleSet(config)
+
+
+def test_bad_edit_keeps_the_active_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(default_config()))
+    manager = RuleManager(str(path))
+    version = manager.load()
+
+    path.write_text("{not json")
+    with pytest.raises(RuleConfigError):
+        manager.load()
+    assert manager.rules.version == version
+
+
+def test_pickles_as_its_config():
+    rules = load_rules(DEFAULT_RULES_PATH)
+    restored = pickle.loads(pickle.dumps(rules))
+    assert restored.scalar_source == rules.scalar_source
+    assert restored.score({"engine_rpm": 6000}) == rules.score({"engine_rpm": 6000})
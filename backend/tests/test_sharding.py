@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pytest
+
+from forwarder import LogForwarder
+from ingest_log import SegmentLog
+from latest_state import LatestStateStore
+from sharding import HashRing, merge_quantiles, shard_suffix
+
+VEHICLES = [f"VH{i:05d}" for i in range(20000)]
+
+
+def test_every_vehicle_has_one_stable_shard():
+    ring = HashRing(4)
+    owners = [ring.shard_for(v) for v in VEHICLES]
+
+    rebuilt = HashRing(4)
+    assert owners == [rebuilt.shard_for(v) for v in VEHICLES]
+    counts = np.bincount(owners, minlength=4)
+    assert counts.min() > 0.8 * len(VEHICLES) / 4 and counts.max() < 1.2 * len(VEHICLES) / 4
+    assert ring.group(VEHICLES[:100]) == {
+        s: [v for v in VEHICLES[:100] if ring.shard_for(v) == s] for s in set(owners[:100])
+    }
+    assert HashRing(1).shard_for("anything") == 0
+    with pytest.raises(ValueError):
+        HashRing(0)
+
+
+def test_adding_a_shard_only_moves_vehicles_to_it():
+    before, after = HashRing(4), HashRing(5)
+    moved = [v for v in VEHICLES if before.shard_for(v) != after.shard_for(v)]
+
+    assert all(after.shard_for(v) == 4 for v in moved)
+    assert 0.1 < len(moved) / len(VEHICLES) < 0.3
+
+
+def test_merged_quantiles_match_one_store():
+    rng = np.random.default_rng(0)
+    ring = HashRing(3)
+    whole = LatestStateStore()
+    shards = [LatestStateStore() for _ in range(3)]
+    for vid in VEHICLES[:3000]:
+        rec = {"vehicle_id": vid, "anomaly_score": round(float(rng.beta(2, 8)), 3), "subsystems": {"brakes": 0.1}}
+        whole.update(rec)
+        shards[ring.shard_for(vid)].update(rec)
+
+    # As the router receives them: JSON, so bin indexes arrive as strings
+    histograms = [json.loads(json.dumps(s.score_histograms())) for s in shards]
+    assert merge_quantiles(histograms) == whole.score_quantiles()
+    assert merge_quantiles([]) == {"anomaly_score": {}, "subsystems": {}}
+
+
+def test_log_forwarder_writes_each_shard_its_own_log(tmp_path):
+    ring = HashRing(3)
+    logs = [SegmentLog(str(tmp_path / f"ingest_log{shard_suffix(3, i)}"), partitions=2) for i in range(3)]
+    forwarder = LogForwarder(logs, ring=ring)
+    assert forwarder.offer_many([{"vehicle_id": v, "anomaly_score": 0.1} for v in VEHICLES[:300]])
+
+    seen = 0
+    for shard, log in enumerate(logs):
+        consumer = log.consumer(None)
+        while batch := consumer.poll(max_records=500, timeout_s=0):
+            assert {ring.shard_for(r["vehicle_id"]) for r in batch} == {shard}
+            seen += len(batch)
+    assert seen == 300
+    assert shard_suffix(1, 0) == ""
@@ -0,0 +1,32 @@
+import pytest
+
+from latest_state import LatestStateStore
+from state_backends import RedisLatestState
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def record(vid: str, score: float, subsystems: dict) -> dict:
+    return {"vehicle_id": vid, "anomaly_score": score, "subsystems": subsystems}
+
+
+def test_redis_histograms_match_the_memory_store():
+    redis_state = RedisLatestState(client=fakeredis.FakeRedis(), prefix="test:")
+    memory = LatestStateStore()
+    batches = [
+        [record("V1", 0.1, {"engine": 0.2}), record("V2", 0.5, {"engine": 1e9})],
+        [record("V1", 0.35, {"engine": 7.5}), record("V3", 0.0, {"engine": -1.0})],
+    ]
+    for batch in batches:
+        assert redis_state.update_many(batch) == memory.update_many(batch)
+
+    assert redis_state.score_histograms() == memory.score_histograms()
+    assert redis_state.score_quantiles() == memory.score_quantiles()
+    assert redis_state.severity_counts() == memory.severity_counts()
+
+
+def test_redis_rejects_non_finite_scores_before_the_script():
+    redis_state = RedisLatestState(client=fakeredis.FakeRedis(), prefix="test:")
+    with pytest.raises(ValueError):
+        redis_state.update_many([record("V1", 0.1, {}), record("V2", float("nan"), {})])
+    assert len(redis_state) == 0
@@ -0,0 +1,55 @@
+import hashlib
+
+import pytest
+
+import token_cache
+from token_cache import TokenCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(token_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_hit_until_ttl(clock):
+    cache = TokenCache(ttl_s=60)
+    cache.put("tok", "data", exp=None)
+
+    clock[0] += 59
+    assert cache.get("tok") == "data"
+    clock[0] += 2
+    assert cache.get("tok") is None
+    assert cache.stats()["size"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_never_outlives_token_exp(clock):
+    cache = TokenCache(ttl_s=300)
+    cache.put("tok", "data", exp=clock[0] + 10)
+
+    clock[0] += 10
+    assert cache.get("tok") is None
+
+
+def test_evicts_least_recently_used(clock):
+    cache = TokenCache(max_entries=2)
+    cache.put("a", 1, exp=None)
+    cache.put("b", 2, exp=None)
+    cache.get("a")
+    cache.put("c", 3, exp=None)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_disabled_and_keyed_by_hash(clock):
+    disabled = TokenCache(max_entries=0)
+    disabled.put("tok", "data", exp=None)
+    assert disabled.get("tok") is None
+
+    cache = TokenCache()
+    cache.put("secret-token", "data", exp=None)
+    assert list(cache._entries) == [hashlib.sha256(b"secret-token").digest()]
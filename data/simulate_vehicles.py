@@ -1,9 +1,14 @@
+import asyncio
+import json
+import sys
 import time
 import random
 import requests
 from typing import Dict
 
 DATA_AGENT_URL = "http://127.0.0.1:8100/analyze"
+# Streaming mode: one long-lived WebSocket per vehicle, acked every N readings
+DATA_AGENT_WS_URL = "ws://127.0.0.1:8100/ws/telemetry?ack_every=10"
 
 # Vehicle list with a usage profile
 VEHICLES = [
@@ -142,7 +147,7 @@ def generate_telemetry(vehicle_id: str, profile: str, tick: int) -> Dict:
         "dtc_count": dtc_count,
     }
 
-    return {"vehicle_id": vehicle_id, "sensors": sensors}
+    return {"vehicle_id": vehicle_id, "sensors": sensors, "timestamp": time.time()}
 
 
 def main():
@@ -160,5 +165,40 @@ def main():
         time.sleep(2)
 
 
+async def print_acks(vid: str, ws):
+    # Acks/errors arrive only every few readings
+    async for msg in ws:
+        print(vid, "→", json.loads(msg))
+
+
+async def stream_vehicle(vid: str, profile: str):
+    # websockets ships with uvicorn[standard]
+    import websockets
+
+    tick = 0
+    while True:
+        try:
+            async with websockets.connect(DATA_AGENT_WS_URL) as ws:
+                reader = asyncio.create_task(print_acks(vid, ws))
+                try:
+                    while True:
+                        await ws.send(json.dumps(generate_telemetry(vid, profile, tick)))
+                        tick += 1
+                        await asyncio.sleep(2)
+                finally:
+                    reader.cancel()
+        except Exception as e:
+            print("Stream error for", vid, ":", e)
+            await asyncio.sleep(2)
+
+
+async def stream_main():
+    print("Starting streaming telemetry simulation...")
+    await asyncio.gather(*(stream_vehicle(vid, profile) for vid, profile in VEHICLES))
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--stream" in sys.argv:
+        asyncio.run(stream_main())
+    else:
+        main()
\ No newline at end of file
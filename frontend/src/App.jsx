@@ -2,6 +2,8 @@ import { useEffect, useState, useCallback } from "react";
 import { LoginPage } from "./LoginPage";
 
 const API_BASE = "http://127.0.0.1:8000";
+// Data arrives over the /events push channel; polling only re-syncs in case an event was missed
+const RESYNC_INTERVAL_MS = 30000;
 
 function App() {
   const [isLoggedIn, setIsLoggedIn] = useState(false);
@@ -23,6 +25,8 @@ function App() {
   const [scheduleLoading, setScheduleLoading] = useState(false);
   const [scheduleError, setScheduleError] = useState("");
   const [upcomingBookings, setUpcomingBookings] = useState([]);
+  // Service center: latest score and status per vehicle, keyed by vehicle_id
+  const [serviceVehicles, setServiceVehicles] = useState({});
   const [mfgSummary, setMfgSummary] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
@@ -80,7 +84,8 @@ function App() {
       // In the fetchFleet function, only fetch bookings for service center
       if (userRole === 'service') {
         endpoints.push(
-          fetch(`${API_BASE}/bookings/upcoming`, { headers })
+          fetch(`${API_BASE}/bookings/upcoming`, { headers }),
+          fetch(`${API_BASE}/vehicles`, { headers })
         );
       } 
       // Car owner only needs their own vehicle data
@@ -109,10 +114,14 @@ function App() {
       
       // Process responses based on role
       if (userRole === 'service') {
-        const [bookingsRes] = responses;
+        const [bookingsRes, vehiclesRes] = responses;
         const bookingsJson = bookingsRes.ok ? await bookingsRes.json() : { bookings: [] };
         
         setUpcomingBookings(bookingsJson.bookings || []);
+        if (vehiclesRes.ok) {
+          const vehiclesJson = await vehiclesRes.json();
+          setServiceVehicles(Object.fromEntries((vehiclesJson.vehicles || []).map((v) => [v.vehicle_id, v])));
+        }
       } 
       else if (userRole === 'user' && ownedVehicleId) {
         const [vehicleRes] = responses;
@@ -221,17 +230,32 @@ function App() {
         }
       }, 100);
       
-      // Set up polling only for service center view
+      // Service center: vehicle scores and statuses are applied from health and severity
+      // events, bookings refresh on a booking event; the slow re-sync only covers missed events
       let interval;
+      let source;
       if (userRole === 'service') {
         interval = setInterval(() => {
           fetchFleet();
-        }, 3000);
+        }, RESYNC_INTERVAL_MS);
+        const updateVehicle = (id, fields) =>
+          setServiceVehicles((prev) => ({ ...prev, [id]: { ...prev[id], vehicle_id: id, ...fields } }));
+        source = new EventSource(`${API_BASE}/events?token=${encodeURIComponent(authToken)}`);
+        source.addEventListener("health", (e) => {
+          const record = JSON.parse(e.data);
+          updateVehicle(record.vehicle_id, { anomaly_score: record.anomaly_score, status: record.status });
+        });
+        source.addEventListener("severity", (e) => {
+          const change = JSON.parse(e.data);
+          updateVehicle(change.vehicle_id, { status: change.to });
+        });
+        source.addEventListener("booking", () => fetchFleet());
       }
       
       return () => {
         clearTimeout(timer);
         if (interval) clearInterval(interval);
+        if (source) source.close();
       };
     }
   }, [isLoggedIn, authToken, fetchFleet, userRole]);
@@ -354,26 +378,21 @@ function App() {
         "Authorization": `Bearer ${authToken}`
       } : {};
 
-      const [healthRes, histRes, contactRes] = await Promise.all([
-        fetch(`${API_BASE}/health/${id}`, { headers }),
-        fetch(`${API_BASE}/history/${id}?limit=20`, { headers }),
-        fetch(`${API_BASE}/contact_decision/${id}`, { headers }),
-      ]);
+      // One request for health, history and contact decision; the browser revalidates it by ETag
+      const dashRes = await fetch(`${API_BASE}/vehicles/${id}/dashboard?history_limit=20`, { headers });
 
-      if (!healthRes.ok || !histRes.ok || !contactRes.ok) {
-        if (healthRes.status === 403 || histRes.status === 403 || contactRes.status === 403) {
+      if (!dashRes.ok) {
+        if (dashRes.status === 403) {
           throw new Error("Unauthorized access - wrong vehicle");
         }
-        throw new Error(`HTTP ${healthRes.status}`);
+        throw new Error(`HTTP ${dashRes.status}`);
       }
 
-      const healthJson = await healthRes.json();
-      const histJson = await histRes.json();
-      const contactJson = await contactRes.json();
+      const dashJson = await dashRes.json();
 
-      setHealth(healthJson);
-      setHistory(histJson.points || []);
-      setContactDecision(contactJson);
+      setHealth(dashJson.health);
+      setHistory(dashJson.history.points || []);
+      setContactDecision(dashJson.contact_decision);
     } catch (e) {
       console.error(e);
       setError(e.message || "Failed to load data from backend");
@@ -390,8 +409,25 @@ function App() {
       fetchData(vehicleId);
       const interval = setInterval(() => {
         fetchData(vehicleId);
-      }, 3000);
-      return () => clearInterval(interval);
+      }, RESYNC_INTERVAL_MS);
+
+      // Health updates are applied from the event itself; a severity change re-fetches the contact decision
+      const source = new EventSource(`${API_BASE}/events?token=${encodeURIComponent(authToken)}`);
+      source.addEventListener("health", (e) => {
+        const record = JSON.parse(e.data);
+        if (record.vehicle_id !== vehicleId) return;
+        setHealth({ vehicle_id: record.vehicle_id, health: e.data });
+        setHistory((prev) => [
+          ...prev,
+          { anomaly_score: record.anomaly_score, subsystems: record.subsystems, timestamp: record.timestamp },
+        ].slice(-20));
+      });
+      source.addEventListener("severity", () => fetchData(vehicleId));
+
+      return () => {
+        clearInterval(interval);
+        source.close();
+      };
     }
   }, [vehicleId, isLoggedIn, authToken, userRole, fetchData]);
 
@@ -455,6 +491,7 @@ function App() {
       ) : userRole === "service" ? (
         <ServiceCenterView 
           upcomingBookings={upcomingBookings} 
+          vehicles={serviceVehicles}
         />
       ) : (
         <ManufacturingView summary={mfgSummary} />
@@ -629,18 +666,53 @@ function UserView(props) {
   );
 }
 
-function ServiceCenterView({ upcomingBookings }) {
+function ServiceCenterView({ upcomingBookings, vehicles }) {
+  // Vehicles in warning or critical state, riskiest first
+  const attention = Object.values(vehicles)
+    .filter((v) => v.status === "warning" || v.status === "critical")
+    .sort((a, b) => (b.anomaly_score ?? 0) - (a.anomaly_score ?? 0))
+    .slice(0, 20);
+
   return (
     <div style={{ color: "#e5e7eb" }}>
       <div style={{ display: "flex", flexDirection: "column", gap: "1rem" }}>
         <div style={{ padding: "1rem", borderRadius: "0.75rem", background: "#1e293b", border: "1px solid #334155" }}>
           <h2 style={{ fontWeight: 600, marginBottom: "0.5rem" }}>Service Center Dashboard</h2>
           <p style={{ fontSize: "0.9rem", color: "#cbd5e1" }}>
-            This view shows upcoming service appointments. Vehicle health data will be available 
-            through the customer agent after a booking is confirmed.
+            This view shows live vehicle risk levels and upcoming service appointments. Sensor data
+            will be available through the customer agent after a booking is confirmed.
           </p>
         </div>
 
+        {/* Vehicles needing attention, updated live */}
+        <div style={{ padding: "1rem", borderRadius: "0.75rem", background: "#020617", border: "1px solid #1f2937" }}>
+          <h2 style={{ fontWeight: 600, marginBottom: "0.5rem" }}>Vehicles Needing Attention</h2>
+          {attention.length === 0 ? (
+            <p style={{ fontSize: "0.9rem", color: "#9ca3af" }}>All {Object.keys(vehicles).length} vehicles are healthy.</p>
+          ) : (
+            <table style={{ width: "100%", borderCollapse: "collapse", fontSize: "0.85rem" }}>
+              <thead>
+                <tr style={{ borderBottom: "1px solid #1f2937" }}>
+                  <th style={{ textAlign: "left", padding: "0.5rem" }}>Vehicle</th>
+                  <th style={{ textAlign: "left", padding: "0.5rem" }}>Anomaly</th>
+                  <th style={{ textAlign: "left", padding: "0.5rem" }}>Status</th>
+                </tr>
+              </thead>
+              <tbody>
+                {attention.map((v) => (
+                  <tr key={v.vehicle_id} style={{ borderBottom: "1px solid #020617" }}>
+                    <td style={{ padding: "0.4rem 0.5rem", fontWeight: 500 }}>{v.vehicle_id}</td>
+                    <td style={{ padding: "0.4rem 0.5rem" }}>{v.anomaly_score != null ? v.anomaly_score.toFixed(2) : "--"}</td>
+                    <td style={{ padding: "0.4rem 0.5rem", textTransform: "capitalize", color: v.status === "critical" ? "#fca5a5" : "#fcd34d" }}>
+                      {v.status}
+                    </td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          )}
+        </div>
+
         {/* Upcoming AURA Bookings */}
         <div style={{ padding: "1rem", borderRadius: "0.75rem", background: "#020617", border: "1px solid #1f2937" }}>
           <h2 style={{ fontWeight: 600, marginBottom: "0.5rem" }}>Upcoming AURA Bookings</h2>